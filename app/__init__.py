@@ -1,11 +1,32 @@
 """i am root."""
 
+from __future__ import annotations
+
 import multiprocessing
 import platform
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+from app import __main__, __metadata__, applets, config, utils
+
+if TYPE_CHECKING:
+    from types import ModuleType
 
-from app import __main__, __metadata__, applets, asgi, config, utils
+    from app import asgi
 
 __all__ = ("applets", "config", "__main__", "__metadata__", "utils", "asgi")
 
 if platform.system() == "Darwin":
     multiprocessing.set_start_method("fork", force=True)
+
+
+def __getattr__(name: str) -> ModuleType:
+    """Import :mod:`app.asgi` on first use only, as importing it builds the app and opens its database.
+
+    Processes that merely import parts of the package, such as the scoring processes of batch
+    searches, are thus kept from initializing the app.
+    """
+    if name == "asgi":
+        return import_module("app.asgi")
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
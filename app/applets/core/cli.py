@@ -0,0 +1,181 @@
+"""CLI commands for the core applet."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import click
+from litestar.plugins import CLIPluginProtocol
+
+if TYPE_CHECKING:
+    from click import Group
+
+__all__ = ("CoreCLIPlugin", "cache_group", "courses_group", "enrichment_group")
+
+
+@click.group(name="courses")
+def courses_group() -> None:
+    """Manage the stored golf courses."""
+
+
+@courses_group.command(name="import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["pbf", "xml", "json"]),
+    help="Format of the extract. Guessed from the file name by default.",
+)
+@click.option(
+    "--bbox",
+    type=(float, float, float, float),
+    metavar="MIN_LAT MIN_LON MAX_LAT MAX_LON",
+    help="Area the extract is complete for. Defaults to the bounds the extract declares.",
+)
+@click.option("--no-tiles", is_flag=True, help="Only fill the courses table, do not seed the course tile cache.")
+def import_courses_command(
+    path: Path,
+    file_format: str | None,
+    bbox: tuple[float, float, float, float] | None,
+    no_tiles: bool,  # noqa: FBT001
+) -> None:
+    """Import golf courses from a local .osm.pbf, .osm/.osm.xml or saved Overpass JSON file.
+
+    Names and cities are resolved from the place nodes of the same file, so an extract (or Overpass
+    query) should include them, e.g. ``nwr[leisure=golf_course]; node[place][name];``.
+    """
+    from litestar.cli._utils import console
+
+    from app.applets.core.utils.osm import OsmFormat, import_courses
+
+    summary = import_courses(path, OsmFormat(file_format) if file_format else None, bbox, seed_tiles=not no_tiles)
+    console.print(
+        f"[bold green]Imported {summary.courses} golf courses[/] "
+        f"({summary.added} new) and seeded {summary.tiles} tiles from {path}"
+    )
+
+
+@courses_group.command(name="compact")
+def compact_courses_command() -> None:
+    """Merge courses stored more than once at the same position and shrink the database file.
+
+    Databases are deduplicated when they are first opened by this version; run this afterwards to
+    give the space of the removed rows back to the file system.
+    """
+    from litestar.cli._utils import console
+
+    from app.applets.core.utils.db import compact_courses
+
+    removed = compact_courses()
+    console.print(f"[bold green]Removed {removed} duplicate courses[/] and compacted the database")
+
+
+@click.group(name="enrichment")
+def enrichment_group() -> None:
+    """Manage the course name and city lookups."""
+
+
+@enrichment_group.command(name="worker")
+@click.option("--concurrency", type=int, help="Number of jobs run at once. Defaults to GEO_ENRICHMENT_CONCURRENCY.")
+def enrichment_worker_command(concurrency: int | None) -> None:
+    """Run queued name and city lookups until interrupted.
+
+    Meant for ``GEO_ENRICHMENT_MODE=external``, where the web workers only queue the lookups.
+    """
+    import asyncio
+    import contextlib
+
+    from litestar.cli._utils import console
+
+    from app.applets.core.utils.jobs import EnrichmentWorker
+    from app.config.settings import get_settings
+
+    settings = get_settings()
+    worker = EnrichmentWorker(concurrency or settings.geo.ENRICHMENT_CONCURRENCY, settings.geo.ENRICHMENT_POLL_INTERVAL)
+    console.print(f"[bold green]Running enrichment jobs with {worker.concurrency} slots[/] (Ctrl+C to stop)")
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(worker.run())
+
+
+@click.group(name="cache")
+def cache_group() -> None:
+    """Manage the caches of upstream lookups."""
+
+
+@cache_group.command(name="warm")
+@click.option(
+    "--bbox",
+    type=(float, float, float, float),
+    metavar="MIN_LAT MIN_LON MAX_LAT MAX_LON",
+    help="Area whose course tiles to warm.",
+)
+@click.option(
+    "--center",
+    "centers",
+    type=(float, float),
+    multiple=True,
+    metavar="LAT LON",
+    help="Warm the search radius around this coordinate. Can be repeated.",
+)
+@click.option("--players", "all_players", is_flag=True, help="Warm the search radius around every stored player.")
+@click.option("--radius", type=int, help="Meters around each center and player. Defaults to the /process radius.")
+@click.option(
+    "--batch-size", type=click.IntRange(min=1), default=16, show_default=True, help="Tiles per Overpass query."
+)
+@click.option("--no-enrichment", is_flag=True, help="Only warm the course tiles, not the names and cities of courses.")
+@click.option("--concurrency", type=int, help="Lookups run at once. Defaults to GEO_ENRICHMENT_CONCURRENCY.")
+def warm_cache_command(  # noqa: PLR0917
+    bbox: tuple[float, float, float, float] | None,
+    centers: tuple[tuple[float, float], ...],
+    all_players: bool,  # noqa: FBT001
+    radius: int | None,
+    batch_size: int,
+    no_enrichment: bool,  # noqa: FBT001
+    concurrency: int | None,
+) -> None:
+    """Fetch the course tiles of an area and resolve the names and cities of its courses ahead of searches.
+
+    Meant to be run off-peak, so that the searches of the day are answered from the caches. Upstream
+    calls keep to the GEO_* rate limits. Anything cached within its TTL is skipped, so an interrupted
+    run resumes when it is started again.
+    """
+    import asyncio
+
+    from litestar.cli._utils import console
+
+    from app.applets.core.utils.geo import SEARCH_RADIUS
+    from app.applets.core.utils.warm import area_tiles, player_coordinates, warm_caches
+
+    if bbox is None and not centers and not all_players:
+        msg = "Give an area to warm with --bbox, --center or --players."
+        raise click.UsageError(msg)
+    if all_players:
+        centers = (*centers, *player_coordinates())
+    tiles = area_tiles(bbox, centers, radius or SEARCH_RADIUS)
+    console.print(f"[bold green]Warming {len(tiles)} tiles[/] (Ctrl+C to stop, run again to resume)")
+    try:
+        summary = asyncio.run(
+            warm_caches(tiles, batch_size=batch_size, enrich=not no_enrichment, concurrency=concurrency)
+        )
+    except KeyboardInterrupt:
+        console.print("[bold yellow]Interrupted[/], run the command again to resume")
+        return
+    console.print(
+        f"[bold green]Fetched {summary.fetched} of {summary.tiles} tiles[/] "
+        f"and resolved {summary.lookups} names and cities of {summary.courses} courses"
+    )
+
+
+class CoreCLIPlugin(CLIPluginProtocol):
+    """Registers the core applet's commands with the ``app`` CLI."""
+
+    def on_cli_init(self, cli: Group) -> None:
+        """Add the command groups.
+
+        Args:
+            cli: The root CLI group.
+        """
+        cli.add_command(cache_group)
+        cli.add_command(courses_group)
+        cli.add_command(enrichment_group)
@@ -1,21 +1,54 @@
 """Core controller."""
 
-from typing import Final
+import contextlib
+from collections.abc import AsyncIterator
+from typing import Annotated, Any, Final
 
-from litestar import Controller, Request, get, post
-from litestar.response import Template
+from litestar import Controller, MediaType, Request, get, post
+from litestar.exceptions import NotFoundException, ServiceUnavailableException, ValidationException
+from litestar.params import Parameter
+from litestar.response import Redirect, Response, Stream, Template
+from litestar.status_codes import HTTP_200_OK, HTTP_303_SEE_OTHER, HTTP_304_NOT_MODIFIED
+from structlog import get_logger
 
-from app.applets.core.schemas import Course, Player
-from app.applets.core.utils.db import get_cached_courses
-from app.applets.core.utils.geo import find_best_courses, find_golf_courses
+from app.applets.core.db import run_in_db
+from app.applets.core.schemas import BatchResult, BatchSearch, Course, Page, Player, StoredCourse
+from app.applets.core.utils import metrics
+from app.applets.core.utils.batch import search_groups
+from app.applets.core.utils.geo import (
+    SEARCH_RADIUS,
+    enrich_courses,
+    find_best_courses,
+    find_golf_courses,
+    iter_enriched_courses,
+)
+from app.applets.core.utils.jobs import EnrichmentJob, EnrichmentMode, enqueue_enrichment, get_jobs
+from app.applets.core.utils.limits import Overloaded, searches
+from app.applets.core.utils.metrics import TimedTemplate, stage
 from app.applets.core.utils.players import (
     calculate_center_coordinates,
     calculate_player_distances,
     extract_players_from_form,
     get_cached_players,
+    list_players,
+)
+from app.applets.core.utils.results import (
+    etag_matches,
+    page_etag,
+    read_results_token,
+    remembered,
+    result_key,
+    results_token,
 )
+from app.applets.core.utils.store import list_courses
+from app.config.settings import get_settings
 
 MINIMUM_PLAYERS: Final[int] = 2
+DEFAULT_PAGE_SIZE: Final[int] = 100
+MAX_PAGE_SIZE: Final[int] = 1000
+
+logger = get_logger(__name__)
+settings = get_settings()
 
 
 class CoreController(Controller):
@@ -30,62 +63,350 @@ class CoreController(Controller):
         Returns:
             A Template response containing the index page.
         """
-        players = get_cached_players()
+        players = await run_in_db(get_cached_players)
         return Template(
             template_name="index.html",
             context={"players": players},
         )
 
-    @post("/process")
-    async def process(self, request: Request) -> Template:
-        """Process the form data and render the results page.
+    @post("/process", status_code=HTTP_303_SEE_OTHER)
+    async def process(self, request: Request, limit: Annotated[int | None, Parameter(ge=1)] = None) -> Response:
+        """Geocode the players of the form and redirect to the page of their results.
 
         Args:
             request: The incoming HTTP request.
+            limit: Number of courses to show. Defaults to ``GEO_RESULTS_LIMIT``.
 
         Returns:
-            A Template response containing the results page.
+            A ``303 See Other`` to the results page, or an error page if no address could be geocoded.
         """
-        form_data = await request.form()
-        players = extract_players_from_form(form_data)
-
-        if not players:
-            return Template(
+        metrics.track_stages()
+        with stage("form"):
+            form_data = await request.form()
+        async with _search_slot(request):
+            with stage("geocode"):
+                players = await extract_players_from_form(form_data)
+        located = [player for player in players if player.coord is not None]
+        if not located:
+            return TimedTemplate(
                 template_name="error.html",
                 context={"message": "Unable to geocode any of the provided addresses."},
+                status_code=HTTP_200_OK,
             )
+        metrics.log_stages()
+        return Redirect(
+            request.app.route_reverse("results", token=results_token(located, limit)),
+            status_code=HTTP_303_SEE_OTHER,
+        )
+
+    @get("/results/{token:str}", name="results")
+    async def results(self, request: Request, token: str) -> Response:
+        """Render the results page of a search.
+
+        Results are remembered by player set, so a group searching again skips ranking the courses. The
+        page carries an ETag: a client sending it back in ``If-None-Match`` gets a ``304 Not Modified``
+        while the result is unchanged.
 
+        Args:
+            request: The incoming HTTP request.
+            token: Identifies the players and the number of courses shown, see ``/process``.
+
+        Returns:
+            A Template response containing the results page.
+
+        Raises:
+            NotFoundException: If the token is malformed.
+        """
+        try:
+            players, limit = read_results_token(token)
+        except ValueError as exc:
+            raise NotFoundException(detail=str(exc)) from exc
+        metrics.track_stages()
         user_coords = [player.coord for player in players if player.coord is not None]
         player_names = [player.name for player in players]
-
         center_coord = calculate_center_coordinates(user_coords)
-        courses = find_golf_courses(center_coord)
-        best_courses = find_best_courses(courses, user_coords, player_names)
-        player_distances = calculate_player_distances(user_coords, player_names)
+        results_limit = _results_limit(limit)
 
-        return Template(
+        async def search() -> tuple[list[Course], list[int]]:
+            with stage("courses"):
+                courses = await find_golf_courses(center_coord)
+            with stage("scoring"):
+                best_courses = find_best_courses(courses, user_coords, player_names, results_limit)
+            enrichment_jobs = []
+            with stage("enrichment"):
+                if settings.geo.ENRICHMENT_MODE == EnrichmentMode.INLINE:
+                    await enrich_courses(best_courses)
+                else:
+                    enrichment_jobs = await enqueue_enrichment(best_courses)
+            return best_courses, enrichment_jobs
+
+        async with _search_slot(request):
+            result = await remembered(
+                result_key(players, SEARCH_RADIUS, results_limit), center_coord, SEARCH_RADIUS, search
+            )
+        # Clients revalidate the page on every visit, as it changes along with the stored courses.
+        headers = {"ETag": page_etag(result, players), "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+            metrics.log_stages()
+            return Response(None, status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+        with stage("distances"):
+            player_distances = calculate_player_distances(user_coords, player_names)
+
+        return TimedTemplate(
             template_name="results.html",
             context={
                 "players": players,
-                "best_courses": best_courses,
+                "best_courses": result.courses,
                 "player_distances": player_distances,
+                "enrichment_jobs": result.enrichment_jobs,
             },
+            headers=headers,
+        )
+
+    @post("/process/stream", status_code=200)
+    async def process_stream(self, request: Request, limit: Annotated[int | None, Parameter(ge=1)] = None) -> Stream:
+        """Process the form data and stream the results page as each part of it is ready.
+
+        The page shell is sent right away, followed by the player distances once the addresses are
+        geocoded and the course table once the courses are ranked. In ``inline`` enrichment mode the
+        looked up names and cities are pushed as they resolve; otherwise the page polls for them.
+
+        Args:
+            request: The incoming HTTP request.
+            limit: Number of courses to show. Defaults to ``GEO_RESULTS_LIMIT``.
+
+        Returns:
+            A chunked HTML response containing the results page.
+        """
+        with stage("form"):
+            form_data = await request.form()
+        return Stream(
+            _stream_results(request, form_data, _results_limit(limit)),
+            media_type=MediaType.HTML,
+            # Keep reverse proxies from buffering the chunks.
+            headers={"X-Accel-Buffering": "no"},
         )
 
+    @post("/process/batch", status_code=200)
+    async def process_batch(
+        self, request: Request, data: BatchSearch, limit: Annotated[int | None, Parameter(ge=1)] = None
+    ) -> BatchResult:
+        """Find the best courses for many groups of players at once.
+
+        The groups share their geocoding and course lookups, and are scored in parallel.
+
+        Args:
+            request: The incoming HTTP request.
+            data: The groups of players.
+            limit: Number of courses to return per group. Defaults to ``GEO_RESULTS_LIMIT``.
+
+        Returns:
+            A JSON response containing the results of every group, in order.
+
+        Raises:
+            ValidationException: If there are more than ``GEO_BATCH_MAX_GROUPS`` groups.
+        """
+        if len(data.groups) > settings.geo.BATCH_MAX_GROUPS:
+            msg = f"at most {settings.geo.BATCH_MAX_GROUPS} groups can be searched at once"
+            raise ValidationException(msg)
+        metrics.track_stages()
+        async with _search_slot(request):
+            groups = await search_groups(data.groups, _results_limit(limit))
+        metrics.log_stages()
+        return BatchResult(groups=groups)
+
+    @get("/enrichment")
+    async def enrichment_status(self, ids: Annotated[list[int], Parameter(min_items=1)]) -> list[EnrichmentJob]:
+        """Get the state of queued name and city lookups.
+
+        Args:
+            ids: The ids of the jobs, as listed on the results page.
+
+        Returns:
+            The jobs, with their results once they are done.
+        """
+        return await run_in_db(get_jobs, ids)
+
     @get("/players")
-    async def list_players(self) -> list[Player]:
-        """List all players from the database.
+    async def list_players(
+        self,
+        *,
+        cursor: Annotated[int, Parameter(ge=0, description="The next_cursor of the previous page.")] = 0,
+        limit: Annotated[int, Parameter(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+        name: Annotated[str | None, Parameter(description="Only players whose name contains this.")] = None,
+    ) -> Page[Player]:
+        """List the stored players, one page at a time.
+
+        Args:
+            cursor: The ``next_cursor`` of the previous page.
+            limit: Maximum number of players on the page.
+            name: Only list players whose name contains this text.
 
         Returns:
-            A Template response containing the list of players.
+            A JSON response containing a page of players.
         """
-        return get_cached_players()
+        return await run_in_db(list_players, cursor, limit, name=name)
 
     @get("/courses")
-    async def list_courses(self) -> list[Course]:
-        """List all cached courses.
+    async def list_courses(
+        self,
+        *,
+        cursor: Annotated[int, Parameter(ge=0, description="The next_cursor of the previous page.")] = 0,
+        limit: Annotated[int, Parameter(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+        name: Annotated[str | None, Parameter(description="Only courses whose name contains this.")] = None,
+        bbox: Annotated[
+            list[float] | None,
+            Parameter(min_items=4, max_items=4, description="min_lat, min_lon, max_lat and max_lon, in order."),
+        ] = None,
+        lat: Annotated[float | None, Parameter(ge=-90, le=90)] = None,
+        lon: Annotated[float | None, Parameter(ge=-180, le=180)] = None,
+        radius: Annotated[float | None, Parameter(gt=0, description="Meters around lat and lon.")] = None,
+    ) -> Page[StoredCourse]:
+        """List the stored courses, one page at a time.
+
+        Args:
+            cursor: The ``next_cursor`` of the previous page.
+            limit: Maximum number of courses on the page.
+            name: Only list courses whose name contains this text.
+            bbox: Only list courses inside this box, given as repeated ``bbox`` parameters.
+            lat: Latitude of the center of the ``radius`` filter.
+            lon: Longitude of the center of the ``radius`` filter.
+            radius: Only list courses within this many meters of ``lat`` and ``lon``.
+
+        Returns:
+            A JSON response containing a page of courses.
+
+        Raises:
+            ValidationException: If only some of ``lat``, ``lon`` and ``radius`` are given.
+        """
+        near = (lat, lon, radius)
+        if any(value is not None for value in near) and any(value is None for value in near):
+            msg = "lat, lon and radius must be given together"
+            raise ValidationException(msg)
+        return await run_in_db(
+            list_courses,
+            cursor,
+            limit,
+            name=name,
+            bbox=tuple(bbox) if bbox else None,
+            center_coord=(lat, lon) if lat is not None and lon is not None else None,
+            radius=radius,
+        )
+
+
+class MetricsController(Controller):
+    """Exposes the metrics of the worker serving the scrape."""
+
+    path = "/metrics"
+
+    @get(media_type=metrics.CONTENT_TYPE, include_in_schema=False, sync_to_thread=False)
+    def get_metrics(self) -> Response[str]:
+        """Get the search stage timings and the cache and upstream counters.
 
         Returns:
-            A JSON response containing the list of courses.
+            The metrics, in the Prometheus text format.
         """
-        return get_cached_courses()
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _client_of(request: Request) -> str:
+    """Identify the client of a request, for fair admission of its searches."""
+    if settings.geo.SEARCH_CLIENT_HEADER and (forwarded := request.headers.get(settings.geo.SEARCH_CLIENT_HEADER)):
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def _acquire_search_slot(request: Request) -> None:
+    """Wait for a search slot, see ``GEO_SEARCH_CONCURRENCY``.
+
+    Raises:
+        ServiceUnavailableException: If the worker is too busy to take the search.
+    """
+    try:
+        await searches.acquire(_client_of(request))
+    except Overloaded as exc:
+        logger.warning("shedding search: %s", exc.reason)
+        raise ServiceUnavailableException(
+            detail="Too many searches are running, please try again shortly.",
+            headers={"Retry-After": str(settings.geo.SEARCH_RETRY_AFTER)},
+        ) from exc
+
+
+@contextlib.asynccontextmanager
+async def _search_slot(request: Request) -> AsyncIterator[None]:
+    """Hold a search slot for the duration of the block."""
+    await _acquire_search_slot(request)
+    try:
+        yield
+    finally:
+        searches.release()
+
+
+def _results_limit(limit: int | None) -> int | None:
+    """Get the number of courses a search shows, ``None`` for all of them."""
+    return limit or settings.geo.RESULTS_LIMIT or None
+
+
+async def _stream_results(request: Request, form_data: dict[str, str], limit: int | None) -> AsyncIterator[str]:
+    """Render the parts of the results page as the search progresses.
+
+    The search slot is held by the stream itself, so that it is released however the stream ends,
+    including when the response is dropped before it is iterated.
+
+    Args:
+        request: The incoming HTTP request.
+        form_data: The submitted player form.
+        limit: Number of courses to show, ``None`` for all of them.
+
+    Yields:
+        Chunks of the results page.
+    """
+    context: dict[str, Any] = {
+        "streaming": True,
+        "players": [],
+        "best_courses": [],
+        "player_distances": [],
+        "enrichment_jobs": [],
+    }
+
+    def render(template_name: str, **values: Any) -> str:
+        context.update(values)
+        return request.app.template_engine.get_template(template_name).render(**context)
+
+    yield render("_results_head.html")
+    try:
+        async with _search_slot(request):
+            with stage("geocode"):
+                players = await extract_players_from_form(form_data)
+            located = [player for player in players if player.coord is not None]
+            if not located:
+                yield render("_search_error.html", message="Unable to geocode any of the provided addresses.")
+                yield render("_results_tail.html")
+                return
+
+            user_coords = [player.coord for player in located]
+            player_names = [player.name for player in located]
+            with stage("distances"):
+                player_distances = calculate_player_distances(user_coords, player_names)
+            yield render("_player_distances.html", players=located, player_distances=player_distances)
+
+            center_coord = calculate_center_coordinates(user_coords)
+            with stage("courses"):
+                courses = await find_golf_courses(center_coord)
+            with stage("scoring"):
+                best_courses = find_best_courses(courses, user_coords, player_names, limit)
+            if settings.geo.ENRICHMENT_MODE == EnrichmentMode.INLINE:
+                yield render("_courses_table.html", best_courses=best_courses)
+                async for course in iter_enriched_courses(best_courses):
+                    yield render("_course_update.html", course=course)
+            else:
+                with stage("enrichment"):
+                    enrichment_jobs = await enqueue_enrichment(best_courses)
+                yield render("_courses_table.html", best_courses=best_courses, enrichment_jobs=enrichment_jobs)
+    except ServiceUnavailableException as exc:
+        yield render("_search_error.html", message=exc.detail)
+    except Exception:
+        # The status line is already sent, so the failure is reported in the page instead.
+        logger.exception("streamed search failed")
+        yield render("_search_error.html", message="Something went wrong while searching for golf courses.")
+    yield render("_results_tail.html")
@@ -1,7 +1,16 @@
 """db."""
 
+import asyncio
+import os
+import queue
 import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterator
 from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 from typing import Final
 
@@ -14,19 +23,212 @@ BASE_DIR: Final[Path] = module_to_os_path(DEFAULT_MODULE_NAME)
 DATABASE_FILE = f"{BASE_DIR}/gobuddy.db"
 
 
+class ConnectionPool:
+    """A pool of long-lived SQLite connections shared by the threads of one worker process.
+
+    Connections are opened lazily, up to ``size``, and configured once with WAL journaling and the
+    tuned pragmas from :class:`~app.config.settings.DatabaseSettings`. Keeping them open lets SQLite's
+    per-connection statement cache serve as a prepared statement cache.
+    """
+
+    def __init__(self, database: str, size: int) -> None:
+        """Create a pool.
+
+        Args:
+            database: Path to the SQLite database file.
+            size: Maximum number of open connections.
+        """
+        self.database = database
+        self.size = size
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a new connection."""
+        from app.config.settings import get_settings
+
+        settings = get_settings()
+        conn = sqlite3.connect(
+            self.database,
+            timeout=settings.db.BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=settings.db.STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {settings.db.SYNCHRONOUS}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA cache_size = {-settings.db.CACHE_SIZE_KIB:d}")
+        conn.execute(f"PRAGMA mmap_size = {settings.db.MMAP_SIZE:d}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take a connection from the pool, opening one if the pool is not full yet.
+
+        Returns:
+            A connection, blocking until one is released if all of them are in use.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                return self._connect()
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool, rolling back anything left uncommitted.
+
+        Args:
+            conn: A connection obtained from :meth:`acquire`.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+_transaction: ContextVar[tuple[sqlite3.Connection, threading.RLock] | None] = ContextVar("transaction", default=None)
+
+
+def get_pool() -> ConnectionPool:
+    """Get this worker's connection pool, creating it on first use.
+
+    Returns:
+        The connection pool.
+    """
+    from app.config.settings import get_settings
+
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        if _pool is None or _pool.database != DATABASE_FILE:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DATABASE_FILE, get_settings().db.POOL_SIZE)
+        return _pool
+
+
+def _reset_pool_after_fork() -> None:
+    """Forget the parent's connections in a forked worker; SQLite handles must not cross a fork."""
+    global _pool, _pool_lock  # noqa: PLW0603
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
 @contextmanager
-def get_db_connection() -> sqlite3.Connection:
+def get_db_connection() -> Iterator[sqlite3.Connection]:
     """Get a database connection.
 
+    Inside :func:`transaction` this is the transaction's connection, and committing is left to it.
+    Otherwise a pooled connection is borrowed and the work is committed when the block exits.
+
     Yields:
         A database connection.
     """
-    conn = sqlite3.connect(DATABASE_FILE)
+    if bound := _transaction.get():
+        conn, lock = bound
+        with lock:
+            yield conn
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Group every :func:`get_db_connection` block in the current context into one transaction.
+
+    Use it around batches of writes that happen together, so they cost a single commit, and do not
+    hold it open across network calls: other workers cannot write until it is committed.
+
+    Yields:
+        The transaction's connection.
+    """
+    if _transaction.get():
+        with get_db_connection() as conn:
+            yield conn
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    token = _transaction.set((conn, threading.RLock()))
     try:
         yield conn
         conn.commit()
     finally:
-        conn.close()
+        _transaction.reset(token)
+        pool.release(conn)
+
+
+def fetch_one(sql: str, parameters: tuple = ()) -> tuple | None:
+    """Run a query and return its first row.
+
+    Args:
+        sql: The SQL query.
+        parameters: The query parameters.
+
+    Returns:
+        The first row, or None if the query returned nothing.
+    """
+    with get_db_connection() as conn:
+        return conn.execute(sql, parameters).fetchone()
+
+
+def contains_pattern(text: str) -> str:
+    """Build a ``LIKE`` pattern matching values that contain a text, escaped with backslashes.
+
+    Args:
+        text: The text to look for; ``%`` and ``_`` in it match literally.
+
+    Returns:
+        The pattern.
+    """
+    return "%{}%".format(text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+
+
+def execute(sql: str, parameters: tuple = ()) -> None:
+    """Run a single statement and commit it.
+
+    Args:
+        sql: The SQL statement.
+        parameters: The statement parameters.
+    """
+    with get_db_connection() as conn:
+        conn.execute(sql, parameters)
+
+
+async def run_in_db[**P, T](func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    """Run blocking database work in a worker thread so the event loop stays free.
+
+    Args:
+        func: The callable doing the database work.
+        *args: Positional arguments for ``func``.
+        **kwargs: Keyword arguments for ``func``.
+
+    Returns:
+        The return value of ``func``.
+    """
+    return await asyncio.to_thread(func, *args, **kwargs)
 
 
 def initialize_database(app_config: AppConfig) -> AppConfig:
@@ -46,25 +248,32 @@ def initialize_database(app_config: AppConfig) -> AppConfig:
             CREATE TABLE IF NOT EXISTS geocode_cache (
                 address TEXT PRIMARY KEY,
                 latitude REAL,
-                longitude REAL
+                longitude REAL,
+                cached_at REAL NOT NULL DEFAULT 0
             )
         """)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS reverse_geocode_cache (
                 lat_lon TEXT PRIMARY KEY,
-                city TEXT
+                city TEXT,
+                cached_at REAL NOT NULL DEFAULT 0
             )
         """)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS golf_courses_cache (
-                cache_key TEXT PRIMARY KEY,
-                courses BLOB
+            CREATE TABLE IF NOT EXISTS course_tiles (
+                tile TEXT PRIMARY KEY,
+                fetched_at REAL NOT NULL,
+                courses BLOB NOT NULL
             )
         """)
+        # Superseded by the per-tile coverage in ``course_tiles``.
+        cursor.execute("DROP TABLE IF EXISTS golf_courses_cache")
+        cursor.execute("DROP TABLE IF EXISTS course_coverage")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS nearby_features_cache (
                 lat_lon TEXT PRIMARY KEY,
-                name TEXT
+                name TEXT,
+                cached_at REAL NOT NULL DEFAULT 0
             )
         """)
         cursor.execute("""
@@ -86,4 +295,209 @@ def initialize_database(app_config: AppConfig) -> AppConfig:
                         access TEXT
                     )
                 """)
+        initialize_enrichment_jobs(cursor)
+        initialize_change_log(cursor)
+    migrate_database()
     return app_config
+
+
+def initialize_enrichment_jobs(cursor: sqlite3.Cursor) -> None:
+    """Create the ``enrichment_jobs`` queue of name and city lookups.
+
+    Args:
+        cursor: A cursor on an open connection.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS enrichment_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            lat_lon TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            priority INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            UNIQUE (kind, lat_lon)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS enrichment_jobs_queue ON enrichment_jobs (status, priority, id)")
+
+
+def initialize_change_log(cursor: sqlite3.Cursor) -> None:
+    """Create the ``course_changes`` log, which records the id of every inserted, updated or deleted course.
+
+    Its ``revision`` increases with every change, so that the course stores of all worker processes
+    can catch up on each other's writes.
+
+    Args:
+        cursor: A cursor on an open connection.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS course_changes (
+            revision INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER NOT NULL
+        )
+    """)
+    for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS course_changes_{event.lower()} AFTER {event} ON courses BEGIN
+                INSERT INTO course_changes (id) VALUES ({row}.id);
+            END
+        """)  # noqa: S608
+
+
+def current_revision(conn: sqlite3.Connection) -> int:
+    """Get the revision of the last change to ``courses``, ``0`` if there was none.
+
+    Args:
+        conn: An open connection.
+
+    Returns:
+        The revision.
+    """
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'course_changes'").fetchone()
+    return row[0] if row else 0
+
+
+PICKLE_PROTOCOL_PREFIX: Final[bytes] = b"\x80"
+"""First byte of a pickle (protocol 2+), which no versioned blob format starts with."""
+
+
+def migrate_course_tiles_to_msgpack(cursor: sqlite3.Cursor) -> None:
+    """Re-encode pickled ``course_tiles`` blobs in the versioned msgpack format.
+
+    Rows that cannot be decoded safely are dropped; they are refetched on the next search.
+
+    Args:
+        cursor: A cursor inside the migration transaction.
+    """
+    from app.applets.core.utils.tiles import decode_pickled_courses, encode_courses
+
+    updates, stale = [], []
+    for tile, blob in cursor.execute("SELECT tile, courses FROM course_tiles").fetchall():
+        if not blob.startswith(PICKLE_PROTOCOL_PREFIX):
+            continue
+        try:
+            updates.append((encode_courses(decode_pickled_courses(blob)), tile))
+        except Exception:  # noqa: BLE001
+            stale.append((tile,))
+    cursor.executemany("UPDATE course_tiles SET courses = ? WHERE tile = ?", updates)
+    cursor.executemany("DELETE FROM course_tiles WHERE tile = ?", stale)
+
+
+def merge_duplicate_courses(cursor: sqlite3.Cursor) -> int:
+    """Merge the rows of courses stored more than once at the same position into the oldest one.
+
+    The merged row takes the newest resolved name and city and the newest known access of its group.
+
+    Args:
+        cursor: A cursor inside a transaction.
+
+    Returns:
+        The number of rows removed.
+    """
+    from app.applets.core.schemas import UNKNOWN_CITY, UNNAMED_COURSE
+
+    rows = cursor.execute("""
+        SELECT id, latitude, longitude, name, city, access FROM courses
+        WHERE (latitude, longitude) IN (
+            SELECT latitude, longitude FROM courses GROUP BY latitude, longitude HAVING count(*) > 1
+        )
+        ORDER BY latitude, longitude, id
+    """).fetchall()
+    updates, removed = [], []
+    for _, group in groupby(rows, key=itemgetter(1, 2)):
+        keep, *duplicates = group
+        name, city, access = keep[3:]
+        for _, _, _, other_name, other_city, other_access in duplicates:
+            name = other_name if other_name != UNNAMED_COURSE else name
+            city = other_city if other_city not in {None, UNKNOWN_CITY} else city
+            access = other_access if other_access is not None else access
+        updates.append((name, city, access, keep[0]))
+        removed.extend((row[0],) for row in duplicates)
+    cursor.executemany("UPDATE courses SET name = ?, city = ?, access = ? WHERE id = ?", updates)
+    cursor.executemany("DELETE FROM courses WHERE id = ?", removed)
+    return len(removed)
+
+
+def add_course_position_key(cursor: sqlite3.Cursor) -> None:
+    """Merge duplicate courses and keep a single row per position from now on.
+
+    Args:
+        cursor: A cursor inside the migration transaction.
+    """
+    merge_duplicate_courses(cursor)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS courses_position ON courses (latitude, longitude)")
+
+
+def add_cache_timestamps(cursor: sqlite3.Cursor) -> None:
+    """Give the lookup caches a ``cached_at`` column, stamping the existing entries with the current time.
+
+    Args:
+        cursor: A cursor inside the migration transaction.
+    """
+    now = time.time()
+    for table in ("geocode_cache", "reverse_geocode_cache", "nearby_features_cache"):
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        if "cached_at" not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN cached_at REAL NOT NULL DEFAULT 0")
+        cursor.execute(f"UPDATE {table} SET cached_at = ? WHERE cached_at = 0", (now,))  # noqa: S608
+
+
+def drop_spatial_index(cursor: sqlite3.Cursor) -> None:
+    """Drop the R*Tree index over ``courses`` and its triggers, searches being answered by the course store.
+
+    Args:
+        cursor: A cursor inside the migration transaction.
+    """
+    for trigger in ("courses_rtree_insert", "courses_rtree_update", "courses_rtree_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS courses_rtree")
+
+
+def store_job_coordinates_as_reals(cursor: sqlite3.Cursor) -> None:
+    """Rebuild ``enrichment_jobs`` with ``REAL`` coordinates, as stored everywhere else, instead of ``TEXT``.
+
+    Args:
+        cursor: A cursor inside the migration transaction.
+    """
+    columns = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(enrichment_jobs)")}
+    if columns.get("latitude") == "REAL":
+        return
+    cursor.execute("DROP INDEX IF EXISTS enrichment_jobs_queue")
+    cursor.execute("ALTER TABLE enrichment_jobs RENAME TO enrichment_jobs_text")
+    initialize_enrichment_jobs(cursor)
+    cursor.execute("""
+        INSERT INTO enrichment_jobs (id, kind, lat_lon, latitude, longitude, priority, status, attempts, updated_at)
+        SELECT id, kind, lat_lon, CAST(latitude AS REAL), CAST(longitude AS REAL), priority, status, attempts,
+            updated_at
+        FROM enrichment_jobs_text
+    """)
+    cursor.execute("DROP TABLE enrichment_jobs_text")
+
+
+MIGRATIONS: Final[list[Callable[[sqlite3.Cursor], None]]] = [
+    migrate_course_tiles_to_msgpack,
+    add_course_position_key,
+    add_cache_timestamps,
+    drop_spatial_index,
+    store_job_coordinates_as_reals,
+]
+"""Data migrations, in order; the database's ``user_version`` is the number already applied."""
+
+
+def migrate_database() -> None:
+    """Apply the :data:`MIGRATIONS` the database has not seen yet, in one transaction.
+
+    The write lock is taken up front, so concurrently starting workers apply each migration once.
+    """
+    with get_db_connection() as conn:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number:d}")
@@ -1,17 +1,25 @@
 """Structures for the core applets."""
 
-from decimal import Decimal
-from typing import Any
+from typing import Annotated, Any, Final
 
 import msgspec
 
+UNKNOWN_CITY: Final = "Unknown City"
+"""City of a course whose city could not be resolved (yet)."""
+UNNAMED_COURSE: Final = "Golf_course"
+"""Name of a course without a name tag whose name could not be resolved from nearby features (yet)."""
 
-class Course(msgspec.Struct):
+
+type Coordinate = tuple[float, float]
+"""A ``(lat, lon)`` pair in degrees."""
+
+
+class Course(msgspec.Struct, gc=False):
     """Represents a golf course."""
 
     name: str
-    lat: Decimal
-    lon: Decimal
+    lat: float
+    lon: float
     distances: dict[str, Any] = msgspec.field(default_factory=dict)
     total_distance: float = 0.0
     city: str | None = None
@@ -19,10 +27,68 @@ class Course(msgspec.Struct):
     id: int | None = None
 
 
-class Player(msgspec.Struct):
+class Player(msgspec.Struct, gc=False):
     """Represents a player."""
 
     name: str
     address: str
     id: int | None = None
-    coord: tuple[Decimal, Decimal] | None = None
+    coord: Coordinate | None = None
+
+
+class StoredCourse(msgspec.Struct, gc=False):
+    """Represents a golf course as stored in the ``courses`` table."""
+
+    id: int
+    name: str
+    lat: float
+    lon: float
+    city: str | None = None
+    access: str | None = None
+
+
+class Page[T](msgspec.Struct):
+    """Represents one page of a listing, ordered by id."""
+
+    items: list[T]
+    next_cursor: int | None = None
+    """Pass as ``cursor`` to get the next page; ``None`` on the last page."""
+
+
+class PlayerEntry(msgspec.Struct):
+    """Represents a player as submitted in a batch search."""
+
+    name: Annotated[str, msgspec.Meta(min_length=1)]
+    address: Annotated[str, msgspec.Meta(min_length=1)]
+    id: int | None = None
+    """The id of a stored player, who is used as stored; the name and address only serve if no player has it."""
+
+
+class PlayerGroup(msgspec.Struct):
+    """Represents a group of players looking for a course together."""
+
+    players: Annotated[list[PlayerEntry], msgspec.Meta(min_length=1)]
+
+
+class BatchSearch(msgspec.Struct):
+    """Represents the groups of a batch search."""
+
+    groups: Annotated[list[PlayerGroup], msgspec.Meta(min_length=1)]
+
+
+class GroupResult(msgspec.Struct):
+    """Represents the results of one group of a batch search."""
+
+    players: list[Player]
+    courses: list[Course] = msgspec.field(default_factory=list)
+    player_distances: list[dict[str, Any]] = msgspec.field(default_factory=list)
+    enrichment_jobs: list[int] = msgspec.field(default_factory=list)
+    """Ids of the queued name and city lookups of the courses, to poll at ``/enrichment``."""
+    error: str | None = None
+    """Why the group has no results, if it has none."""
+
+
+class BatchResult(msgspec.Struct):
+    """Represents the results of a batch search, in the order of its groups."""
+
+    groups: list[GroupResult]
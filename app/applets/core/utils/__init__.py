@@ -1,5 +1,37 @@
 """Utilities for the core applets."""
 
-from app.applets.core.utils import db, geo, players
+from app.applets.core.utils import (
+    batch,
+    cache,
+    db,
+    distance,
+    geo,
+    jobs,
+    limits,
+    metrics,
+    osm,
+    players,
+    results,
+    singleflight,
+    store,
+    tiles,
+    warm,
+)
 
-__all__ = ("geo", "players", "db")
+__all__ = (
+    "batch",
+    "cache",
+    "geo",
+    "distance",
+    "jobs",
+    "limits",
+    "metrics",
+    "osm",
+    "players",
+    "results",
+    "db",
+    "singleflight",
+    "store",
+    "tiles",
+    "warm",
+)
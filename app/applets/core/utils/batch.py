@@ -0,0 +1,168 @@
+"""Batch searches, which place many groups of players at once."""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+
+import msgspec
+from structlog import get_logger
+
+from app.applets.core.schemas import Course, GroupResult, Player, PlayerGroup
+from app.applets.core.utils.distance import score_group, score_packed_group
+from app.applets.core.utils.geo import enrich_courses, find_golf_courses_around
+from app.applets.core.utils.jobs import EnrichmentMode, enqueue_enrichment
+from app.applets.core.utils.metrics import stage
+from app.applets.core.utils.players import calculate_center_coordinates, fetch_or_add_players
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from litestar import Litestar
+
+__all__ = ("batch_lifespan", "get_scoring_pool", "search_groups")
+
+logger = get_logger(__name__)
+settings = get_settings()
+
+type _Scored = tuple[list[Course], list[dict[str, str | float]]]
+
+GEOCODE_FAILED = "Unable to geocode any of the provided addresses."
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_scoring_pool() -> ProcessPoolExecutor | None:
+    """Get the processes scoring the groups of batch searches, see ``GEO_BATCH_PROCESSES``.
+
+    The processes are forked from a server process, as forking a worker that runs threads is unsafe.
+    The server preloads the scoring code, which imports the ``app`` package but not :mod:`app.asgi`, so
+    neither the server nor the processes build the app, open the database or map the course store.
+
+    Returns:
+        The pool, or ``None`` when groups are scored in this process.
+    """
+    global _pool  # noqa: PLW0603
+    processes = settings.geo.BATCH_PROCESSES or os.cpu_count() or 1
+    if processes <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([score_packed_group.__module__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(processes, mp_context=context)
+            logger.info("started %d scoring processes", processes)
+        return _pool
+
+
+def shutdown_scoring_pool() -> None:
+    """Stop the scoring processes, if they were started."""
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _reset_pool_after_fork() -> None:
+    """Forget the parent's scoring processes in a forked worker."""
+    global _pool, _pool_lock  # noqa: PLW0603
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+@asynccontextmanager
+async def batch_lifespan(_: Litestar) -> AsyncIterator[None]:
+    """Stop the scoring processes when the app shuts down."""
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(shutdown_scoring_pool)
+
+
+async def _score(
+    courses: list[Course], user_coords: list[tuple[float, float]], names: list[str], limit: int | None
+) -> _Scored:
+    """Score a group in the scoring processes, or in a thread without them."""
+    mode = settings.geo.DISTANCE_MODE
+    if (pool := get_scoring_pool()) is None:
+        return await asyncio.to_thread(score_group, courses, user_coords, names, limit, mode)
+    payload = msgspec.msgpack.encode((courses, user_coords, names, limit, mode))
+    scored = await asyncio.get_running_loop().run_in_executor(pool, score_packed_group, payload)
+    return msgspec.msgpack.decode(scored, type=_Scored)
+
+
+async def search_groups(groups: list[PlayerGroup], limit: int | None) -> list[GroupResult]:
+    """Find the best courses for each of several groups of players.
+
+    The addresses of all groups are geocoded together, the courses around all of them are fetched
+    together, and the groups are scored in parallel, see ``GEO_BATCH_PROCESSES``.
+
+    Args:
+        groups: The groups of players.
+        limit: Number of courses to return per group, ``None`` for all of them.
+
+    Returns:
+        The results of every group, in order.
+    """
+    with stage("geocode"):
+        players = await fetch_or_add_players(
+            [
+                (str(entry.id) if entry.id is not None else None, entry.name, entry.address)
+                for group in groups
+                for entry in group.players
+            ]
+        )
+    group_players: list[list[Player]] = []
+    for group in groups:
+        group_players.append(players[: len(group.players)])
+        players = players[len(group.players) :]
+
+    located = [
+        (index, [player for player in members if player.coord is not None])
+        for index, members in enumerate(group_players)
+    ]
+    located = [(index, members) for index, members in located if members]
+    results = [GroupResult(players=members, error=GEOCODE_FAILED) for members in group_players]
+    if not located:
+        return results
+
+    with stage("courses"):
+        found = await find_golf_courses_around(
+            [calculate_center_coordinates([player.coord for player in members]) for _, members in located]
+        )
+    with stage("scoring"):
+        scored = await asyncio.gather(
+            *(
+                _score(courses, [player.coord for player in members], [player.name for player in members], limit)
+                for (_, members), courses in zip(located, found, strict=True)
+            )
+        )
+    with stage("enrichment"):
+        if settings.geo.ENRICHMENT_MODE == EnrichmentMode.INLINE:
+            await asyncio.gather(*(enrich_courses(best_courses) for best_courses, _ in scored))
+            jobs = [[] for _ in scored]
+        else:
+            jobs = [await enqueue_enrichment(best_courses) for best_courses, _ in scored]
+
+    for (index, _), (best_courses, player_distances), job_ids in zip(located, scored, jobs, strict=True):
+        results[index] = GroupResult(
+            players=group_players[index],
+            courses=best_courses,
+            player_distances=player_distances,
+            enrichment_jobs=job_ids,
+        )
+    return results
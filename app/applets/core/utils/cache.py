@@ -0,0 +1,143 @@
+"""In-process memory tier in front of the SQLite caches, and the lifetime of their entries.
+
+Entries of the SQLite caches carry the time they were stored. A lookup that found something is
+current for ``CACHE_TTL`` and is served, while it is refreshed in the background, once it is older.
+A lookup that found nothing is cached for ``CACHE_NEGATIVE_TTL`` and tried again in line afterwards,
+as serving it gains nothing. The memory tier only holds current entries.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Final
+
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+__all__ = (
+    "MISSING",
+    "TTLCache",
+    "expired",
+    "geocode_memory",
+    "memory_caches",
+    "nearby_features_memory",
+    "result_memory",
+    "reverse_geocode_memory",
+    "tile_memory",
+)
+
+settings = get_settings()
+
+MISSING: Final = object()
+"""Returned by :meth:`TTLCache.get` on a miss, since ``None`` is a valid cached value."""
+
+
+class TTLCache:
+    """A size-bounded LRU cache whose entries also expire after a fixed time to live.
+
+    Safe to use from the event loop and from worker threads at the same time.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """Create a cache.
+
+        Args:
+            maxsize: Maximum number of entries; the least recently used entry is evicted beyond it.
+                ``0`` disables the cache.
+            ttl: Seconds an entry is served after it was stored.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Get the number of entries, including expired ones not evicted yet."""
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Look up a key.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or :data:`MISSING`.
+        """
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                self.misses += 1
+                return MISSING
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key: The cache key.
+            value: The value to cache.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+def expired(cached_at: float, *, negative: bool = False, now: float | None = None) -> bool:
+    """Check whether an entry of a SQLite cache outlived its time to live.
+
+    Args:
+        cached_at: When the entry was stored.
+        negative: Whether the lookup found nothing, which lives for ``CACHE_NEGATIVE_TTL`` rather than ``CACHE_TTL``.
+        now: The current time. Defaults to :func:`time.time`.
+
+    Returns:
+        Whether the entry is past its TTL.
+    """
+    ttl = settings.cache.NEGATIVE_TTL if negative else settings.cache.TTL
+    return cached_at < (time.time() if now is None else now) - ttl
+
+
+geocode_memory = TTLCache(settings.cache.MEMORY_SIZE, settings.cache.MEMORY_TTL)
+"""Memory tier of ``geocode_cache``, by address."""
+reverse_geocode_memory = TTLCache(settings.cache.MEMORY_SIZE, settings.cache.MEMORY_TTL)
+"""Memory tier of ``reverse_geocode_cache``, by coordinate key."""
+nearby_features_memory = TTLCache(settings.cache.MEMORY_SIZE, settings.cache.MEMORY_TTL)
+"""Memory tier of ``nearby_features_cache``, by coordinate key."""
+tile_memory = TTLCache(settings.cache.TILE_MEMORY_SIZE, settings.cache.MEMORY_TTL)
+"""Memory tier of the fetch times in ``course_tiles``, by tile key."""
+result_memory = TTLCache(settings.cache.RESULT_SIZE, settings.cache.RESULT_TTL)
+"""Search results, by normalized player set; they have no database tier."""
+
+memory_caches: dict[str, TTLCache] = {
+    "geocode_cache": geocode_memory,
+    "reverse_geocode_cache": reverse_geocode_memory,
+    "nearby_features_cache": nearby_features_memory,
+    "course_tiles": tile_memory,
+    "search_results": result_memory,
+}
+"""Every memory tier, by the name of the SQLite table it fronts, or of what it holds if there is none."""
@@ -1,87 +1,71 @@
 """Database utils."""
 
-from decimal import Decimal
-from sqlite3 import IntegrityError
+from collections.abc import Iterable
 
 from structlog import get_logger
 
-from app.applets.core.db import get_db_connection
-from app.applets.core.schemas import Course, Player
+from app.applets.core.db import get_db_connection, merge_duplicate_courses, transaction
+from app.applets.core.schemas import UNKNOWN_CITY, UNNAMED_COURSE, Course
 
 logger = get_logger(__name__)
 
 
-def get_cached_courses() -> list[Course]:
-    """Retrieve all cached courses from the database.
+def upsert_courses(courses: Iterable[Course]) -> None:
+    """Add courses to the database in one statement, updating the courses already stored at their positions.
 
-    Returns:
-        A list of courses.
-    """
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, latitude, longitude, city, access FROM courses")
-        return [
-            Course(
-                id=row[0], name=row[1], lat=Decimal(str(row[2])), lon=Decimal(str(row[3])), city=row[4], access=row[5]
-            )
-            for row in cursor.fetchall()
-        ]
-
-
-def add_course(course: Course) -> None:
-    """Add a course to the database.
+    Names and cities that are still placeholders do not replace resolved ones, so refetching a tile
+    keeps what enrichment found; unchanged rows are not rewritten.
 
     Args:
-        course: The course to add.
+        courses: The courses to store.
     """
-    logger.debug("attempting to add course: %s", course)
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute(
-                "INSERT INTO courses (name, latitude, longitude, city, access) VALUES (?, ?, ?, ?, ?)",
-                (course.name, float(course.lat), float(course.lon), course.city or None, course.access or None),
-            )
-            logger.debug("course added successfully")
-        except IntegrityError:
-            logger.exception("failed to add course")
-            raise
+        conn.executemany(
+            """
+            INSERT INTO courses (name, latitude, longitude, city, access)
+            VALUES (:name, :latitude, :longitude, :city, :access)
+            ON CONFLICT (latitude, longitude) DO UPDATE SET
+                name = iif(excluded.name = :unnamed, name, excluded.name),
+                city = iif(coalesce(excluded.city, :unknown_city) = :unknown_city, city, excluded.city),
+                access = coalesce(excluded.access, access)
+            WHERE (excluded.name != :unnamed AND excluded.name != name)
+               OR (coalesce(excluded.city, :unknown_city) != :unknown_city AND excluded.city IS NOT city)
+               OR (excluded.access IS NOT NULL AND excluded.access IS NOT access)
+            """,
+            [
+                {
+                    "name": course.name,
+                    "latitude": float(course.lat),
+                    "longitude": float(course.lon),
+                    "city": course.city or None,
+                    "access": course.access or None,
+                    "unnamed": UNNAMED_COURSE,
+                    "unknown_city": UNKNOWN_CITY,
+                }
+                for course in courses
+            ],
+        )
 
 
-def get_players() -> list[Player]:
-    """Retrieve all players from the database.
+def delete_courses_at(positions: Iterable[tuple[float, float]]) -> None:
+    """Delete the courses stored at positions.
 
-    Returns:
-        A list of players.
+    Args:
+        positions: The ``(lat, lon)`` positions.
     """
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, address, latitude, longitude FROM players")
-        return [
-            Player(
-                id=row[0],
-                name=row[1],
-                address=row[2],
-                coord=(Decimal(str(row[3])), Decimal(str(row[4]))) if row[3] and row[4] else None,
-            )
-            for row in cursor.fetchall()
-        ]
+        conn.executemany("DELETE FROM courses WHERE latitude = ? AND longitude = ?", positions)
 
 
-def add_player(player: Player) -> None:
-    """Add a player to the database.
+def compact_courses() -> int:
+    """Merge courses stored more than once at the same position and reclaim the space of deleted rows.
 
-    Args:
-        player: The player to add.
+    Returns:
+        The number of duplicate rows removed.
     """
+    with transaction() as conn:
+        removed = merge_duplicate_courses(conn.cursor())
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO players (name, address, latitude, longitude) VALUES (?, ?, ?, ?)",
-            (
-                player.name,
-                player.address,
-                float(player.coord[0]) if player.coord else None,
-                float(player.coord[1]) if player.coord else None,
-            ),
-        )
+        conn.execute("VACUUM")
+    logger.info("removed %d duplicate courses", removed)
+    return removed
@@ -0,0 +1,352 @@
+"""Batched distance computations.
+
+Distances are computed for whole players x courses (or players x players) matrices at once with NumPy
+instead of building a ``geopy.distance.geodesic`` object per pair.
+"""
+
+from __future__ import annotations
+
+import math
+from enum import StrEnum
+from itertools import combinations
+from operator import attrgetter
+from typing import TYPE_CHECKING, Final
+
+import msgspec
+import numpy as np
+from geopy.distance import geodesic
+
+from app.applets.core.schemas import Course
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from numpy.typing import ArrayLike, NDArray
+
+__all__ = (
+    "DistanceMode",
+    "bounding_boxes",
+    "distance_matrix",
+    "pairwise_distances",
+    "player_distance_pairs",
+    "rank_courses",
+    "score_courses",
+    "score_group",
+    "score_packed_group",
+)
+
+settings = get_settings()
+
+MEAN_EARTH_RADIUS_MILES: Final[float] = 6371.0088 / 1.609344
+"""IUGG mean earth radius, used by the haversine mode."""
+WGS84_A: Final[float] = 6378137.0
+"""WGS-84 semi-major axis in meters."""
+WGS84_F: Final[float] = 1 / 298.257223563
+"""WGS-84 flattening."""
+WGS84_B: Final[float] = WGS84_A * (1 - WGS84_F)
+"""WGS-84 semi-minor axis in meters."""
+METERS_PER_MILE: Final[float] = 1609.344
+AVERAGE_SPEED_MPH: Final[float] = 50.0
+"""Average driving speed used to estimate travel times."""
+METERS_PER_DEGREE_LAT_MIN: Final[float] = 110_574.0
+"""Shortest length of a degree of latitude on the WGS-84 ellipsoid (at the equator)."""
+METERS_PER_DEGREE_LON_MAX: Final[float] = 111_320.0
+"""Length of a degree of longitude on the equator."""
+ELLIPSOID_TO_SPHERE_MIN: Final[float] = WGS84_A * (1 - WGS84_F) ** 2 / (MEAN_EARTH_RADIUS_MILES * METERS_PER_MILE)
+"""Lower bound of ellipsoidal over haversine distance: the smallest radius of curvature (meridional, at the
+equator) over the mean radius. The ellipsoid is nowhere shorter than this in any direction."""
+ELLIPSOID_TO_SPHERE_MAX: Final[float] = WGS84_A / (1 - WGS84_F) / (MEAN_EARTH_RADIUS_MILES * METERS_PER_MILE)
+"""Upper bound of ellipsoidal over haversine distance: the largest radius of curvature (at the poles) over the
+mean radius."""
+BOUND_TOLERANCE_MILES: Final[float] = 1e-6
+"""Slack added to pruning bounds for rounding and Vincenty's sub-millimeter error."""
+VINCENTY_MAX_ITERATIONS: Final[int] = 200
+VINCENTY_TOLERANCE: Final[float] = 1e-12
+
+
+class DistanceMode(StrEnum):
+    """Accuracy mode of the distance engine."""
+
+    HAVERSINE = "haversine"
+    """Great-circle distance on a sphere; fastest, within ~0.5% of the ellipsoidal distance."""
+    ELLIPSOIDAL = "ellipsoidal"
+    """Vincenty's inverse formula on the WGS-84 ellipsoid; matches ``geodesic`` to well under a meter."""
+
+
+def _as_coords(coords: ArrayLike) -> NDArray[np.float64]:
+    """Convert a sequence of ``(lat, lon)`` pairs into an ``(n, 2)`` float array."""
+    return np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def distance_matrix(
+    origins: ArrayLike,
+    destinations: ArrayLike,
+    mode: DistanceMode | str | None = None,
+) -> NDArray[np.float64]:
+    """Compute the distance in miles between every origin and every destination.
+
+    Args:
+        origins: A sequence of ``(lat, lon)`` pairs.
+        destinations: A sequence of ``(lat, lon)`` pairs.
+        mode: The accuracy mode. Defaults to ``GEO_DISTANCE_MODE``.
+
+    Returns:
+        An ``(len(origins), len(destinations))`` array of distances in miles.
+    """
+    origin = _as_coords(origins)[:, np.newaxis, :]
+    destination = _as_coords(destinations)[np.newaxis, :, :]
+    lat1, lon1 = np.radians(origin[..., 0]), np.radians(origin[..., 1])
+    lat2, lon2 = np.radians(destination[..., 0]), np.radians(destination[..., 1])
+    if DistanceMode(mode or settings.geo.DISTANCE_MODE) is DistanceMode.HAVERSINE:
+        return _haversine(lat1, lon1, lat2, lon2)
+    return _vincenty(lat1, lon1, lat2, lon2)
+
+
+def bounding_boxes(center_coord: tuple[float, float], radius: float) -> list[tuple[float, float, float, float]]:
+    """Compute conservative bounding boxes enclosing a circle.
+
+    A circle crossing the antimeridian is split into two boxes.
+
+    Args:
+        center_coord: A tuple containing the latitude and longitude of the circle's center.
+        radius: The radius of the circle in meters.
+
+    Returns:
+        A list of ``(min_lat, min_lon, max_lat, max_lon)`` boxes covering the circle.
+    """
+    lat, lon = float(center_coord[0]), float(center_coord[1])
+    delta_lat = radius / METERS_PER_DEGREE_LAT_MIN
+    min_lat, max_lat = max(lat - delta_lat, -90.0), min(lat + delta_lat, 90.0)
+    widest = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if widest <= 0 or (delta_lon := radius / (METERS_PER_DEGREE_LON_MAX * widest)) >= 180:  # noqa: PLR2004
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    west, east = lon - delta_lon, lon + delta_lon
+    if west < -180:  # noqa: PLR2004
+        return [(min_lat, west + 360, max_lat, 180.0), (min_lat, -180.0, max_lat, east)]
+    if east > 180:  # noqa: PLR2004
+        return [(min_lat, west, max_lat, 180.0), (min_lat, -180.0, max_lat, east - 360)]
+    return [(min_lat, west, max_lat, east)]
+
+
+def pairwise_distances(coords: ArrayLike, mode: DistanceMode | str | None = None) -> NDArray[np.float64]:
+    """Compute the symmetric distance matrix in miles between all coordinates.
+
+    Args:
+        coords: A sequence of ``(lat, lon)`` pairs.
+        mode: The accuracy mode. Defaults to ``GEO_DISTANCE_MODE``.
+
+    Returns:
+        An ``(n, n)`` array of distances in miles.
+    """
+    return distance_matrix(coords, coords, mode)
+
+
+def _haversine(
+    lat1: NDArray[np.float64], lon1: NDArray[np.float64], lat2: NDArray[np.float64], lon2: NDArray[np.float64]
+) -> NDArray[np.float64]:
+    """Great-circle distance in miles between broadcastable arrays of radian coordinates."""
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def _vincenty(
+    lat1: NDArray[np.float64], lon1: NDArray[np.float64], lat2: NDArray[np.float64], lon2: NDArray[np.float64]
+) -> NDArray[np.float64]:
+    """Ellipsoidal distance in miles between broadcastable arrays of radian coordinates.
+
+    Vincenty's iteration does not converge for nearly antipodal points; those pairs fall back to
+    ``geopy``'s geodesic solver.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+    f = WGS84_F
+    big_l = lon2 - lon1
+    u1 = np.arctan((1 - f) * np.tan(lat1))
+    u2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = big_l.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha**2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_next = big_l + (1 - c) * f * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m**2))
+            )
+            converged = np.abs(lam_next - lam) < VINCENTY_TOLERANCE
+            lam = lam_next
+            if converged.all():
+                break
+
+        u_sq = cos2_alpha * (WGS84_A**2 - WGS84_B**2) / WGS84_B**2
+        a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = (
+            b
+            * sin_sigma
+            * (
+                cos_2sigma_m
+                + b
+                / 4
+                * (
+                    cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+                    - b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2)
+                )
+            )
+        )
+        miles = WGS84_B * a * (sigma - delta_sigma) / METERS_PER_MILE
+
+    for index in zip(*np.nonzero(~converged | ~np.isfinite(miles)), strict=True):
+        miles[index] = geodesic(
+            (np.degrees(lat1[index]), np.degrees(lon1[index])),
+            (np.degrees(lat2[index]), np.degrees(lon2[index])),
+        ).miles
+    return miles
+
+
+def score_courses(
+    courses: Sequence[Course],
+    user_coords: Sequence[tuple[float, float]],
+    player_names: Sequence[str],
+    mode: DistanceMode | str | None = None,
+) -> None:
+    """Fill in ``distances`` and ``total_distance`` for every course with one batched computation.
+
+    Args:
+        courses: The courses to score. They are updated in place.
+        user_coords: A list of tuples containing the latitude and longitude of each user.
+        player_names: A list of names corresponding to each user.
+        mode: The accuracy mode. Defaults to ``GEO_DISTANCE_MODE``.
+    """
+    count = min(len(user_coords), len(player_names))
+    if not courses or not count:
+        for course in courses:
+            course.distances, course.total_distance = {}, 0.0
+        return
+    names = list(player_names)[:count]
+    matrix = distance_matrix([(course.lat, course.lon) for course in courses], list(user_coords)[:count], mode)
+    totals = matrix.sum(axis=1).tolist()
+    for course, row, total in zip(courses, matrix.tolist(), totals, strict=True):
+        course.distances = {
+            name: {"distance": distance, "travel_time": int(distance / AVERAGE_SPEED_MPH * 60)}
+            for name, distance in zip(names, row, strict=True)
+        }
+        course.total_distance = total
+
+
+def rank_courses(
+    courses: Sequence[Course],
+    user_coords: Sequence[tuple[float, float]],
+    player_names: Sequence[str],
+    limit: int | None = None,
+    mode: DistanceMode | str | None = None,
+) -> list[Course]:
+    """Rank courses by total distance to all players, scoring only those that can make the top ``limit``.
+
+    The total distance of every course is first estimated with the haversine formula, which bounds the
+    ellipsoidal total from both sides. Courses whose lower bound exceeds the ``limit``-th smallest upper
+    bound cannot be among the best and are dropped without being scored, so the exact distances and the
+    per-player ``distances`` of a search scale with ``limit`` rather than with the number of courses.
+
+    Args:
+        courses: The courses to rank. The returned ones are scored in place.
+        user_coords: A list of tuples containing the latitude and longitude of each user.
+        player_names: A list of names corresponding to each user.
+        limit: Number of courses to return. ``None`` ranks all of them.
+        mode: The accuracy mode. Defaults to ``GEO_DISTANCE_MODE``.
+
+    Returns:
+        The best ``limit`` courses, by ascending total distance. Ties keep their order in ``courses``.
+    """
+    count = min(len(user_coords), len(player_names))
+    if limit is None or len(courses) <= limit or not count:
+        scored = list(courses)
+    else:
+        estimates = distance_matrix(
+            [(course.lat, course.lon) for course in courses], list(user_coords)[:count], DistanceMode.HAVERSINE
+        ).sum(axis=1)
+        low, high = 1.0, 1.0
+        if DistanceMode(mode or settings.geo.DISTANCE_MODE) is DistanceMode.ELLIPSOIDAL:
+            low, high = ELLIPSOID_TO_SPHERE_MIN, ELLIPSOID_TO_SPHERE_MAX
+        cutoff = np.partition(estimates, limit - 1)[limit - 1] * high + BOUND_TOLERANCE_MILES * count
+        scored = [courses[index] for index in np.flatnonzero(estimates * low <= cutoff).tolist()]
+    score_courses(scored, user_coords, player_names, mode)
+    scored.sort(key=attrgetter("total_distance"))
+    return scored[:limit]
+
+
+def player_distance_pairs(
+    user_coords: Sequence[tuple[float, float]],
+    names: Sequence[str],
+    mode: DistanceMode | str | None = None,
+) -> list[dict[str, str | float]]:
+    """Compute the distance between all pairs of players with one batched computation.
+
+    Args:
+        user_coords: A list of tuples containing the latitude and longitude of each user.
+        names: A list of names corresponding to each user.
+        mode: The accuracy mode. Defaults to ``GEO_DISTANCE_MODE``.
+
+    Returns:
+        A list of dictionaries containing the names of the players and the distance between them.
+    """
+    if len(user_coords) < 2:  # noqa: PLR2004
+        return []
+    matrix = pairwise_distances(user_coords, mode).tolist()
+    return [
+        {"players": f"{names[i]} and {names[j]}", "distance": matrix[i][j]}
+        for i, j in combinations(range(len(user_coords)), 2)
+    ]
+
+
+def score_group(
+    courses: Sequence[Course],
+    user_coords: Sequence[tuple[float, float]],
+    player_names: Sequence[str],
+    limit: int | None = None,
+    mode: DistanceMode | str | None = None,
+) -> tuple[list[Course], list[dict[str, str | float]]]:
+    """Rank the courses of a group of players and compute the distances between the players.
+
+    Batch searches run it in worker processes, so it only depends on its arguments.
+
+    Args:
+        courses: The courses around the group.
+        user_coords: A list of tuples containing the latitude and longitude of each user.
+        player_names: A list of names corresponding to each user.
+        limit: Number of courses to return. ``None`` ranks all of them.
+        mode: The accuracy mode. Defaults to ``GEO_DISTANCE_MODE``.
+
+    Returns:
+        The ranked courses, as by :func:`rank_courses`, and the player distances, as by
+        :func:`player_distance_pairs`.
+    """
+    return (
+        rank_courses(courses, user_coords, player_names, limit, mode),
+        player_distance_pairs(user_coords, player_names, mode),
+    )
+
+
+type _GroupArgs = tuple[list[Course], list[tuple[float, float]], list[str], int | None, str | None]
+
+
+def score_packed_group(payload: bytes) -> bytes:
+    """Run :func:`score_group` on MessagePack-encoded arguments and encode its result the same way.
+
+    Process pools pass MessagePack between processes at about half the cost of pickling the courses.
+
+    Args:
+        payload: The arguments of :func:`score_group`, as a MessagePack array.
+
+    Returns:
+        The result of :func:`score_group`, as a MessagePack array.
+    """
+    return msgspec.msgpack.encode(score_group(*msgspec.msgpack.decode(payload, type=_GroupArgs)))
@@ -1,25 +1,58 @@
 """Golf utilities."""
 
-import pickle
+import asyncio
+import sqlite3
+import time
+from collections.abc import AsyncIterator, Iterable
 from decimal import Decimal
-from typing import Any
+from functools import partial
+from typing import Any, Final
 
 import overpy
-from geopy.distance import geodesic
 from geopy.exc import GeocoderQuotaExceeded, GeocoderTimedOut
 from geopy.geocoders import Nominatim
 from structlog import get_logger
 
-from app.applets.core.db import get_db_connection
-from app.applets.core.schemas import Course
-from app.applets.core.utils.db import add_course
+from app.applets.core.db import fetch_one, get_db_connection, run_in_db, transaction
+from app.applets.core.schemas import UNKNOWN_CITY, UNNAMED_COURSE, Course
+from app.applets.core.utils.cache import (
+    MISSING,
+    TTLCache,
+    expired,
+    geocode_memory,
+    nearby_features_memory,
+    reverse_geocode_memory,
+)
+from app.applets.core.utils.db import delete_courses_at, upsert_courses
+from app.applets.core.utils.distance import rank_courses
+from app.applets.core.utils.limits import enrichment, nominatim, overpass
+from app.applets.core.utils.metrics import cache_lookups, upstream
+from app.applets.core.utils.singleflight import lookups, normalize_address
+from app.applets.core.utils.store import courses_within
+from app.applets.core.utils.tiles import (
+    Tile,
+    covering_tiles,
+    merge_tile_bounds,
+    stale_tiles,
+    store_tiles,
+    stored_courses,
+    tile_for,
+)
+from app.config.settings import get_settings
 
 logger = get_logger(__name__)
+settings = get_settings()
+
 geolocator = Nominatim(user_agent="gobuddy", timeout=10)
 
+SEARCH_RADIUS: Final[int] = 160934
+"""Meters around the center of a group that its courses are searched within, 100 miles."""
+
 
-def geocode_address(address: str) -> tuple[float, float] | None:
-    """Geocode a single address and cache the result.
+async def geocode_uncached(address: str) -> tuple[float, float] | None:
+    """Geocode an address with Nominatim, within its rate limit, without touching the cache.
+
+    Concurrent requests for the same normalized address share a single upstream call.
 
     Args:
         address: The address to geocode.
@@ -27,36 +60,95 @@ def geocode_address(address: str) -> tuple[float, float] | None:
     Returns:
         A tuple containing the latitude and longitude of the address, or None if not found.
     """
-    if address:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT latitude, longitude FROM geocode_cache WHERE address = ?", (address,))
-            if result := cursor.fetchone():
-                logger.info("CACHED: using cache for %s", address)
-                return result[0], result[1]
-
-        try:
-            logger.warning("UNCACHED: geocoding %s", address)
-            if location := geolocator.geocode(address):
-                coord = (location.latitude, location.longitude)
-                with get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "INSERT INTO geocode_cache (address, latitude, longitude) VALUES (?, ?, ?)",
-                        (address, location.latitude, location.longitude),
-                    )
-                return coord
-        except GeocoderTimedOut:
-            logger.exception("Geocoding timed out for %s", address)
+    return await lookups.do(
+        ("geocode", normalize_address(address)), lambda: nominatim.run(geocode_with_nominatim, address)
+    )
+
+
+def refresh_geocodes(addresses: Iterable[str]) -> None:
+    """Geocode addresses whose cached coordinates are past ``CACHE_TTL`` again, in the background.
+
+    Args:
+        addresses: The addresses to refresh.
+    """
+    for address in addresses:
+        lookups.refresh(("geocode", normalize_address(address)), partial(_refresh_geocode, address))
+
+
+async def _refresh_geocode(address: str) -> tuple[float, float] | None:
+    coord = await nominatim.run(geocode_with_nominatim, address)
+    await run_in_db(store_geocodes, {address: coord})
+    return coord
+
+
+def geocode_with_nominatim(address: str) -> tuple[float, float] | None:
+    """Geocode an address with a blocking Nominatim request.
+
+    Args:
+        address: The address to geocode.
+
+    Returns:
+        A tuple containing the latitude and longitude of the address, or None if not found.
+
+    Raises:
+        GeocoderTimedOut: If Nominatim did not answer in time, which is not to be cached as not found.
+    """
+    logger.warning("UNCACHED: geocoding %s", address)
+    with upstream("nominatim", "geocode"):
+        location = geolocator.geocode(address)
+    if location:
+        return location.latitude, location.longitude
     return None
 
 
+def store_geocodes(geocoded: dict[str, tuple[float, float] | None]) -> dict[str, tuple[float, float] | None]:
+    """Cache the coordinates of addresses, or that they were not found, and move the players at them.
+
+    An address that is not found anymore keeps the coordinates it was found at; its entry is renewed.
+
+    Args:
+        geocoded: The coordinates of every geocoded address, ``None`` for the ones not found.
+
+    Returns:
+        The cached coordinates of every address.
+    """
+    now = time.time()
+    stored: dict[str, tuple[float, float] | None] = {}
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for address, coord in geocoded.items():
+            latitude, longitude = cursor.execute(
+                """
+                INSERT INTO geocode_cache (address, latitude, longitude, cached_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (address) DO UPDATE SET
+                    latitude = coalesce(excluded.latitude, latitude),
+                    longitude = coalesce(excluded.longitude, longitude),
+                    cached_at = excluded.cached_at
+                RETURNING latitude, longitude
+                """,
+                (address, *(coord or (None, None)), now),
+            ).fetchone()
+            stored[address] = (latitude, longitude) if latitude is not None else None
+        cursor.executemany(
+            "UPDATE players SET latitude = ?, longitude = ? WHERE address = ?",
+            [(*coord, address) for address, coord in stored.items() if coord is not None],
+        )
+    for address, coord in stored.items():
+        geocode_memory.set(address, coord)
+    return stored
+
+
 # -- Courses
 
 
-def find_golf_courses(center_coord: tuple[float, float], radius: int = 160934) -> list[Course]:
+async def find_golf_courses(center_coord: tuple[float, float], radius: int = SEARCH_RADIUS) -> list[Course]:
     """Find golf courses within a given radius of a center coordinate.
 
+    The search circle is answered from the course store once the tiles covering it are cached; only
+    missing tiles are fetched from the Overpass API before, with a single query. Expired tiles are
+    served as stored and fetched again in the background. Tiles that another search is already
+    fetching are awaited instead of being fetched again.
+
     Args:
         center_coord: A tuple containing the latitude and longitude of the center coordinate.
         radius: The radius in meters around the center coordinate to search for golf courses.
@@ -64,79 +156,246 @@ def find_golf_courses(center_coord: tuple[float, float], radius: int = 160934) -
     Returns:
         A list of dictionaries containing information about each golf course.
     """
-    cache_key = f"{round(center_coord[0], 5)}, {round(center_coord[1], 5)}, {radius}"
+    [courses] = await find_golf_courses_around([center_coord], radius)
+    return courses
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT courses FROM golf_courses_cache WHERE cache_key = ?", (cache_key,))
-        if result := cursor.fetchone():
-            return pickle.loads(result[0])  # noqa: S301
-
-    elements = query_overpass_api(center_coord, radius)
-    courses = []
-
-    max_additional_queries = 10
-    query_count = {"count": 0}
-
-    max_nearby_queries = 10
-    nearby_query_count = [0]
-
-    for element in elements:
-        if coords := get_course_coordinates(element):
-            lat, lon = coords
-            name = get_course_name(element.tags, lat, lon, max_nearby_queries, nearby_query_count)
-            city = get_city_name(lat, lon, element.tags, max_additional_queries, query_count)
-            course = Course(
-                name=name,
-                lat=Decimal(str(lat)),
-                lon=Decimal(str(lon)),
-                city=city,
-                access=element.tags.get("access", "unknown"),
-            )
-            courses.append(course)
-            add_course(course)
-
-    logger.info(
-        "found %d golf courses within %d miles of %s",
-        len(courses),
-        radius / 1609.34,
-        center_coord,
+
+async def find_golf_courses_around(
+    center_coords: list[tuple[float, float]], radius: int = SEARCH_RADIUS
+) -> list[list[Course]]:
+    """Find the golf courses within a radius of each of several center coordinates.
+
+    The missing tiles covering all of the search circles are fetched together, and the expired ones
+    refreshed together, as by :func:`find_golf_courses`.
+
+    Args:
+        center_coords: The center coordinates of the searches.
+        radius: The radius in meters around each center coordinate to search for golf courses.
+
+    Returns:
+        The golf courses around each center coordinate, in order.
+    """
+    tiles = list(dict.fromkeys(tile for center in center_coords for tile in covering_tiles(center, radius)))
+    stale = await run_in_db(stale_tiles, tiles)
+    if stale.expired:
+        lookups.refresh_many("tiles", stale.expired, fetch_and_store_tiles)
+    if stale.missing:
+        await lookups.do_many("tiles", stale.missing, fetch_and_store_tiles)
+    found = await run_in_db(lambda: [courses_within(center, radius) for center in center_coords])
+
+    for center_coord, courses in zip(center_coords, found, strict=True):
+        logger.info(
+            "found %d golf courses within %d miles of %s",
+            len(courses),
+            radius / 1609.34,
+            center_coord,
+        )
+    return found
+
+
+async def fetch_tiles(tiles: list[Tile]) -> dict[Tile, list[Course]]:
+    """Fetch the golf courses of a set of tiles from the Overpass API.
+
+    Args:
+        tiles: The tiles to fetch.
+
+    Returns:
+        A mapping of every requested tile to the courses whose coordinates fall inside it.
+    """
+    elements = await overpass.run(query_overpass_api, merge_tile_bounds(tiles))
+    zoom, wanted = tiles[0][0], set(tiles)
+    # Ways and relations crossing into a tile are only kept by the tile holding their center.
+    courses = [
+        course_from_element(element, *coords)
+        for element in elements
+        if (coords := get_course_coordinates(element)) and tile_for(*coords, zoom) in wanted
+    ]
+
+    fetched: dict[Tile, list[Course]] = {tile: [] for tile in tiles}
+    for course in courses:
+        fetched[tile_for(course.lat, course.lon, zoom)].append(course)
+    return fetched
+
+
+async def fetch_and_store_tiles(tiles: list[Tile]) -> dict[Tile, list[Course]]:
+    """Fetch a set of tiles from the Overpass API and store them.
+
+    Args:
+        tiles: The tiles to fetch.
+
+    Returns:
+        A mapping of every requested tile to its courses.
+    """
+    fetched = await fetch_tiles(tiles)
+    await run_in_db(save_tiles, fetched)
+    return fetched
+
+
+def save_tiles(fetched: dict[Tile, list[Course]]) -> None:
+    """Store freshly fetched tiles and their courses in a single transaction.
+
+    Courses that a refetched tile held before but no longer does are deleted, so that searches stop
+    finding courses removed from OpenStreetMap.
+
+    Args:
+        fetched: A mapping of each fetched tile to its courses.
+    """
+    positions = {(course.lat, course.lon) for courses in fetched.values() for course in courses}
+    with transaction():
+        previous = stored_courses(fetched)
+        delete_courses_at({(course.lat, course.lon) for courses in previous.values() for course in courses} - positions)
+        upsert_courses([course for courses in fetched.values() for course in courses])
+        store_tiles(fetched)
+
+
+def course_from_element(element: overpy.Element, lat: float, lon: float) -> Course:
+    """Build a course from an Overpass element, with the name and city its tags provide.
+
+    Courses whose tags lack them get :data:`UNNAMED_COURSE` and :data:`UNKNOWN_CITY`, which
+    :func:`enrich_courses` resolves once the course has been ranked.
+
+    Args:
+        element: The Overpass element.
+        lat: Latitude of the course.
+        lon: Longitude of the course.
+
+    Returns:
+        The course.
+    """
+    return Course(
+        name=get_name_from_tags(element.tags) or element.tags.get("leisure", "Unknown").capitalize(),
+        lat=lat,
+        lon=lon,
+        city=get_city_from_tags(element.tags) or UNKNOWN_CITY,
+        access=element.tags.get("access", "unknown"),
     )
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO golf_courses_cache (cache_key, courses) VALUES (?, ?)", (cache_key, pickle.dumps(courses))
+
+async def enrich_courses(ranked: list[Course]) -> None:
+    """Resolve the names and cities that the tags of the best-ranked courses did not provide.
+
+    Only the first ``GEO_ENRICHMENT_TOP_K`` courses are looked up. Cached names and cities are used
+    directly; upstream lookups of every search go through the shared :data:`enrichment` limiter, so
+    the best-ranked courses of all concurrent searches are resolved first.
+
+    Args:
+        ranked: The courses of a search, best first. They are updated in place.
+    """
+    async for _ in iter_enriched_courses(ranked):
+        pass
+
+
+async def iter_enriched_courses(ranked: list[Course]) -> AsyncIterator[Course]:
+    """Resolve missing names and cities like :func:`enrich_courses`, yielding each course once it is done.
+
+    Args:
+        ranked: The courses of a search, best first. They are updated in place.
+
+    Yields:
+        The courses that needed a lookup, in the order their lookups finish.
+    """
+
+    async def enrich(rank: int, course: Course) -> Course:
+        name, city = await asyncio.gather(
+            get_course_name(course.lat, course.lon, rank) if course.name == UNNAMED_COURSE else _done(course.name),
+            get_city_name(course.lat, course.lon, rank) if course.city == UNKNOWN_CITY else _done(course.city),
         )
+        course.name, course.city = name, city
+        return course
 
-    return courses
+    tasks = [
+        asyncio.ensure_future(enrich(rank, course))
+        for rank, course in enumerate(ranked[: settings.geo.ENRICHMENT_TOP_K])
+        if course.name == UNNAMED_COURSE or course.city == UNKNOWN_CITY
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # A consumer that stops early, such as a disconnected client, leaves no lookups behind.
+        for task in tasks:
+            task.cancel()
 
 
-def query_overpass_api(center_coord: tuple[float, float], radius: int) -> list[overpy.Element]:
+async def _done[T](value: T) -> T:
+    """Wrap an already known value for :func:`asyncio.gather`."""
+    return value
+
+
+def query_overpass_api(bounds: list[tuple[float, float, float, float]]) -> list[overpy.Element]:
     """Query the Overpass API to retrieve golf courses.
 
     Args:
-        center_coord: A tuple containing the latitude and longitude of the center coordinate.
-        radius: The radius in meters around the center coordinate to search for golf courses.
+        bounds: The ``(min_lat, min_lon, max_lat, max_lon)`` bounding boxes to search for golf courses.
 
     Returns:
         A list of Overpass API elements representing golf courses.
     """
     api = overpy.Overpass()
-    lat, lon = center_coord
+    statements = "\n".join(
+        f'nwr["leisure"="golf_course"]({min_lat},{min_lon},{max_lat},{max_lon});'
+        for min_lat, min_lon, max_lat, max_lon in bounds
+    )
     query = f"""
     (
-      node["leisure"="golf_course"](around:{radius},{lat},{lon});
-      way["leisure"="golf_course"](around:{radius},{lat},{lon});
-      relation["leisure"="golf_course"](around:{radius},{lat},{lon});
+    {statements}
     );
     out center tags;
     """
-    result = api.query(query)
+    with upstream("overpass", "courses"):
+        result = api.query(query)
     return result.nodes + result.ways + result.relations
 
 
-def get_course_coordinates(element: overpy.Element) -> tuple[Any, Any] | None:
+def coordinate_key(lat: float, lon: float) -> str:
+    """Get the key a coordinate is cached under by the reverse geocode and nearby feature caches.
+
+    Args:
+        lat: The latitude.
+        lon: The longitude.
+
+    Returns:
+        The cache key.
+    """
+    # Rounded in decimal, as when coordinates were Decimals, so that ties keep their existing keys.
+    return f"{round(Decimal(repr(lat)), 5)}, {round(Decimal(repr(lon)), 5)}"
+
+
+def lookup_cached(
+    memory: TTLCache, table: str, column: str, key: str, *, failed: object, cursor: sqlite3.Cursor | None = None
+) -> tuple[Any, bool]:
+    """Look a coordinate up in one of the SQLite caches behind a memory tier, after a miss in the tier.
+
+    Entries within their TTL are put in the memory tier. Lookups that found nothing are not served
+    past ``CACHE_NEGATIVE_TTL``; other entries are served past ``CACHE_TTL`` until they are refreshed.
+
+    Args:
+        memory: The memory tier of the cache.
+        table: The cache table, keyed by ``lat_lon``.
+        column: The column holding the cached value.
+        key: The coordinate's cache key, see :func:`coordinate_key`.
+        failed: The value cached when a lookup found nothing.
+        cursor: A cursor to read with, instead of a connection of its own.
+
+    Returns:
+        The cached value, or :data:`MISSING` if it has to be looked up, and whether it is stale and
+        has to be refreshed.
+    """
+    query = f"SELECT {column}, cached_at FROM {table} WHERE lat_lon = ?"  # noqa: S608
+    row = cursor.execute(query, (key,)).fetchone() if cursor is not None else fetch_one(query, (key,))
+    cache_lookups.inc(table, "db", "miss" if row is None else "hit")
+    if row is None:
+        return MISSING, False
+    value, cached_at = row
+    if not expired(cached_at, negative=value == failed):
+        memory.set(key, value)
+        return value, False
+    if value == failed:
+        return MISSING, False
+    return value, True
+
+
+def get_course_coordinates(element: overpy.Element) -> tuple[float, float] | None:
     """Extract latitude and longitude from an Overpass API element.
 
     Args:
@@ -146,9 +405,9 @@ def get_course_coordinates(element: overpy.Element) -> tuple[Any, Any] | None:
         A tuple containing the latitude and longitude of the element.
     """
     if hasattr(element, "lat") and hasattr(element, "lon"):
-        return element.lat, element.lon
+        return float(element.lat), float(element.lon)
     if hasattr(element, "center_lat") and hasattr(element, "center_lon"):
-        return element.center_lat, element.center_lon
+        return float(element.center_lat), float(element.center_lon)
     return None
 
 
@@ -170,7 +429,8 @@ def query_enclosing_city(lat: float, lon: float) -> str:
     out body;
     """
     try:
-        result = api.query(query)
+        with upstream("overpass", "city"):
+            result = api.query(query)
         logger.debug("overpass query returned %d relations", len(result.relations))
         relations = sorted(result.relations, key=lambda x: int(x.tags.get("admin_level", 0)), reverse=True)
         for relation in relations:
@@ -180,25 +440,101 @@ def query_enclosing_city(lat: float, lon: float) -> str:
                 return name
     except Exception:
         logger.exception("overpass query failed")
-        return "Unknown City"
-    return "Unknown City"
+        return UNKNOWN_CITY
+    return UNKNOWN_CITY
 
 
-def get_city_name(
-    lat: float, lon: float, element_tags: dict, max_additional_queries: int, query_count: dict[str, int]
-) -> str:
-    """Get the city name from element tags or by querying nearby features.
+async def get_city_name(lat: float, lon: float, rank: int) -> str:
+    """Get the city name of a course from the caches or by querying nearby features.
+
+    A cached city past ``CACHE_TTL`` is returned while it is resolved again in the background.
 
     Args:
         lat: Latitude of the golf course.
         lon: Longitude of the golf course.
-        element_tags: A dictionary of element tags.
-        max_additional_queries: Maximum number of additional queries allowed.
-        query_count: A dictionary to keep track of the number of additional queries.
+        rank: The rank of the course in its search, prioritizing the upstream lookup.
+
+    Returns:
+        The city name if found, otherwise "Unknown City".
+    """
+    coord_key = coordinate_key(lat, lon)
+
+    if (city := reverse_geocode_memory.get(coord_key)) is not MISSING:
+        return city
+
+    city, stale = await run_in_db(
+        lookup_cached, reverse_geocode_memory, "reverse_geocode_cache", "city", coord_key, failed=UNKNOWN_CITY
+    )
+    resolve = partial(enrichment.run, rank, resolve_city, lat, lon, coord_key)
+    if city is MISSING:
+        return await lookups.do(("city", coord_key), resolve)
+    if stale:
+        lookups.refresh(("city", coord_key), resolve)
+    return city
+
+
+async def resolve_city(lat: float, lon: float, coord_key: str) -> str:
+    """Resolve the city of a coordinate with upstream lookups and cache it.
+
+    Args:
+        lat: The latitude of the coordinate.
+        lon: The longitude of the coordinate.
+        coord_key: The coordinate's cache key.
 
     Returns:
         The city name if found, otherwise "Unknown City".
     """
+    city = await overpass.run(query_enclosing_city, lat, lon)
+
+    if city == UNKNOWN_CITY:
+        city = await nominatim.run(reverse_geocode_city, lat, lon)
+
+    return await run_in_db(store_city, lat, lon, coord_key, city)
+
+
+def store_city(lat: float, lon: float, coord_key: str, city: str) -> str:
+    """Cache a resolved city and fill it in for the stored courses at that position.
+
+    A coordinate whose city is not found anymore keeps the city it was found in; its entry is renewed.
+
+    Args:
+        lat: The latitude of the coordinate.
+        lon: The longitude of the coordinate.
+        coord_key: The coordinate's cache key.
+        city: The city name.
+
+    Returns:
+        The cached city name.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        previous = cursor.execute("SELECT city FROM reverse_geocode_cache WHERE lat_lon = ?", (coord_key,)).fetchone()
+        (city,) = cursor.execute(
+            """
+            INSERT INTO reverse_geocode_cache (lat_lon, city, cached_at) VALUES (?, ?, ?)
+            ON CONFLICT (lat_lon) DO UPDATE SET
+                city = iif(excluded.city = ?, city, excluded.city), cached_at = excluded.cached_at
+            RETURNING city
+            """,
+            (coord_key, city, time.time(), UNKNOWN_CITY),
+        ).fetchone()
+        cursor.execute(
+            "UPDATE courses SET city = ? WHERE latitude = ? AND longitude = ? AND city IN (?, ?)",
+            (city, float(lat), float(lon), UNKNOWN_CITY, previous[0] if previous else UNKNOWN_CITY),
+        )
+    reverse_geocode_memory.set(coord_key, city)
+    return city
+
+
+def get_city_from_tags(element_tags: dict) -> str | None:
+    """Get the city name from element tags alone.
+
+    Args:
+        element_tags: A dictionary of element tags.
+
+    Returns:
+        The city name if one of the address tags is present, otherwise None.
+    """
     city_tags = [
         "addr:city",
         "addr:town",
@@ -215,35 +551,14 @@ def get_city_name(
         city = element_tags.get(tag)
         if city:
             return city
-
-    coord_key = f"{round(lat, 5)}, {round(lon, 5)}"
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT city FROM reverse_geocode_cache WHERE lat_lon = ?", (coord_key,))
-        if result := cursor.fetchone():
-            return result[0]
-
-    if query_count["count"] >= max_additional_queries:
-        return "Unknown City"
-
-    query_count["count"] += 1
-
-    city = query_enclosing_city(lat, lon)
-
-    if city == "Unknown City":
-        city = reverse_geocode_city(lat, lon)
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO reverse_geocode_cache (lat_lon, city) VALUES (?, ?)", (coord_key, city))
-
-    return city
+    return None
 
 
 def reverse_geocode_city(lat: float, lon: float) -> str:
     """Perform reverse geocoding to get the city name.
 
+    The city is not cached here; :func:`resolve_city` caches it.
+
     Args:
         lat: The latitude of the coordinate.
         lon: The longitude of the coordinate.
@@ -251,41 +566,29 @@ def reverse_geocode_city(lat: float, lon: float) -> str:
     Returns:
         The city name corresponding to the coordinate.
     """
-    coord_key = f"{round(lat, 5)}, {round(lon, 5)}"
-    # Check the database cache
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT city FROM reverse_geocode_cache WHERE lat_lon = ?", (coord_key,))
-        if result := cursor.fetchone():
-            return result[0]
-
     try:
-        location = geolocator.reverse((lat, lon), exactly_one=True)
+        with upstream("nominatim", "reverse"):
+            location = geolocator.reverse((lat, lon), exactly_one=True)
         if location and "address" in location.raw:
             address = location.raw["address"]
-            city = (
+            return (
                 address.get("city")
                 or address.get("town")
                 or address.get("village")
                 or address.get("hamlet")
                 or address.get("county")
-                or "Unknown City"
+                or UNKNOWN_CITY
             )
-        else:
-            city = "Unknown City"
     except (GeocoderTimedOut, GeocoderQuotaExceeded):
         logger.exception("Reverse geocoding failed for %s, %s", lat, lon)
-        city = "Unknown City"
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO reverse_geocode_cache (lat_lon, city) VALUES (?, ?)", (coord_key, city))
-
-    return city
+    return UNKNOWN_CITY
 
 
 def get_name_from_nearby_features(lat: float, lon: float) -> str | None:
-    """Query nearby features to derive a name for the golf course.
+    """Query nearby features to derive a name for the golf course, and cache it.
+
+    The caches are not read here; :func:`get_course_name` and the enrichment jobs read them first.
+    A coordinate whose name is not found anymore keeps the name it was found with; its entry is renewed.
 
     Args:
         lat: Latitude of the course.
@@ -294,14 +597,7 @@ def get_name_from_nearby_features(lat: float, lon: float) -> str | None:
     Returns:
         A name derived from nearby features, or None if no suitable name is found.
     """
-    coord_key = f"{round(lat, 5)}, {round(lon, 5)}"
-
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM nearby_features_cache WHERE lat_lon = ?", (coord_key,))
-        if result := cursor.fetchone():
-            return result[0]
-
+    coord_key = coordinate_key(lat, lon)
     query = f"""
         (
           node(around:500,{lat},{lon})[place~"locality|suburb|neighbourhood|hamlet"][name];
@@ -314,19 +610,36 @@ def get_name_from_nearby_features(lat: float, lon: float) -> str | None:
 
     try:
         nearby_name = extract_nearby_feature_name(api, query)
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT OR IGNORE INTO nearby_features_cache (lat_lon, name) VALUES (?, ?)", (coord_key, nearby_name)
-            )
     except Exception:
         logger.exception("overpass query failed")
+        # Failures are cached as not found, without renewing an entry found before.
         with get_db_connection() as conn:
-            cursor = conn.cursor()
+            conn.execute(
+                "INSERT OR IGNORE INTO nearby_features_cache (lat_lon, name, cached_at) VALUES (?, ?, ?)",
+                (coord_key, None, time.time()),
+            )
+            (nearby_name,) = conn.execute(
+                "SELECT name FROM nearby_features_cache WHERE lat_lon = ?", (coord_key,)
+            ).fetchone()
+        return nearby_name
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        previous = cursor.execute("SELECT name FROM nearby_features_cache WHERE lat_lon = ?", (coord_key,)).fetchone()
+        (nearby_name,) = cursor.execute(
+            """
+            INSERT INTO nearby_features_cache (lat_lon, name, cached_at) VALUES (?, ?, ?)
+            ON CONFLICT (lat_lon) DO UPDATE SET name = coalesce(excluded.name, name), cached_at = excluded.cached_at
+            RETURNING name
+            """,
+            (coord_key, nearby_name, time.time()),
+        ).fetchone()
+        if nearby_name:
             cursor.execute(
-                "INSERT OR IGNORE INTO nearby_features_cache (lat_lon, name) VALUES (?, ?)", (coord_key, None)
+                "UPDATE courses SET name = ? WHERE latitude = ? AND longitude = ? AND name IN (?, ?)",
+                (nearby_name, float(lat), float(lon), UNNAMED_COURSE, (previous and previous[0]) or UNNAMED_COURSE),
             )
-        return None
+    nearby_features_memory.set(coord_key, nearby_name)
     return nearby_name
 
 
@@ -340,7 +653,8 @@ def extract_nearby_feature_name(api: overpy.Overpass, query: str) -> str | None:
     Returns:
         The name of the nearby feature, or None if no name is found.
     """
-    result = api.query(query)
+    with upstream("overpass", "nearby"):
+        result = api.query(query)
     names = set()
     for element in result.nodes + result.ways + result.relations:
         if name := element.tags.get("name"):
@@ -348,20 +662,40 @@ def extract_nearby_feature_name(api: overpy.Overpass, query: str) -> str | None:
     return names.pop() if names else None
 
 
-def get_course_name(
-    element_tags: dict, lat: float, lon: float, max_nearby_queries: int, nearby_query_count: list[int]
-) -> str:
-    """Get the course name from element tags or nearby features.
+async def get_course_name(lat: float, lon: float, rank: int) -> str:
+    """Get the name of a course without a name tag from the caches or nearby features.
+
+    A cached name past ``CACHE_TTL`` is returned while it is looked up again in the background.
 
     Args:
-        element_tags: A dictionary of element tags.
         lat: Latitude of the course.
         lon: Longitude of the course.
-        max_nearby_queries: Maximum number of nearby queries allowed.
-        nearby_query_count: A list with a single integer element to keep track of the number of queries made.
+        rank: The rank of the course in its search, prioritizing the upstream lookup.
+
+    Returns:
+        The name of the golf course, or :data:`UNNAMED_COURSE`.
+    """
+    coord_key = coordinate_key(lat, lon)
+    if (nearby_name := nearby_features_memory.get(coord_key)) is MISSING:
+        nearby_name, stale = await run_in_db(
+            lookup_cached, nearby_features_memory, "nearby_features_cache", "name", coord_key, failed=None
+        )
+        resolve = partial(enrichment.run, rank, overpass.run, get_name_from_nearby_features, lat, lon)
+        if nearby_name is MISSING:
+            nearby_name = await lookups.do(("nearby", coord_key), resolve)
+        elif stale:
+            lookups.refresh(("nearby", coord_key), resolve)
+    return nearby_name or UNNAMED_COURSE
+
+
+def get_name_from_tags(element_tags: dict) -> str | None:
+    """Get the course name from element tags alone.
+
+    Args:
+        element_tags: A dictionary of element tags.
 
     Returns:
-        The name of the golf course.
+        The name if the element carries one of the name tags, otherwise None.
     """
     if name := element_tags.get("name"):
         return name
@@ -377,19 +711,11 @@ def get_course_name(
     for tag in alternative_tags:
         if name := element_tags.get(tag):
             return name
-
-    if nearby_query_count[0] < max_nearby_queries:
-        nearby_name = get_name_from_nearby_features(lat, lon)
-        nearby_query_count[0] += 1
-        if nearby_name:
-            return nearby_name
-
-    leisure = element_tags.get("leisure", "Unknown")
-    return f"{leisure.capitalize()}"
+    return None
 
 
 def find_best_courses(
-    courses: list[Course], user_coords: list[tuple[float, float]], player_names: list[str]
+    courses: list[Course], user_coords: list[tuple[float, float]], player_names: list[str], limit: int | None = None
 ) -> list[Course]:
     """Find the best golf courses based on total distance to all user coordinates.
 
@@ -397,24 +723,12 @@ def find_best_courses(
         courses: A list of dictionaries containing information about each golf course.
         user_coords: A list of tuples containing the latitude and longitude of each user.
         player_names: A list of names corresponding to each user.
+        limit: Number of courses to return. Courses that cannot make the cut are not scored.
+            ``None`` returns all of them.
 
     Returns:
         A list of dictionaries containing the name, latitude, and longitude of each golf course,
         along with the total distance to all user coordinates and the distance and travel time
         to each user.
     """
-    for course in courses:
-        course_coord = (course.lat, course.lon)
-        total_distance = 0.0
-        course.distances = {}
-        for coord, name in zip(user_coords, player_names, strict=False):
-            distance = geodesic(course_coord, coord).miles
-            travel_time = distance / 50 * 60  # Assuming average speed of 50 mph
-            course.distances[name] = {
-                "distance": distance,
-                "travel_time": int(travel_time),
-            }
-            total_distance += distance
-        course.total_distance = total_distance
-    courses.sort(key=lambda x: x.total_distance)
-    return courses
+    return rank_courses(courses, user_coords, player_names, limit)
@@ -0,0 +1,342 @@
+"""Background enrichment of course names and cities.
+
+Searches queue the name and city lookups their best-ranked courses need in the ``enrichment_jobs``
+table and return right away with the names and cities the tags and caches provide. A worker, either
+in-process or started separately with ``app enrichment worker``, runs the lookups by rank, which
+persist their results to the cache tables and the ``courses`` rows; the results page polls
+``/enrichment`` for them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import sqlite3
+import time
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any, Final
+
+import msgspec
+from structlog import get_logger
+
+from app.applets.core.db import get_db_connection, run_in_db
+from app.applets.core.schemas import UNKNOWN_CITY, UNNAMED_COURSE
+from app.applets.core.utils.cache import MISSING, nearby_features_memory, reverse_geocode_memory
+from app.applets.core.utils.geo import coordinate_key, get_name_from_nearby_features, lookup_cached, resolve_city
+from app.applets.core.utils.limits import overpass
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Sequence
+
+    from litestar import Litestar
+
+    from app.applets.core.schemas import Course
+    from app.applets.core.utils.cache import TTLCache
+
+__all__ = (
+    "EnrichmentJob",
+    "EnrichmentMode",
+    "EnrichmentWorker",
+    "JobKind",
+    "claim_job",
+    "enqueue_enrichment",
+    "enrichment_lifespan",
+    "get_jobs",
+    "prepare_enrichment",
+    "worker",
+)
+
+logger = get_logger(__name__)
+settings = get_settings()
+
+MAX_ATTEMPTS: Final[int] = 3
+"""Attempts before a failing job is given up."""
+JOB_RETENTION: Final[int] = 24 * 60 * 60
+"""Seconds finished jobs are kept for polling clients."""
+
+
+class EnrichmentMode(StrEnum):
+    """Where name and city lookups run, see ``GEO_ENRICHMENT_MODE``."""
+
+    INLINE = "inline"
+    BACKGROUND = "background"
+    EXTERNAL = "external"
+
+
+class JobKind(StrEnum):
+    """What an enrichment job resolves."""
+
+    NAME = "name"
+    CITY = "city"
+
+
+class EnrichmentJob(msgspec.Struct):
+    """The state of a queued lookup."""
+
+    id: int
+    kind: JobKind
+    latitude: float
+    longitude: float
+    status: str
+    """``pending``, ``running``, ``done`` or ``failed``."""
+    result: str | None = None
+    """The resolved name or city, once the job is done."""
+
+
+def prepare_enrichment(ranked: Sequence[Course], *, first_rank: int = 0) -> list[int]:
+    """Fill in cached names and cities of ranked courses and queue jobs for the rest.
+
+    Names and cities cached past ``CACHE_TTL`` are filled in and queued to be looked up again.
+
+    Args:
+        ranked: The courses to enrich, best first. They are updated in place.
+        first_rank: The rank of the first course, which the jobs are prioritized by.
+
+    Returns:
+        The ids of the jobs the courses are waiting on.
+    """
+    now = time.time()
+    jobs = []
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for rank, course in enumerate(ranked, start=first_rank):
+            key = coordinate_key(course.lat, course.lon)
+            if course.name == UNNAMED_COURSE:
+                name, stale = _cached(cursor, nearby_features_memory, "nearby_features_cache", "name", key, failed=None)
+                if name is MISSING or stale:
+                    jobs.append((JobKind.NAME, key, course.lat, course.lon, rank, now))
+                if name is not MISSING:
+                    course.name = name or UNNAMED_COURSE
+            if course.city == UNKNOWN_CITY:
+                city, stale = _cached(
+                    cursor, reverse_geocode_memory, "reverse_geocode_cache", "city", key, failed=UNKNOWN_CITY
+                )
+                if city is MISSING or stale:
+                    jobs.append((JobKind.CITY, key, course.lat, course.lon, rank, now))
+                if city is not MISSING:
+                    course.city = city
+        if not jobs:
+            return []
+        # Re-queue jobs that finished without leaving a current cache entry behind; keep the best priority.
+        cursor.executemany(
+            """
+            INSERT INTO enrichment_jobs (kind, lat_lon, latitude, longitude, priority, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (kind, lat_lon) DO UPDATE SET
+                priority = min(priority, excluded.priority),
+                status = iif(status = 'running', status, 'pending'),
+                attempts = iif(status = 'running', attempts, 0),
+                updated_at = iif(status = 'running', updated_at, excluded.updated_at)
+            """,
+            jobs,
+        )
+        cursor.execute(
+            f"SELECT id FROM enrichment_jobs WHERE (kind, lat_lon) IN (VALUES {', '.join(['(?, ?)'] * len(jobs))})",  # noqa: S608
+            [value for kind, key, *_ in jobs for value in (kind, key)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _cached(
+    cursor: sqlite3.Cursor, memory: TTLCache, table: str, column: str, key: str, *, failed: object
+) -> tuple[Any, bool]:
+    """Look a coordinate up in a memory tier, then in the table behind it, see :func:`lookup_cached`."""
+    if (value := memory.get(key)) is not MISSING:
+        return value, False
+    return lookup_cached(memory, table, column, key, failed=failed, cursor=cursor)
+
+
+async def enqueue_enrichment(ranked: Sequence[Course]) -> list[int]:
+    """Enrich the best-ranked courses of a search from the caches and queue the remaining lookups.
+
+    Args:
+        ranked: The courses of a search, best first. The first ``GEO_ENRICHMENT_TOP_K`` are updated in place.
+
+    Returns:
+        The ids of the jobs the courses are waiting on.
+    """
+    job_ids = await run_in_db(prepare_enrichment, ranked[: settings.geo.ENRICHMENT_TOP_K])
+    if job_ids:
+        worker.wake()
+    return job_ids
+
+
+def claim_job() -> EnrichmentJob | None:
+    """Take the most important pending job, or one abandoned by a crashed worker.
+
+    Returns:
+        The claimed job, or None if the queue is empty.
+    """
+    now = time.time()
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            """
+            UPDATE enrichment_jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+            WHERE id = (
+                SELECT id FROM enrichment_jobs
+                WHERE status = 'pending' OR (status = 'running' AND updated_at < ?)
+                ORDER BY priority, id
+                LIMIT 1
+            )
+            RETURNING id, kind, latitude, longitude, status, attempts
+            """,
+            (now, now - settings.geo.ENRICHMENT_JOB_TIMEOUT),
+        ).fetchall()
+    if not rows:
+        return None
+    [(job_id, kind, latitude, longitude, status, attempts)] = rows
+    if attempts > MAX_ATTEMPTS:
+        finish_job(job_id, "failed")
+        return claim_job()
+    return EnrichmentJob(id=job_id, kind=JobKind(kind), latitude=latitude, longitude=longitude, status=status)
+
+
+def finish_job(job_id: int, status: str) -> None:
+    """Record the outcome of a job and drop finished jobs past their retention.
+
+    Args:
+        job_id: The job id.
+        status: ``done``, ``failed`` or ``pending`` to retry it.
+    """
+    now = time.time()
+    with get_db_connection() as conn:
+        conn.execute("UPDATE enrichment_jobs SET status = ?, updated_at = ? WHERE id = ?", (status, now, job_id))
+        conn.execute(
+            "DELETE FROM enrichment_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (now - JOB_RETENTION,),
+        )
+
+
+def get_jobs(job_ids: Sequence[int]) -> list[EnrichmentJob]:
+    """Get the state of jobs, with the results of the finished ones.
+
+    Args:
+        job_ids: The job ids.
+
+    Returns:
+        The jobs that still exist.
+    """
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT job.id, job.kind, job.latitude, job.longitude, job.status,
+                iif(job.kind = 'name', nearby.name, city.city)
+            FROM enrichment_jobs AS job
+            LEFT JOIN nearby_features_cache AS nearby ON job.kind = 'name' AND nearby.lat_lon = job.lat_lon
+            LEFT JOIN reverse_geocode_cache AS city ON job.kind = 'city' AND city.lat_lon = job.lat_lon
+            WHERE job.id IN ({", ".join("?" * len(job_ids))})
+            """,  # noqa: S608
+            list(job_ids),
+        ).fetchall()
+    return [
+        EnrichmentJob(
+            id=job_id,
+            kind=JobKind(kind),
+            latitude=latitude,
+            longitude=longitude,
+            status=status,
+            result=result if status == "done" else None,
+        )
+        for job_id, kind, latitude, longitude, status, result in rows
+    ]
+
+
+async def run_job(job: EnrichmentJob) -> None:
+    """Run the lookup of a job; the lookup persists its result to the caches and ``courses`` rows.
+
+    Args:
+        job: The claimed job.
+    """
+    if job.kind is JobKind.NAME:
+        await overpass.run(get_name_from_nearby_features, job.latitude, job.longitude)
+    else:
+        await resolve_city(job.latitude, job.longitude, coordinate_key(job.latitude, job.longitude))
+
+
+class EnrichmentWorker:
+    """Runs queued enrichment jobs, most important first, with bounded concurrency."""
+
+    def __init__(self, concurrency: int, poll_interval: float) -> None:
+        """Create a worker.
+
+        Args:
+            concurrency: Number of jobs run at once.
+            poll_interval: Seconds to wait before checking an empty queue again.
+        """
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup: asyncio.Event | None = None
+
+    def wake(self) -> None:
+        """Tell an idle in-process worker that jobs were queued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self, *, until_empty: bool = False) -> None:
+        """Run jobs until cancelled.
+
+        Args:
+            until_empty: Return once no job is left to claim instead, as when draining the queue.
+        """
+        self._wakeup = asyncio.Event()
+        logger.info("enrichment worker started with %d slots", self.concurrency)
+        try:
+            await asyncio.gather(*(self._work(until_empty=until_empty) for _ in range(self.concurrency)))
+        finally:
+            self._wakeup = None
+
+    async def _work(self, *, until_empty: bool) -> None:
+        while True:
+            # Cleared before claiming, so that jobs queued while the queue looks empty wake the slot.
+            if self._wakeup is not None:
+                self._wakeup.clear()
+            try:
+                job = await run_in_db(claim_job)
+            except sqlite3.OperationalError:
+                # Long writes such as an OSM import can hold the database past the busy timeout.
+                logger.warning("could not claim an enrichment job, retrying", exc_info=True)
+                await self._idle()
+                continue
+            if job is None:
+                if until_empty:
+                    return
+                await self._idle()
+                continue
+            try:
+                await run_job(job)
+            except Exception:
+                logger.exception("enrichment job %d failed", job.id)
+                status = "pending"
+            else:
+                status = "done"
+            try:
+                await run_in_db(finish_job, job.id, status)
+            except sqlite3.OperationalError:
+                # The job is left running and reclaimed once it times out.
+                logger.warning("could not finish enrichment job %d", job.id, exc_info=True)
+
+    async def _idle(self) -> None:
+        if self._wakeup is None:
+            return
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+
+worker = EnrichmentWorker(settings.geo.ENRICHMENT_CONCURRENCY, settings.geo.ENRICHMENT_POLL_INTERVAL)
+"""The enrichment worker of this process."""
+
+
+@contextlib.asynccontextmanager
+async def enrichment_lifespan(_: Litestar) -> AsyncIterator[None]:
+    """Run the in-process enrichment worker for the lifetime of the app in ``background`` mode."""
+    if settings.geo.ENRICHMENT_MODE != EnrichmentMode.BACKGROUND:
+        yield
+        return
+    task = asyncio.create_task(worker.run())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
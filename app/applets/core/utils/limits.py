@@ -0,0 +1,332 @@
+"""Rate and concurrency limits for upstream providers."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING
+
+from app.applets.core.utils.metrics import admission_running, admission_wait_seconds, admission_waiting, admissions
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+__all__ = (
+    "AdmissionLimiter",
+    "Overloaded",
+    "PriorityLimiter",
+    "ProviderLimiter",
+    "enrichment",
+    "nominatim",
+    "overpass",
+    "searches",
+)
+
+settings = get_settings()
+
+
+class ProviderLimiter:
+    """Bound the concurrency and request rate of calls to a single upstream provider.
+
+    The underlying clients (``geopy`` and ``overpy``) are blocking, so every call is run in a
+    worker thread and the event loop stays free to serve other requests while it waits.
+    """
+
+    def __init__(self, name: str, concurrency: int, min_interval: float = 0.0) -> None:
+        """Create a limiter.
+
+        Args:
+            name: The provider name, used for logging.
+            concurrency: Maximum number of calls in flight at once.
+            min_interval: Minimum number of seconds between the start of two calls.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+        self._loop_state: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[asyncio.Semaphore, asyncio.Lock]
+        ] = weakref.WeakKeyDictionary()
+
+    def _state(self) -> tuple[asyncio.Semaphore, asyncio.Lock]:
+        """Get the semaphore and lock for the running event loop.
+
+        asyncio primitives are bound to the loop they are first used on, while the limiters are module
+        level and may outlive a loop (test clients, CLI commands).
+        """
+        loop = asyncio.get_running_loop()
+        if (state := self._loop_state.get(loop)) is None:
+            state = self._loop_state[loop] = (asyncio.Semaphore(self.concurrency), asyncio.Lock())
+        return state
+
+    async def run[**P, T](self, func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        """Run a blocking provider call once a slot is available.
+
+        Args:
+            func: The blocking callable performing the upstream request.
+            *args: Positional arguments for ``func``.
+            **kwargs: Keyword arguments for ``func``.
+
+        Returns:
+            The return value of ``func``.
+        """
+        semaphore, _ = self._state()
+        async with semaphore:
+            await self._wait_for_slot()
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def _wait_for_slot(self) -> None:
+        """Sleep until the provider's minimum interval has passed since the previous call."""
+        if self.min_interval <= 0:
+            return
+        _, lock = self._state()
+        async with lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class _PriorityState:
+    """The slots and waiters of a :class:`PriorityLimiter` on one event loop."""
+
+    def __init__(self, slots: int) -> None:
+        self.free = slots
+        self.waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+
+
+class PriorityLimiter:
+    """Bound the number of calls in flight, handing free slots to the most important waiter first.
+
+    Waiters are served by ascending priority, then in arrival order, whichever caller they belong to.
+    """
+
+    def __init__(self, name: str, concurrency: int) -> None:
+        """Create a limiter.
+
+        Args:
+            name: The limiter name, used for logging.
+            concurrency: Maximum number of calls in flight at once.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self._order = itertools.count()
+        self._loop_state: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _PriorityState] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _state(self) -> _PriorityState:
+        """Get the slots and waiters of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if (state := self._loop_state.get(loop)) is None:
+            state = self._loop_state[loop] = _PriorityState(self.concurrency)
+        return state
+
+    async def run[**P, T](self, priority: int, func: Callable[P, Awaitable[T]], *args: P.args, **kwargs: P.kwargs) -> T:
+        """Run a call once a slot is free and no more important call is waiting for one.
+
+        Args:
+            priority: The importance of the call; lower values are served first.
+            func: The coroutine function to call.
+            *args: Positional arguments for ``func``.
+            **kwargs: Keyword arguments for ``func``.
+
+        Returns:
+            The return value of ``func``.
+        """
+        state = self._state()
+        if state.free > 0 and not state.waiters:
+            state.free -= 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(state.waiters, (priority, next(self._order), waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(state)  # The slot was handed over already; pass it on.
+                raise
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self._release(state)
+
+    def _release(self, state: _PriorityState) -> None:
+        """Hand a slot to the most important live waiter, or return it to the pool."""
+        while state.waiters:
+            _, _, waiter = heapq.heappop(state.waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.free += 1
+
+
+class Overloaded(Exception):  # noqa: N818
+    """Raised by :meth:`AdmissionLimiter.acquire` when a request is shed instead of admitted."""
+
+    def __init__(self, limiter: str, reason: str) -> None:
+        """Describe why a request was shed.
+
+        Args:
+            limiter: The name of the limiter.
+            reason: ``queue_full``, ``client_queue_full`` or ``timeout``.
+        """
+        super().__init__(f"{limiter}: {reason}")
+        self.reason = reason
+
+
+class _AdmissionState:
+    """The slots and waiting clients of an :class:`AdmissionLimiter` on one event loop."""
+
+    def __init__(self, slots: int) -> None:
+        self.free = slots
+        self.waiting = 0
+        self.clients: OrderedDict[str, deque[asyncio.Future[None]]] = OrderedDict()
+
+
+class AdmissionLimiter:
+    """Bound the number of expensive requests running at once, queueing a bounded number of the others.
+
+    Requests that find the queue full, or that wait too long, are shed with :class:`Overloaded`. Free
+    slots are handed to waiting clients in turn, oldest request first, so that a client sending many
+    requests does not hold back the others.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, client_queue_size: int, timeout: float) -> None:
+        """Create a limiter.
+
+        Args:
+            name: The limiter name, used for metrics.
+            concurrency: Maximum number of requests running at once; ``0`` admits every request.
+            queue_size: Maximum number of requests waiting for a slot.
+            client_queue_size: Maximum number of requests of a single client waiting for a slot.
+            timeout: Seconds a request waits for a slot before it is shed.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.client_queue_size = client_queue_size
+        self.timeout = timeout
+        self._loop_state: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _AdmissionState] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _state(self) -> _AdmissionState:
+        """Get the slots and waiting clients of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if (state := self._loop_state.get(loop)) is None:
+            state = self._loop_state[loop] = _AdmissionState(self.concurrency)
+        return state
+
+    async def acquire(self, client: str) -> None:
+        """Wait for a slot; every admitted request must :meth:`release` it once it is done.
+
+        Args:
+            client: Identifies the client of the request, for fairness.
+
+        Raises:
+            Overloaded: If the request is shed.
+        """
+        if self.concurrency <= 0:
+            return
+        state = self._state()
+        if state.free > 0 and not state.waiting:
+            state.free -= 1
+            self._admitted(0.0)
+            return
+        queue = state.clients.get(client)
+        if state.waiting >= self.queue_size:
+            self._shed("queue_full")
+        if queue is not None and len(queue) >= self.client_queue_size:
+            self._shed("client_queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = state.clients[client] = deque()
+        queue.append(waiter)
+        state.waiting += 1
+        admission_waiting.inc(self.name)
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(self.timeout):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over(state)  # The slot was handed over already; pass it on.
+            else:
+                self._forget(state, client, waiter)
+            if isinstance(exc, TimeoutError):
+                self._shed("timeout")
+            raise
+        self._admitted(time.monotonic() - start)
+
+    def release(self) -> None:
+        """Hand a slot to the next waiting client, or return it to the pool."""
+        if self.concurrency <= 0:
+            return
+        admission_running.dec(self.name)
+        self._hand_over(self._state())
+
+    def _hand_over(self, state: _AdmissionState) -> None:
+        """Wake the oldest request of the next waiting client, or return the slot to the pool."""
+        while state.clients:
+            client, queue = state.clients.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                state.clients[client] = queue  # Back of the line for the client's next request.
+            state.waiting -= 1
+            admission_waiting.dec(self.name)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.free += 1
+
+    def _forget(self, state: _AdmissionState, client: str, waiter: asyncio.Future[None]) -> None:
+        """Drop a request that stopped waiting from the queue."""
+        queue = state.clients.get(client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del state.clients[client]
+        state.waiting -= 1
+        admission_waiting.dec(self.name)
+
+    def _admitted(self, waited: float) -> None:
+        admissions.inc(self.name, "admitted")
+        admission_running.inc(self.name)
+        admission_wait_seconds.observe(waited, self.name)
+
+    def _shed(self, reason: str) -> None:
+        admissions.inc(self.name, reason)
+        raise Overloaded(self.name, reason)
+
+
+nominatim = ProviderLimiter(
+    "nominatim",
+    concurrency=settings.geo.NOMINATIM_CONCURRENCY,
+    min_interval=settings.geo.NOMINATIM_MIN_INTERVAL,
+)
+"""Limiter shared by all Nominatim (``geopy``) requests in this worker."""
+overpass = ProviderLimiter(
+    "overpass",
+    concurrency=settings.geo.OVERPASS_CONCURRENCY,
+    min_interval=settings.geo.OVERPASS_MIN_INTERVAL,
+)
+"""Limiter shared by all Overpass API requests in this worker."""
+enrichment = PriorityLimiter("enrichment", concurrency=settings.geo.ENRICHMENT_CONCURRENCY)
+"""Limiter shared by the name and city lookups of every search in this worker, prioritized by result rank."""
+searches = AdmissionLimiter(
+    "search",
+    concurrency=settings.geo.SEARCH_CONCURRENCY,
+    queue_size=settings.geo.SEARCH_QUEUE_SIZE,
+    client_queue_size=settings.geo.SEARCH_CLIENT_QUEUE_SIZE,
+    timeout=settings.geo.SEARCH_QUEUE_TIMEOUT,
+)
+"""Limiter shared by the searches of this worker, which hold a slot from geocoding to the rendered results."""
@@ -0,0 +1,361 @@
+"""Search stage timings and cache and upstream counters, exposed in the Prometheus text format.
+
+Values are kept per worker process, like the other counters of the app; Prometheus sums them
+across the workers it scrapes.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Final
+
+from litestar.response import Template
+from structlog import get_logger
+
+from app.applets.core.utils.cache import memory_caches
+from app.applets.core.utils.singleflight import lookups
+from app.applets.core.utils.tiles import tile_counters
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from litestar.response.base import ASGIResponse
+
+__all__ = (
+    "CONTENT_TYPE",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "TimedTemplate",
+    "admission_running",
+    "admission_wait_seconds",
+    "admission_waiting",
+    "admissions",
+    "cache_lookups",
+    "family",
+    "log_stages",
+    "render",
+    "stage",
+    "stage_seconds",
+    "track_stages",
+    "upstream",
+    "upstream_calls",
+    "upstream_seconds",
+)
+
+logger = get_logger(__name__)
+
+CONTENT_TYPE: Final = "text/plain; version=0.0.4"
+"""Media type of the Prometheus text format."""
+SECONDS_BUCKETS: Final = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""Upper bounds of the duration histograms, in seconds."""
+
+type Sample = tuple[tuple[str, ...], float]
+"""Label values and the value of one sample."""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values, strict=True))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def family(name: str, kind: str, documentation: str, labelnames: tuple[str, ...], samples: Iterable[Sample]) -> str:
+    """Render a metric family.
+
+    Args:
+        name: The metric name.
+        kind: ``counter``, ``gauge`` or ``histogram``.
+        documentation: The help text.
+        labelnames: The names of the labels of every sample.
+        samples: The label values and value of every sample.
+
+    Returns:
+        The family in the Prometheus text format.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_labels(labelnames, labels)} {_number(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+class Counter:
+    """A monotonically increasing value per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...]) -> None:
+        """Create a counter.
+
+        Args:
+            name: The metric name, ending in ``_total``.
+            documentation: The help text.
+            labelnames: The names of the labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Add to the value of some label values.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            amount: The amount to add.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        """Get the value of some label values."""
+        return self._values.get(labels, 0)
+
+    def render(self, extra: Iterable[Sample] = ()) -> str:
+        """Render the counter, with samples of values counted elsewhere."""
+        with self._lock:
+            samples = sorted(self._values.items())
+        return family(self.name, self.kind, self.documentation, self.labelnames, [*samples, *extra])
+
+
+class Gauge(Counter):
+    """A value that goes up and down per combination of label values."""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        """Subtract from the value of some label values.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            amount: The amount to subtract.
+        """
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    """The distribution of observed values per combination of label values."""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...], buckets: tuple[float, ...] = SECONDS_BUCKETS
+    ) -> None:
+        """Create a histogram.
+
+        Args:
+            name: The metric name.
+            documentation: The help text.
+            labelnames: The names of the labels.
+            buckets: The upper bounds of the buckets, ascending.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record a value for some label values.
+
+        Args:
+            value: The observed value.
+            *labels: The label values, in the order of the label names.
+        """
+        with self._lock:
+            if (state := self._values.get(labels)) is None:
+                state = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        """Get the number of values recorded for some label values."""
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def render(self) -> str:
+        """Render the histogram."""
+        with self._lock:
+            values = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bucket_names = (*self.labelnames, "le")
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(bucket_names, (*labels, _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+stage_seconds = Histogram("gobuddy_stage_seconds", "Seconds spent in each stage of a search.", ("stage",))
+cache_lookups = Counter(
+    "gobuddy_cache_lookups_total", "Lookups in the caches, by tier and result.", ("cache", "tier", "result")
+)
+"""Lookups in the SQLite tier; the memory tier counts its own and is added when rendering."""
+upstream_calls = Counter(
+    "gobuddy_upstream_calls_total", "Calls to upstream providers, by outcome.", ("provider", "query", "outcome")
+)
+upstream_seconds = Histogram(
+    "gobuddy_upstream_seconds", "Seconds upstream providers took to answer.", ("provider", "query")
+)
+admissions = Counter("gobuddy_admissions_total", "Requests that asked for a slot, by outcome.", ("limiter", "outcome"))
+admission_running = Gauge("gobuddy_admission_running", "Requests holding a slot.", ("limiter",))
+admission_waiting = Gauge("gobuddy_admission_waiting", "Requests waiting for a slot.", ("limiter",))
+admission_wait_seconds = Histogram(
+    "gobuddy_admission_wait_seconds", "Seconds admitted requests waited for a slot.", ("limiter",)
+)
+
+_request_stages: ContextVar[dict[str, float] | None] = ContextVar("request_stages", default=None)
+
+
+def track_stages() -> dict[str, float]:
+    """Start collecting the stage timings of the current request, to be logged once it is rendered.
+
+    Returns:
+        The seconds of every stage of the request, filled in as they complete.
+    """
+    stages: dict[str, float] = {}
+    _request_stages.set(stages)
+    return stages
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of a search.
+
+    Args:
+        name: The stage.
+
+    Yields:
+        Nothing; the stage is timed until the block exits.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, name)
+        if (stages := _request_stages.get()) is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+
+@contextlib.contextmanager
+def upstream(provider: str, query: str) -> Iterator[None]:
+    """Count and time a call to an upstream provider; an exception counts as an ``error`` outcome.
+
+    Args:
+        provider: ``nominatim`` or ``overpass``.
+        query: What is asked for.
+
+    Yields:
+        Nothing; the call is timed until the block exits.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        upstream_seconds.observe(time.perf_counter() - start, provider, query)
+        upstream_calls.inc(provider, query, outcome)
+
+
+class TimedTemplate(Template):
+    """A template response whose rendering is timed as the ``render`` stage.
+
+    The stage timings of the request, if tracked, are logged once it is rendered.
+    """
+
+    def to_asgi_response(self, *args: object, **kwargs: object) -> ASGIResponse:
+        """Render the template.
+
+        Returns:
+            The rendered response.
+        """
+        with stage("render"):
+            response = super().to_asgi_response(*args, **kwargs)
+        log_stages()
+        return response
+
+
+def log_stages() -> None:
+    """Log the stage timings of the current request, if they are tracked."""
+    if stages := _request_stages.get():
+        logger.info("stages: %s", ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in stages.items()))
+
+
+def render() -> str:
+    """Render every metric of this worker.
+
+    Returns:
+        The metrics in the Prometheus text format.
+    """
+    memory_lookups = [
+        sample
+        for table, memory in sorted(memory_caches.items())
+        for sample in (((table, "memory", "hit"), memory.hits), ((table, "memory", "miss"), memory.misses))
+    ]
+    return "".join(
+        (
+            stage_seconds.render(),
+            cache_lookups.render(memory_lookups),
+            family(
+                "gobuddy_memory_cache_entries",
+                "gauge",
+                "Entries held by the memory tier of each cache.",
+                ("cache",),
+                [((table,), len(memory)) for table, memory in sorted(memory_caches.items())],
+            ),
+            family(
+                "gobuddy_memory_cache_evictions_total",
+                "counter",
+                "Entries dropped from the memory tier of each cache, by reason.",
+                ("cache", "reason"),
+                [
+                    sample
+                    for table, memory in sorted(memory_caches.items())
+                    for sample in (((table, "size"), memory.evictions), ((table, "ttl"), memory.expirations))
+                ],
+            ),
+            family(
+                "gobuddy_tile_lookups_total",
+                "counter",
+                "Tiles looked up by searches, by result; misses include the expired tiles.",
+                ("result",),
+                [((result,), count) for result, count in sorted(tile_counters.items())],
+            ),
+            family(
+                "gobuddy_singleflight_calls_total",
+                "counter",
+                "Upstream lookups made (leader), joined (shared) or started to refresh stale entries (refresh), by kind.",
+                ("kind", "role"),
+                sorted(lookups.counters.items()),
+            ),
+            upstream_calls.render(),
+            upstream_seconds.render(),
+            admissions.render(),
+            admission_running.render(),
+            admission_waiting.render(),
+            admission_wait_seconds.render(),
+        )
+    )
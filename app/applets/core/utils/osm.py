@@ -0,0 +1,460 @@
+"""Offline import of golf courses from local OpenStreetMap extracts.
+
+Reads ``leisure=golf_course`` features from an ``.osm.pbf`` (requires ``osmium``), ``.osm``/``.osm.xml``
+or saved Overpass JSON file, resolves their names and cities from the ``place`` nodes of the same file
+and stores them in the ``courses`` table and the course tile cache, so searches inside the imported
+area never wait on the public Overpass API.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import xml.etree.ElementTree as ET
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any, Final
+
+import msgspec
+import numpy as np
+from structlog import get_logger
+
+from app.applets.core.db import transaction
+from app.applets.core.schemas import UNKNOWN_CITY, Course
+from app.applets.core.utils.db import upsert_courses
+from app.applets.core.utils.distance import METERS_PER_DEGREE_LAT_MIN, METERS_PER_MILE, distance_matrix
+from app.applets.core.utils.geo import get_city_from_tags, get_name_from_tags
+from app.applets.core.utils.tiles import Tile, store_tiles, tile_bounds, tile_for
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from pathlib import Path
+
+__all__ = (
+    "ImportSummary",
+    "OsmExtract",
+    "OsmFormat",
+    "import_courses",
+    "read_extract",
+    "resolve_courses",
+    "tiles_within",
+)
+
+logger = get_logger(__name__)
+
+NEARBY_PLACES: Final[frozenset[str]] = frozenset({"locality", "suburb", "neighbourhood", "hamlet"})
+"""Places whose name may stand in for a course without a name, as in the online lookup."""
+NEARBY_RADIUS: Final[float] = 500.0
+"""Meters around a course searched for a nearby place name, as in the online lookup."""
+SETTLEMENTS: Final[frozenset[str]] = frozenset({"city", "town", "village"})
+"""Places a course's city is resolved to."""
+SETTLEMENT_RADIUS: Final[float] = 15_000.0
+"""Meters around a course searched for the nearest settlement."""
+BOUNDS_TOLERANCE: Final[float] = 1e-9
+"""Degrees of slack when testing whether a tile lies within the extract bounds."""
+
+type Bounds = tuple[float, float, float, float]
+"""A ``(min_lat, min_lon, max_lat, max_lon)`` bounding box."""
+
+
+class OsmFormat(StrEnum):
+    """Supported extract formats."""
+
+    PBF = "pbf"
+    XML = "xml"
+    JSON = "json"
+
+    @classmethod
+    def from_path(cls, path: Path) -> OsmFormat:
+        """Guess the format of an extract from its file name.
+
+        Args:
+            path: The extract path.
+
+        Returns:
+            The format.
+
+        Raises:
+            ValueError: If the suffix is not recognized.
+        """
+        name = path.name.lower()
+        if name.endswith(".pbf"):
+            return cls.PBF
+        if name.endswith((".osm", ".xml")):
+            return cls.XML
+        if name.endswith(".json"):
+            return cls.JSON
+        msg = f"cannot tell the format of {path.name}; pass it explicitly"
+        raise ValueError(msg)
+
+
+class OsmExtract(msgspec.Struct):
+    """Golf courses and places read from an extract."""
+
+    courses: list[tuple[float, float, dict[str, str]]] = msgspec.field(default_factory=list)
+    """``(lat, lon, tags)`` of every golf course, located at the center of its bounding box like Overpass does."""
+    places: list[tuple[float, float, str, str]] = msgspec.field(default_factory=list)
+    """``(lat, lon, place, name)`` of every named place node."""
+    bounds: Bounds | None = None
+    """The area the extract covers, if it declares one."""
+
+
+class ImportSummary(msgspec.Struct):
+    """Outcome of an import."""
+
+    courses: int
+    """Golf courses found in the extract."""
+    added: int
+    """Courses added to the ``courses`` table (the others were already there)."""
+    tiles: int
+    """Tiles seeded in the course tile cache."""
+
+
+class _Collector:
+    """Accumulates golf courses and places while an extract is streamed.
+
+    Ways are located by their node coordinates, relations by the bounding box of their member ways.
+    """
+
+    def __init__(self, member_ways: set[int] | None = None) -> None:
+        self.member_ways = member_ways or set()
+        self.extract = OsmExtract()
+        self.way_boxes: dict[int, Bounds] = {}
+        self.relations: list[tuple[list[int], dict[str, str]]] = []
+
+    def node(self, lat: float, lon: float, tags: dict[str, str]) -> None:
+        if tags.get("leisure") == "golf_course":
+            self.extract.courses.append((lat, lon, tags))
+        if (place := tags.get("place")) and (name := tags.get("name")):
+            self.extract.places.append((lat, lon, place, name))
+
+    def way(self, way_id: int, coords: list[tuple[float, float]], tags: dict[str, str]) -> None:
+        is_course = tags.get("leisure") == "golf_course"
+        if not coords or not (is_course or way_id in self.member_ways):
+            return
+        box = _bounding_box(coords)
+        if is_course:
+            self.extract.courses.append((*_center(box), tags))
+        if way_id in self.member_ways:
+            self.way_boxes[way_id] = box
+
+    def relation(self, member_ways: list[int], tags: dict[str, str]) -> None:
+        if tags.get("leisure") == "golf_course":
+            self.relations.append((member_ways, tags))
+
+    def finish(self, bounds: Bounds | None) -> OsmExtract:
+        for member_ways, tags in self.relations:
+            if boxes := [self.way_boxes[way_id] for way_id in member_ways if way_id in self.way_boxes]:
+                self.extract.courses.append((*_center(_merge_boxes(boxes)), tags))
+        self.extract.bounds = bounds
+        return self.extract
+
+
+def _bounding_box(coords: Iterable[tuple[float, float]]) -> Bounds:
+    lats, lons = zip(*coords, strict=True)
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def _merge_boxes(boxes: Iterable[Bounds]) -> Bounds:
+    min_lats, min_lons, max_lats, max_lons = zip(*boxes, strict=True)
+    return min(min_lats), min(min_lons), max(max_lats), max(max_lons)
+
+
+def _center(box: Bounds) -> tuple[float, float]:
+    return round((box[0] + box[2]) / 2, 7), round((box[1] + box[3]) / 2, 7)
+
+
+def read_extract(path: Path, file_format: OsmFormat | None = None) -> OsmExtract:
+    """Read the golf courses and places of an extract.
+
+    Args:
+        path: The extract path.
+        file_format: The extract format. Guessed from the file name by default.
+
+    Returns:
+        The golf courses and places.
+    """
+    file_format = file_format or OsmFormat.from_path(path)
+    if file_format is OsmFormat.PBF:
+        return _read_pbf(path)
+    if file_format is OsmFormat.XML:
+        return _read_xml(path)
+    return _read_overpass_json(path)
+
+
+def _read_pbf(path: Path) -> OsmExtract:
+    """Read a PBF extract with ``osmium``, in two passes when it contains golf course relations."""
+    try:
+        import osmium
+    except ImportError as e:
+        msg = "reading .osm.pbf extracts requires the 'osm' extra (pip install 'gobuddy[osm]')"
+        raise RuntimeError(msg) from e
+
+    member_ways: set[int] = set()
+    for relation in osmium.FileProcessor(str(path), osmium.osm.RELATION):
+        if relation.tags.get("leisure") == "golf_course":
+            member_ways.update(member.ref for member in relation.members if member.type == "w")
+
+    collector = _Collector(member_ways)
+    processor = osmium.FileProcessor(str(path)).with_locations()
+    for obj in processor:
+        tags = dict(obj.tags)
+        if obj.is_node():
+            if tags:
+                collector.node(obj.location.lat, obj.location.lon, tags)
+        elif obj.is_way():
+            collector.way(
+                obj.id, [(node.location.lat, node.location.lon) for node in obj.nodes if node.location.valid()], tags
+            )
+        elif obj.is_relation():
+            collector.relation([member.ref for member in obj.members if member.type == "w"], tags)
+
+    box = processor.header.box()
+    bounds = None
+    if box.valid():
+        bounds = box.bottom_left.lat, box.bottom_left.lon, box.top_right.lat, box.top_right.lon
+    return collector.finish(bounds)
+
+
+def _iter_xml(path: Path) -> Iterator[ET.Element]:
+    """Stream the top-level elements of an OSM XML file, freeing each one once it has been handled."""
+    context = ET.iterparse(path, events=("start", "end"))  # noqa: S314
+    _, root = next(context)
+    for event, element in context:
+        if event == "end" and element.tag in {"bounds", "node", "way", "relation"}:
+            yield element
+            root.clear()
+
+
+def _xml_tags(element: ET.Element) -> dict[str, str]:
+    return {tag.get("k", ""): tag.get("v", "") for tag in element.iter("tag")}
+
+
+def _scan_xml(path: Path) -> tuple[Bounds | None, set[int], set[int]]:
+    """Find the declared bounds, the golf course ways and the member ways of golf course relations."""
+    bounds: Bounds | None = None
+    course_ways: set[int] = set()
+    member_ways: set[int] = set()
+    for element in _iter_xml(path):
+        if element.tag == "bounds":
+            bounds = tuple(float(element.get(key, "nan")) for key in ("minlat", "minlon", "maxlat", "maxlon"))
+        elif element.tag == "way" and _xml_tags(element).get("leisure") == "golf_course":
+            course_ways.add(int(element.get("id", "0")))
+        elif element.tag == "relation" and _xml_tags(element).get("leisure") == "golf_course":
+            member_ways.update(int(m.get("ref", "0")) for m in element.iter("member") if m.get("type") == "way")
+    return bounds, course_ways, member_ways
+
+
+def _read_xml(path: Path) -> OsmExtract:
+    """Read an OSM XML extract.
+
+    Nodes come before the ways referencing them, so the file is streamed three times to keep only the
+    coordinates of the nodes that golf courses are made of in memory.
+    """
+    bounds, course_ways, member_ways = _scan_xml(path)
+    wanted = course_ways | member_ways
+    way_refs: dict[int, list[int]] = {}
+    for element in _iter_xml(path):
+        if element.tag == "way" and (way_id := int(element.get("id", "0"))) in wanted:
+            way_refs[way_id] = [int(nd.get("ref", "0")) for nd in element.iter("nd")]
+    needed = {ref for refs in way_refs.values() for ref in refs}
+
+    collector = _Collector(member_ways)
+    locations: dict[int, tuple[float, float]] = {}
+    for element in _iter_xml(path):
+        if element.tag == "node":
+            lat, lon = float(element.get("lat", "nan")), float(element.get("lon", "nan"))
+            if (node_id := int(element.get("id", "0"))) in needed:
+                locations[node_id] = (lat, lon)
+            if tags := _xml_tags(element):
+                collector.node(lat, lon, tags)
+        elif element.tag == "way" and (way_id := int(element.get("id", "0"))) in way_refs:
+            refs = way_refs[way_id]
+            collector.way(way_id, [locations[ref] for ref in refs if ref in locations], _xml_tags(element))
+        elif element.tag == "relation":
+            members = [int(m.get("ref", "0")) for m in element.iter("member") if m.get("type") == "way"]
+            collector.relation(members, _xml_tags(element))
+    return collector.finish(bounds if bounds and all(map(math.isfinite, bounds)) else None)
+
+
+def _read_overpass_json(path: Path) -> OsmExtract:
+    """Read a saved Overpass API JSON response.
+
+    Elements may carry their position as ``lat``/``lon``, ``center`` (``out center``), ``bounds``
+    (``out bb``), ``geometry`` (``out geom``) or node references resolved against the nodes of the
+    same response (``out body; >; out skel;``).
+    """
+    with path.open("rb") as f:
+        elements: list[dict[str, Any]] = json.load(f).get("elements", [])
+
+    locations = {e["id"]: (e["lat"], e["lon"]) for e in elements if e.get("type") == "node" and "lat" in e}
+    member_ways = {
+        member["ref"]
+        for e in elements
+        if e.get("type") == "relation" and e.get("tags", {}).get("leisure") == "golf_course"
+        for member in e.get("members", [])
+        if member.get("type") == "way"
+    }
+    collector = _Collector(member_ways)
+    for element in elements:
+        tags = element.get("tags", {})
+        position = _json_position(element)
+        if element.get("type") == "node":
+            if tags and "lat" in element:
+                collector.node(element["lat"], element["lon"], tags)
+        elif position is not None:
+            # Positioned by Overpass already, whatever the element type.
+            if tags.get("leisure") == "golf_course":
+                collector.extract.courses.append((round(position[0], 7), round(position[1], 7), tags))
+            if element.get("type") == "way" and element["id"] in member_ways and "bounds" in element:
+                b = element["bounds"]
+                collector.way_boxes[element["id"]] = (b["minlat"], b["minlon"], b["maxlat"], b["maxlon"])
+        elif element.get("type") == "way":
+            coords = [(p["lat"], p["lon"]) for p in element.get("geometry", [])] or [
+                locations[ref] for ref in element.get("nodes", []) if ref in locations
+            ]
+            collector.way(element["id"], coords, tags)
+        elif element.get("type") == "relation":
+            for member in element.get("members", []):
+                if member.get("type") == "way" and member.get("geometry"):
+                    coords = [(p["lat"], p["lon"]) for p in member["geometry"]]
+                    collector.way_boxes[member["ref"]] = _bounding_box(coords)
+            collector.relation([m["ref"] for m in element.get("members", []) if m.get("type") == "way"], tags)
+    return collector.finish(None)
+
+
+def _json_position(element: dict[str, Any]) -> tuple[float, float] | None:
+    """Get the position Overpass reported for a way or relation, if any."""
+    if element.get("type") == "node":
+        return None
+    if center := element.get("center"):
+        return center["lat"], center["lon"]
+    if bounds := element.get("bounds"):
+        return _center((bounds["minlat"], bounds["minlon"], bounds["maxlat"], bounds["maxlon"]))
+    return None
+
+
+class _PlaceIndex:
+    """Nearest-place lookups over the place nodes of an extract, bucketed by latitude."""
+
+    def __init__(self, places: Iterable[tuple[float, float, str]]) -> None:
+        ordered = sorted(places)
+        self.coords = np.array([(lat, lon) for lat, lon, _ in ordered], dtype=np.float64).reshape(-1, 2)
+        self.names = [name for _, _, name in ordered]
+
+    def nearest(self, lat: float, lon: float, radius: float) -> str | None:
+        """Get the name of the nearest place within ``radius`` meters, if any."""
+        delta = radius / METERS_PER_DEGREE_LAT_MIN
+        start, stop = np.searchsorted(self.coords[:, 0], (lat - delta, lat + delta))
+        if start == stop:
+            return None
+        meters = distance_matrix([(lat, lon)], self.coords[start:stop], "haversine")[0] * METERS_PER_MILE
+        best = int(np.argmin(meters))
+        return self.names[start + best] if meters[best] <= radius else None
+
+
+def resolve_courses(extract: OsmExtract) -> list[Course]:
+    """Name the golf courses of an extract and resolve their cities without any network lookup.
+
+    Names come from the course tags, then from the nearest locality, suburb, neighbourhood or hamlet
+    within :data:`NEARBY_RADIUS`, like the online lookup. Cities come from the address tags, then from
+    the nearest city, town or village within :data:`SETTLEMENT_RADIUS` (the online lookup uses the
+    enclosing administrative boundary, which an extract's place nodes do not describe).
+
+    Args:
+        extract: The extract.
+
+    Returns:
+        The courses.
+    """
+    nearby = _PlaceIndex((lat, lon, name) for lat, lon, place, name in extract.places if place in NEARBY_PLACES)
+    settlements = _PlaceIndex((lat, lon, name) for lat, lon, place, name in extract.places if place in SETTLEMENTS)
+    courses = []
+    for lat, lon, tags in extract.courses:
+        name = (
+            get_name_from_tags(tags)
+            or nearby.nearest(lat, lon, NEARBY_RADIUS)
+            or tags.get("leisure", "Unknown").capitalize()
+        )
+        city = get_city_from_tags(tags) or settlements.nearest(lat, lon, SETTLEMENT_RADIUS) or UNKNOWN_CITY
+        courses.append(
+            Course(
+                name=name,
+                lat=lat,
+                lon=lon,
+                city=city,
+                access=tags.get("access", "unknown"),
+            )
+        )
+    return courses
+
+
+def tiles_within(bounds: Bounds, zoom: int | None = None) -> list[Tile]:
+    """Get the tiles lying entirely within a bounding box.
+
+    Args:
+        bounds: The ``(min_lat, min_lon, max_lat, max_lon)`` bounding box.
+        zoom: The tile zoom level. Defaults to ``GEO_TILE_ZOOM``.
+
+    Returns:
+        The tiles.
+    """
+    min_lat, min_lon, max_lat, max_lon = bounds
+    zoom, west, north = tile_for(max_lat, min_lon, zoom)
+    _, east, south = tile_for(min_lat, max_lon, zoom)
+    tiles = []
+    for x in range(west, east + 1):
+        for y in range(north, south + 1):
+            south_lat, west_lon, north_lat, east_lon = tile_bounds((zoom, x, y))
+            if (
+                south_lat >= min_lat - BOUNDS_TOLERANCE
+                and north_lat <= max_lat + BOUNDS_TOLERANCE
+                and west_lon >= min_lon - BOUNDS_TOLERANCE
+                and east_lon <= max_lon + BOUNDS_TOLERANCE
+            ):
+                tiles.append((zoom, x, y))
+    return tiles
+
+
+def import_courses(
+    path: Path,
+    file_format: OsmFormat | None = None,
+    bounds: Bounds | None = None,
+    *,
+    seed_tiles: bool = True,
+) -> ImportSummary:
+    """Import the golf courses of an extract into the ``courses`` table and the course tile cache.
+
+    Only tiles lying entirely within the covered area are seeded, since the extract says nothing about
+    the rest of a partially covered tile. Courses already in the ``courses`` table at the same position
+    are updated instead of added again.
+
+    Args:
+        path: The extract path.
+        file_format: The extract format. Guessed from the file name by default.
+        bounds: The ``(min_lat, min_lon, max_lat, max_lon)`` area the extract covers completely. Defaults
+            to the bounds the extract declares; clipped extracts such as a single state should pass the
+            box they are complete for instead.
+        seed_tiles: Whether to seed the course tile cache.
+
+    Returns:
+        What was imported.
+    """
+    extract = read_extract(path, file_format)
+    courses = resolve_courses(extract)
+    logger.info("read %d golf courses and %d places from %s", len(courses), len(extract.places), path)
+
+    bounds = bounds or extract.bounds
+    courses_by_tile: dict[Tile, list[Course]] = {}
+    if seed_tiles and bounds:
+        courses_by_tile = {tile: [] for tile in tiles_within(bounds)}
+        for course in courses:
+            if (tile := tile_for(course.lat, course.lon)) in courses_by_tile:
+                courses_by_tile[tile].append(course)
+
+    with transaction() as conn:
+        before = conn.execute("SELECT count(*) FROM courses").fetchone()[0]
+        upsert_courses(courses)
+        added = conn.execute("SELECT count(*) FROM courses").fetchone()[0] - before
+        store_tiles(courses_by_tile)
+
+    return ImportSummary(courses=len(courses), added=added, tiles=len(courses_by_tile))
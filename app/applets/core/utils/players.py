@@ -1,21 +1,24 @@
 """Player utils."""
 
-from itertools import combinations
+import asyncio
 from typing import Final
 
-from geopy.distance import geodesic
+from geopy.exc import GeocoderTimedOut
 from structlog import get_logger
 
-from app.applets.core.db import get_db_connection
-from app.applets.core.schemas import Player
-from app.applets.core.utils.geo import geocode_address
+from app.applets.core.db import contains_pattern, get_db_connection, run_in_db, transaction
+from app.applets.core.schemas import Page, Player
+from app.applets.core.utils.cache import MISSING, expired, geocode_memory
+from app.applets.core.utils.distance import player_distance_pairs
+from app.applets.core.utils.geo import geocode_uncached, refresh_geocodes, store_geocodes
+from app.applets.core.utils.metrics import cache_lookups
 
 MINIMUM_PLAYERS: Final[int] = 2
 
 logger = get_logger(__name__)
 
 
-def extract_players_from_form(form_data: dict[str, str]) -> list[Player]:
+async def extract_players_from_form(form_data: dict[str, str]) -> list[Player]:
     """Extract players from form data.
 
     Args:
@@ -26,7 +29,7 @@ def extract_players_from_form(form_data: dict[str, str]) -> list[Player]:
     """
     player_keys = [key for key in form_data if key.startswith("name")]
     num_players = len(player_keys)
-    players = []
+    entries = []
 
     for i in range(1, num_players + 1):
         player_id = form_data.get(f"id{i}")
@@ -36,35 +39,164 @@ def extract_players_from_form(form_data: dict[str, str]) -> list[Player]:
         if not name or not address:
             continue
 
-        player = fetch_or_add_player(player_id, name, address)
-        players.append(player)
+        entries.append((player_id, name, address))
 
-    return players
+    return await fetch_or_add_players(entries)
 
 
-def fetch_or_add_player(player_id: str | None, name: str, address: str) -> Player:
-    """Fetch or add a player to the database.
+async def fetch_or_add_players(entries: list[tuple[str | None, str, str]]) -> list[Player]:
+    """Fetch or add a batch of players to the database.
+
+    Known players and cached geocodes are looked up with one query each, only the remaining addresses
+    are geocoded (concurrently, within Nominatim's rate limit) and every new row is written in a single
+    transaction. Known players without coordinates are geocoded again once their address's entry
+    expires, and addresses cached past ``CACHE_TTL`` are geocoded again in the background.
 
     Args:
-        player_id: The player ID.
-        name: The player name.
-        address: The player address.
+        entries: ``(player_id, name, address)`` for each submitted player.
 
     Returns:
-        The player.
+        The players, in the order of ``entries``.
     """
-    if player_id:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, address, latitude, longitude FROM players WHERE id = ?", (player_id,))
-            if result := cursor.fetchone():
-                return Player(
-                    id=result[0],
-                    name=result[1],
-                    address=result[2],
-                    coord=(result[3], result[4]) if result[3] is not None and result[4] is not None else None,
-                )
-    return add_player(name, address)
+    if not entries:
+        return []
+    by_id, by_address, cached_coords, stale = await run_in_db(probe_players, entries)
+    refresh_geocodes(stale)
+
+    new_players: dict[str, str] = {}
+    unlocated: dict[str, None] = {}
+    for player_id, name, address in entries:
+        player = by_id.get(player_id) if player_id else None
+        if player is None and (player := by_address.get(address)) is None:
+            new_players.setdefault(address, name)
+        elif player.coord is None:
+            unlocated[player.address] = None
+
+    uncached = [address for address in {**dict.fromkeys(new_players), **unlocated} if address not in cached_coords]
+    geocoded: dict[str, tuple[float, float] | None] = {}
+    for address, result in zip(
+        uncached,
+        await asyncio.gather(*(geocode_uncached(address) for address in uncached), return_exceptions=True),
+        strict=True,
+    ):
+        if isinstance(result, GeocoderTimedOut):
+            # Not cached as not found, so that the address is geocoded again by the next search.
+            logger.warning("Geocoding timed out for %s", address)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            geocoded[address] = result
+    if new_players or geocoded:
+        stored = await run_in_db(
+            store_players,
+            [(name, address, cached_coords.get(address)) for address, name in new_players.items()],
+            geocoded,
+        )
+        by_address |= stored
+        by_id = {player_id: stored.get(player.address, player) for player_id, player in by_id.items()}
+
+    return [
+        by_id[player_id] if player_id and player_id in by_id else by_address[address]
+        for player_id, _, address in entries
+    ]
+
+
+def _player_from_row(row: tuple) -> Player:
+    """Build a player from an ``id, name, address, latitude, longitude`` row."""
+    return Player(
+        id=row[0],
+        name=row[1],
+        address=row[2],
+        coord=(row[3], row[4]) if row[3] is not None and row[4] is not None else None,
+    )
+
+
+def probe_players(
+    entries: list[tuple[str | None, str, str]],
+) -> tuple[dict[str, Player], dict[str, Player], dict[str, tuple[float, float] | None], list[str]]:
+    """Look up a batch of submitted players and their addresses' cached geocodes.
+
+    Args:
+        entries: ``(player_id, name, address)`` for each submitted player.
+
+    Returns:
+        Known players by id (as submitted) and by address; the cached coordinates by address, ``None``
+        for addresses cached as not found; and the addresses whose coordinates are past ``CACHE_TTL``.
+        Addresses cached as not found past ``CACHE_NEGATIVE_TTL`` are left out.
+    """
+    ids = sorted({player_id for player_id, _, _ in entries if player_id})
+    addresses = sorted({address for _, _, address in entries})
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT id, name, address, latitude, longitude FROM players
+            WHERE id IN ({", ".join("?" * len(ids))}) OR address IN ({", ".join("?" * len(addresses))})
+            """,  # noqa: S608
+            (*ids, *addresses),
+        )
+        players = [_player_from_row(row) for row in cursor.fetchall()]
+        by_id = {str(player.id): player for player in players if str(player.id) in ids}
+        by_address = {player.address: player for player in players}
+
+        wanted = sorted({*addresses, *(player.address for player in by_id.values())})
+        cached_coords = {address: coord for address in wanted if (coord := geocode_memory.get(address)) is not MISSING}
+        unknown = [address for address in wanted if address not in cached_coords]
+        cursor.execute(
+            f"SELECT address, latitude, longitude, cached_at FROM geocode_cache WHERE address IN ({', '.join('?' * len(unknown))})",  # noqa: S608
+            unknown,
+        )
+        stale = []
+        for address, latitude, longitude, cached_at in cursor.fetchall():
+            coord = (latitude, longitude) if latitude is not None else None
+            if not expired(cached_at, negative=coord is None):
+                cached_coords[address] = coord
+                geocode_memory.set(address, coord)
+            elif coord is not None:
+                cached_coords[address] = coord
+                stale.append(address)
+    if unknown:
+        hits = sum(address in cached_coords for address in unknown)
+        cache_lookups.inc("geocode_cache", "db", "hit", amount=hits)
+        cache_lookups.inc("geocode_cache", "db", "miss", amount=len(unknown) - hits)
+    if by_address:
+        logger.info("Players with addresses %s already exist", sorted(by_address))
+    if cached_coords:
+        logger.info("CACHED: using cache for %s", sorted(cached_coords))
+    return by_id, by_address, cached_coords, stale
+
+
+def store_players(
+    new_players: list[tuple[str, str, tuple[float, float] | None]],
+    geocoded: dict[str, tuple[float, float] | None],
+) -> dict[str, Player]:
+    """Write new players and freshly geocoded addresses in one transaction.
+
+    Args:
+        new_players: ``(name, address, coord)`` for each player to add, where the coordinates of
+            addresses in ``geocoded`` are taken from the geocode cache instead.
+        geocoded: Geocoded coordinates to cache by address, ``None`` for addresses not found. Known
+            players at these addresses are moved to them.
+
+    Returns:
+        The stored players, new or moved, by address.
+    """
+    with transaction() as conn:
+        coords = store_geocodes(geocoded)
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO players (name, address, latitude, longitude) VALUES (?, ?, ?, ?)",
+            [(name, address, *(coords.get(address, coord) or (None, None))) for name, address, coord in new_players],
+        )
+        addresses = sorted({*(address for _, address, _ in new_players), *coords})
+        cursor.execute(
+            f"""
+            SELECT id, name, address, latitude, longitude FROM players
+            WHERE address IN ({", ".join("?" * len(addresses))})
+            """,  # noqa: S608
+            addresses,
+        )
+        return {row[2]: _player_from_row(row) for row in cursor.fetchall()}
 
 
 def calculate_center_coordinates(user_coords: list[tuple[float, float]]) -> tuple[float, float]:
@@ -82,31 +214,6 @@ def calculate_center_coordinates(user_coords: list[tuple[float, float]]) -> tupl
     )
 
 
-def add_player(name: str, address: str) -> Player:
-    """Add a new player or retrieve existing one."""
-    # Check if player exists
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, address, latitude, longitude FROM players WHERE address = ?", (address,))
-        if result := cursor.fetchone():
-            logger.info("Player with address %s already exists", address)
-            return Player(
-                id=result[0],
-                name=result[1],
-                address=result[2],
-                coord=(result[3], result[4]) if result[3] and result[4] else None,
-            )
-
-        coord = geocode_address(address)
-
-        cursor.execute(
-            "INSERT INTO players (name, address, latitude, longitude) VALUES (?, ?, ?, ?)",
-            (name, address, coord[0] if coord else None, coord[1] if coord else None),
-        )
-        player_id = cursor.lastrowid
-        return Player(id=player_id, name=name, address=address, coord=coord)
-
-
 def get_cached_players() -> list[Player]:
     """Retrieve all cached players from the database."""
     with get_db_connection() as conn:
@@ -123,17 +230,28 @@ def get_cached_players() -> list[Player]:
         ]
 
 
-def calculate_total_distance(course_coord: tuple[float, float], user_coords: list[tuple[float, float]]) -> float:
-    """Calculate the total distance from a golf course to a list of user coordinates.
+def list_players(after: int = 0, limit: int = 100, *, name: str | None = None) -> Page[Player]:
+    """List stored players by id, one page at a time.
 
     Args:
-        course_coord: A tuple containing the latitude and longitude of the golf course.
-        user_coords: A list of tuples containing the latitude and longitude of each user.
+        after: Only list players with a greater id, i.e. the ``next_cursor`` of the previous page.
+        limit: Maximum number of players on the page.
+        name: Only list players whose name contains this text, ignoring case.
 
     Returns:
-        The total distance in miles from the golf course to all user coordinates
+        The page of players.
     """
-    return sum(geodesic(course_coord, user_coord).miles for user_coord in user_coords)
+    sql, parameters = "SELECT id, name, address, latitude, longitude FROM players WHERE id > ?", [after]
+    if name:
+        sql += " AND name LIKE ? ESCAPE '\\'"
+        parameters.append(contains_pattern(name))
+    with get_db_connection() as conn:
+        rows = conn.execute(f"{sql} ORDER BY id LIMIT ?", (*parameters, limit + 1)).fetchall()
+    players = [
+        Player(id=row[0], name=row[1], address=row[2], coord=(row[3], row[4]) if row[3] and row[4] else None)
+        for row in rows[:limit]
+    ]
+    return Page(items=players, next_cursor=players[-1].id if len(rows) > limit else None)
 
 
 def calculate_player_distances(
@@ -148,8 +266,4 @@ def calculate_player_distances(
     Returns:
         A list of dictionaries containing the names of the players and the distance between them.
     """
-    distances = []
-    for (i, coord1), (j, coord2) in combinations(enumerate(user_coords), 2):
-        distance = geodesic(coord1, coord2).miles
-        distances.append({"players": f"{names[i]} and {names[j]}", "distance": distance})
-    return distances
+    return player_distance_pairs(user_coords, names)
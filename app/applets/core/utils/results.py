@@ -0,0 +1,228 @@
+"""Remembered search results, so that a group searching again is answered without ranking the courses again.
+
+A result is kept by the normalized player set it was computed for and is served until it expires or
+until a course it shows, or any course within the search radius, changes.
+
+A search posted to ``/process`` is redirected to a ``GET /results/{token}`` page whose token carries its
+players, so that any worker can render the page. The page carries an ETag derived from its result, so
+that clients revalidating it get a ``304 Not Modified`` while the result is unchanged.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+from typing import TYPE_CHECKING
+
+import msgspec
+
+from app.__metadata__ import __version__
+from app.applets.core.db import current_revision, get_db_connection, run_in_db
+from app.applets.core.schemas import Player
+from app.applets.core.utils.cache import MISSING, result_memory
+from app.applets.core.utils.distance import METERS_PER_MILE, distance_matrix
+from app.applets.core.utils.singleflight import lookups
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Hashable
+
+    from app.applets.core.schemas import Course
+
+__all__ = (
+    "SearchResult",
+    "etag_matches",
+    "page_etag",
+    "read_results_token",
+    "remembered",
+    "result_key",
+    "results_token",
+)
+
+settings = get_settings()
+
+
+class SearchResult(msgspec.Struct, gc=False):
+    """The ranked courses of a search, as remembered."""
+
+    courses: list[Course]
+    enrichment_jobs: list[int]
+    digest: str
+    """Hash of the courses, the jobs and the revision they were found at, which page ETags derive from."""
+    revision: int
+    """The ``course_changes`` revision the courses are known to be current as of."""
+
+
+def result_key(players: list[Player], radius: int, limit: int | None) -> tuple[Hashable, ...]:
+    """Get the key of the result of a search, which does not depend on the order of the players.
+
+    Args:
+        players: The geocoded players of the search.
+        radius: The radius in meters the courses are searched within.
+        limit: Number of courses returned, ``None`` for all of them.
+
+    Returns:
+        The key.
+    """
+    located = sorted(
+        (round(player.coord[0], 6), round(player.coord[1], 6), player.name)
+        for player in players
+        if player.coord is not None
+    )
+    return ("results", radius, limit, str(settings.geo.DISTANCE_MODE), *located)
+
+
+async def remembered(
+    key: tuple[Hashable, ...],
+    center_coord: tuple[float, float],
+    radius: int,
+    search: Callable[[], Awaitable[tuple[list[Course], list[int]]]],
+) -> SearchResult:
+    """Get the remembered result of a search, or run the search and remember its result.
+
+    Concurrent searches of the same key share one run. The courses of the result must not be
+    changed afterwards, as they are shared by every request served from it.
+
+    Args:
+        key: The key of the search, see :func:`result_key`.
+        center_coord: The center of the search.
+        radius: The radius in meters the courses are searched within.
+        search: Finds the best courses and queues their enrichment.
+
+    Returns:
+        The result.
+    """
+    result = result_memory.get(key)
+    if (
+        result is not MISSING
+        and (revision := await run_in_db(_current_revision_of, result, center_coord, radius)) is not None
+    ):
+        result.revision = revision
+        return result
+
+    async def run() -> SearchResult:
+        revision = await run_in_db(_current_revision)
+        courses, jobs = await search()
+        result = SearchResult(courses, jobs, _digest(courses, jobs, revision), revision)
+        result_memory.set(key, result)
+        return result
+
+    return await lookups.do(key, run)
+
+
+def _current_revision() -> int:
+    with get_db_connection() as conn:
+        return current_revision(conn)
+
+
+def _current_revision_of(result: SearchResult, center_coord: tuple[float, float], radius: int) -> int | None:
+    """Check that a result is still current, returning the revision it is current as of, or ``None`` if not.
+
+    A result is current while none of its courses changed and no course moved into its search radius.
+    """
+    with get_db_connection() as conn:
+        revision = current_revision(conn)
+        if revision == result.revision:
+            return revision
+        oldest = conn.execute(
+            "SELECT min(revision) FROM course_changes WHERE revision > ?", (result.revision,)
+        ).fetchone()[0]
+        if oldest != result.revision + 1:
+            # A newer snapshot pruned the log past the result.
+            return None
+        rows = conn.execute(
+            """
+            SELECT change.id, c.latitude, c.longitude
+            FROM (SELECT DISTINCT id FROM course_changes WHERE revision > ? AND revision <= ?) AS change
+            LEFT JOIN courses AS c ON c.id = change.id
+            """,
+            (result.revision, revision),
+        ).fetchall()
+    shown = {course.id for course in result.courses}
+    if any(course_id in shown for course_id, _, _ in rows):
+        return None
+    moved = [(lat, lon) for _, lat, lon in rows if lat is not None and lon is not None]
+    if moved and (distance_matrix([center_coord], moved)[0] * METERS_PER_MILE <= radius).any():
+        return None
+    return revision
+
+
+def _digest(courses: list[Course], jobs: list[int], revision: int) -> str:
+    return hashlib.blake2b(msgspec.msgpack.encode((courses, jobs, revision)), digest_size=16).hexdigest()
+
+
+class _ResultsPage(msgspec.Struct, array_like=True, forbid_unknown_fields=True):
+    """The search a results page shows, as carried by its URL."""
+
+    players: list[tuple[str, float, float]]
+    """``(name, lat, lon)`` of each geocoded player, in the order they are shown."""
+    limit: int | None
+
+
+def results_token(players: list[Player], limit: int | None) -> str:
+    """Get the token of the results page of a search.
+
+    Args:
+        players: The geocoded players of the search, in the order they are shown.
+        limit: Number of courses shown, as requested.
+
+    Returns:
+        A URL-safe token.
+    """
+    page = _ResultsPage([(player.name, *player.coord) for player in players if player.coord is not None], limit)
+    return base64.urlsafe_b64encode(msgspec.msgpack.encode(page)).rstrip(b"=").decode()
+
+
+def read_results_token(token: str) -> tuple[list[Player], int | None]:
+    """Get the search a results page token stands for.
+
+    Args:
+        token: A token made by :func:`results_token`.
+
+    Returns:
+        The players, with their coordinates but not their addresses, and the number of courses shown.
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        page = msgspec.msgpack.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)), type=_ResultsPage)
+    except (binascii.Error, msgspec.DecodeError) as exc:
+        msg = "malformed results token"
+        raise ValueError(msg) from exc
+    if not page.players or (page.limit is not None and page.limit < 1):
+        msg = "malformed results token"
+        raise ValueError(msg)
+    return [Player(name, "", coord=(lat, lon)) for name, lat, lon in page.players], page.limit
+
+
+def page_etag(result: SearchResult, players: list[Player]) -> str:
+    """Get the ETag of the results page of a search.
+
+    Args:
+        result: The result shown.
+        players: The players of the search, in the order they are shown.
+
+    Returns:
+        A strong ETag, quoted.
+    """
+    digest = hashlib.blake2b(result.digest.encode(), digest_size=16)
+    digest.update(msgspec.msgpack.encode((__version__, [(player.name, player.coord) for player in players])))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check whether an ``If-None-Match`` header matches an ETag, using the weak comparison it calls for.
+
+    Args:
+        if_none_match: The header value, if any.
+        etag: The ETag of the current page.
+
+    Returns:
+        Whether the client already holds the page.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
@@ -0,0 +1,166 @@
+"""Coalescing of identical in-flight upstream lookups."""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import weakref
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from structlog import get_logger
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Hashable, Iterable
+
+__all__ = ("SingleFlight", "lookups", "normalize_address")
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """Share one in-flight call between all concurrent callers asking for the same key.
+
+    The shared call runs as its own task, so a caller that is cancelled (for instance because its
+    client disconnected) does not cancel the work the other callers are waiting on. Keys are
+    ``(kind, ...)`` tuples; ``kind`` is used to label the counters.
+    """
+
+    def __init__(self) -> None:
+        """Create a single-flight group."""
+        self.counters: Counter[tuple[str, str]] = Counter()
+        """Calls per ``(kind, "leader" | "shared" | "refresh")``; ``shared`` calls awaited another caller's
+        result and ``refresh`` calls were started in the background."""
+        self._loop_calls: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[Hashable, asyncio.Future]] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _calls(self) -> dict[Hashable, asyncio.Future]:
+        """Get the in-flight calls of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if (calls := self._loop_calls.get(loop)) is None:
+            calls = self._loop_calls[loop] = {}
+        return calls
+
+    def _track(self, keys: Iterable[Hashable], future: asyncio.Future) -> None:
+        """Register ``future`` as the in-flight call for ``keys`` until it completes."""
+        calls = self._calls()
+        keys = list(keys)
+        for key in keys:
+            calls[key] = future
+
+        def forget(done: asyncio.Future) -> None:
+            for key in keys:
+                if calls.get(key) is done:
+                    del calls[key]
+            if not done.cancelled():
+                done.exception()  # Mark it retrieved even if every caller went away.
+
+        future.add_done_callback(forget)
+
+    async def do[T](self, key: tuple[Hashable, ...], func: Callable[[], Awaitable[T]]) -> T:
+        """Run ``func``, or join the call already in flight for ``key``.
+
+        Args:
+            key: The normalized lookup key, starting with the lookup kind.
+            func: Starts the lookup when no call is in flight for ``key``.
+
+        Returns:
+            The result of the shared call.
+        """
+        calls = self._calls()
+        if (future := calls.get(key)) is None:
+            self.counters[str(key[0]), "leader"] += 1
+            future = asyncio.ensure_future(func())
+            self._track([key], future)
+        else:
+            self.counters[str(key[0]), "shared"] += 1
+        return await asyncio.shield(future)
+
+    async def do_many[K: Hashable, T](
+        self, kind: str, keys: Iterable[K], func: Callable[[list[K]], Awaitable[dict[K, T]]]
+    ) -> dict[K, T]:
+        """Resolve a batch of keys, joining calls in flight for some and running one call for the rest.
+
+        Args:
+            kind: The lookup kind.
+            keys: The keys to resolve.
+            func: Resolves the keys that are not in flight yet, returning a value for each of them.
+
+        Returns:
+            A value for every key.
+        """
+        calls = self._calls()
+        joined: dict[asyncio.Future, list[K]] = {}
+        own: list[K] = []
+        for key in dict.fromkeys(keys):
+            if (future := calls.get((kind, key))) is None:
+                own.append(key)
+            else:
+                joined.setdefault(future, []).append(key)
+        if own:
+            self.counters[kind, "leader"] += len(own)
+            future = asyncio.ensure_future(func(own))
+            self._track([(kind, key) for key in own], future)
+            joined[future] = own
+        self.counters[kind, "shared"] += sum(len(batch) for batch in joined.values()) - len(own)
+
+        results: dict[K, T] = {}
+        for future, values in zip(joined, await asyncio.gather(*map(asyncio.shield, joined)), strict=True):
+            results.update({key: values[key] for key in joined[future]})
+        return results
+
+    def refresh(self, key: tuple[Hashable, ...], func: Callable[[], Awaitable[object]]) -> None:
+        """Start ``func`` in the background unless a call is in flight for ``key``, without waiting for it.
+
+        Used to refresh a stale cache entry while it is served. Callers asking for ``key`` meanwhile
+        join the refresh; its failure is logged.
+
+        Args:
+            key: The normalized lookup key, starting with the lookup kind.
+            func: Refreshes the entry.
+        """
+        calls = self._calls()
+        if key in calls:
+            return
+        self.counters[str(key[0]), "refresh"] += 1
+        self._track([key], asyncio.ensure_future(_logging_failure(func(), key[0])))
+
+    def refresh_many[K: Hashable](
+        self, kind: str, keys: Iterable[K], func: Callable[[list[K]], Awaitable[object]]
+    ) -> None:
+        """Start refreshing the keys that are not in flight in the background, with one call, as by :meth:`refresh`.
+
+        Args:
+            kind: The lookup kind.
+            keys: The keys to refresh.
+            func: Refreshes the entries of the keys it is given.
+        """
+        calls = self._calls()
+        if own := [key for key in dict.fromkeys(keys) if (kind, key) not in calls]:
+            self.counters[kind, "refresh"] += len(own)
+            self._track([(kind, key) for key in own], asyncio.ensure_future(_logging_failure(func(own), kind)))
+
+
+async def _logging_failure[T](call: Awaitable[T], kind: Hashable) -> T:
+    try:
+        return await call
+    except Exception:
+        logger.exception("refreshing a stale %s entry failed", kind)
+        raise
+
+
+def normalize_address(address: str) -> str:
+    """Normalize an address for coalescing lookups that differ only in case or whitespace.
+
+    Args:
+        address: The address as submitted.
+
+    Returns:
+        The normalized address.
+    """
+    return re.sub(r"\s+", " ", address).strip().casefold()
+
+
+lookups = SingleFlight()
+"""Single-flight group shared by every upstream geo lookup in this worker."""
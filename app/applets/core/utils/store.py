@@ -0,0 +1,594 @@
+"""Columnar in-memory copy of the ``courses`` table.
+
+Searches and the ``/courses`` listing read courses from a :class:`CourseStore` instead of building
+them from SQLite rows or tile blobs on every request. The store keeps the ids and coordinates of all
+courses in contiguous NumPy arrays, with names, cities and access values interned in a string table,
+and only the courses a request returns become :class:`~app.applets.core.schemas.Course` objects.
+
+The store is built when the app starts and written to a snapshot file next to the database, which
+every worker process maps read-only, so the operating system keeps a single copy of it for all of
+them. The ``course_changes`` log records every write to ``courses``; before answering, a store
+applies the changes made since its snapshot, by any process, to a small private delta.
+"""
+
+from __future__ import annotations
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, NamedTuple
+
+import msgspec
+import numpy as np
+from structlog import get_logger
+
+from app.applets.core import db
+from app.applets.core.db import current_revision, get_db_connection
+from app.applets.core.schemas import Course, Page, StoredCourse
+from app.applets.core.utils.distance import METERS_PER_MILE, bounding_boxes, distance_matrix
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from litestar.config.app import AppConfig
+    from numpy.typing import NDArray
+
+__all__ = (
+    "CourseStore",
+    "courses_within",
+    "get_course_store",
+    "list_courses",
+    "load_course_store",
+    "snapshot_path",
+)
+
+logger = get_logger(__name__)
+settings = get_settings()
+
+SNAPSHOT_MAGIC: Final[bytes] = b"GBCOURS1"
+"""First bytes of a snapshot file, followed by the length of its JSON header."""
+SNAPSHOT_ALIGNMENT: Final[int] = 64
+"""Byte alignment of the arrays in a snapshot file."""
+REBUILD_AFTER_CHANGES: Final[int] = 10_000
+"""Changes a snapshot may lag behind the database before it is rebuilt; fewer are applied as a delta."""
+NO_STRING: Final[int] = -1
+"""String index of a missing city or access value."""
+
+
+class Columns(NamedTuple):
+    """Courses as parallel arrays, ordered by id."""
+
+    ids: NDArray[np.int64]
+    lat: NDArray[np.float64]
+    lon: NDArray[np.float64]
+    name: NDArray[np.int32]
+    city: NDArray[np.int32]
+    access: NDArray[np.int32]
+
+
+COLUMN_TYPES: Final[Columns] = Columns(np.int64, np.float64, np.float64, np.int32, np.int32, np.int32)
+
+
+def _columns(rows: Iterable[tuple]) -> Columns:
+    """Build columns from ``(id, lat, lon, name, city, access)`` tuples with interned strings."""
+    rows = list(rows)
+    if not rows:
+        return Columns(*(np.empty(0, dtype) for dtype in COLUMN_TYPES))
+    return Columns(
+        *(np.array(column, dtype) for column, dtype in zip(zip(*rows, strict=True), COLUMN_TYPES, strict=True))
+    )
+
+
+class Strings:
+    """The interned strings of a store: those of its snapshot, followed by the strings added since.
+
+    Snapshot strings stay encoded in the (possibly shared) buffer and are decoded on first use.
+    """
+
+    def __init__(self, blob: memoryview | bytes, offsets: NDArray[np.int64]) -> None:
+        """Wrap an encoded string table.
+
+        Args:
+            blob: The UTF-8 strings, back to back.
+            offsets: Where each string starts in ``blob``, followed by the end of the last one.
+        """
+        self._blob = memoryview(blob)
+        self._offsets = offsets
+        self._bounds = memoryview(offsets)
+        self._count = len(offsets) - 1
+        self._decoded: list[str | None] = [None] * self._count
+        self._added: list[str] = []
+        self._indexes: dict[str, int] = {}
+        self._folded: bytes | None = None
+
+    def __getitem__(self, index: int) -> str | None:
+        """Get a string by index, ``None`` for :data:`NO_STRING`."""
+        if index < 0:
+            return None
+        if index >= self._count:
+            return self._added[index - self._count]
+        if (text := self._decoded[index]) is None:
+            text = self._decoded[index] = str(self._blob[self._bounds[index] : self._bounds[index + 1]], "utf-8")
+        return text
+
+    def add(self, text: str | None) -> int:
+        """Intern a string that is not part of the snapshot.
+
+        Args:
+            text: The string, or ``None``.
+
+        Returns:
+            Its index.
+        """
+        if text is None:
+            return NO_STRING
+        if (index := self._indexes.get(text)) is None:
+            index = self._indexes[text] = self._count + len(self._added)
+            self._added.append(text)
+        return index
+
+    def containing(self, text: str) -> NDArray[np.int32]:
+        """Find the strings containing a text, ignoring ASCII case like SQLite's ``LIKE``.
+
+        Args:
+            text: The text to look for.
+
+        Returns:
+            The indexes of the matching strings.
+        """
+        needle = text.encode().lower()
+        if self._folded is None:
+            self._folded = bytes(self._blob).lower()
+        found = []
+        start = self._folded.find(needle)
+        while start != -1:
+            index = bisect.bisect_right(self._bounds, start) - 1
+            if start + len(needle) <= self._bounds[index + 1]:
+                found.append(index)
+                start = self._bounds[index + 1]
+            else:
+                start += 1
+            start = self._folded.find(needle, start)
+        found += [self._count + i for i, added in enumerate(self._added) if needle in added.encode().lower()]
+        return np.array(found, np.int32)
+
+    def table(self) -> tuple[NDArray[np.uint8], NDArray[np.int64]]:
+        """Get the encoded strings the table was created with, as arrays.
+
+        Returns:
+            The blob and the offsets.
+        """
+        return np.frombuffer(self._blob, np.uint8), self._offsets
+
+    @staticmethod
+    def encode(strings: Iterable[str]) -> tuple[bytes, NDArray[np.int64]]:
+        """Encode strings into a table for :class:`Strings`.
+
+        Args:
+            strings: The strings, in index order.
+
+        Returns:
+            The blob and the offsets.
+        """
+        encoded = [text.encode() for text in strings]
+        offsets = np.zeros(len(encoded) + 1, np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return b"".join(encoded), offsets
+
+
+class _View(NamedTuple):
+    """The state of a store as of a revision; replaced as a whole when changes are applied."""
+
+    base: Columns
+    """The courses of the snapshot."""
+    live: NDArray[np.bool_] | None
+    """Which ``base`` rows are still current, ``None`` while all of them are."""
+    delta: Columns
+    """The courses added or changed since the snapshot."""
+    revision: int
+
+
+class _SnapshotHeader(msgspec.Struct):
+    revision: int
+    arrays: dict[str, tuple[str, int, int]]
+    """``(dtype, offset, length)`` of every array, by name."""
+
+
+class CourseStore:
+    """All known courses, as columns, kept in step with the ``courses`` table."""
+
+    def __init__(self, database: str, base: Columns, strings: Strings, revision: int) -> None:
+        """Create a store.
+
+        Args:
+            database: Path of the database the store mirrors.
+            base: The courses as of ``revision``.
+            strings: The string table the columns index into.
+            revision: The ``course_changes`` revision the courses are current as of.
+        """
+        self.database = database
+        self.strings = strings
+        self.snapshot_revision = revision
+        self._view = _View(base, None, _columns(()), revision)
+        self._changed: dict[int, tuple | None] = {}
+        self._lock = threading.Lock()
+        self._behind = False
+
+    @property
+    def revision(self) -> int:
+        """The revision of the last applied change."""
+        return self._view.revision
+
+    @property
+    def stale(self) -> bool:
+        """Whether the store should be rebuilt, because its delta outgrew the snapshot or it cannot catch up."""
+        return self._behind or self.revision - self.snapshot_revision > REBUILD_AFTER_CHANGES
+
+    def __len__(self) -> int:
+        """Count the courses."""
+        view = self._view
+        live = len(view.base.ids) if view.live is None else int(view.live.sum())
+        return live + len(view.delta.ids)
+
+    @classmethod
+    def from_database(cls) -> CourseStore:
+        """Build a private store from the ``courses`` table.
+
+        Returns:
+            The store.
+        """
+        with get_db_connection() as conn:
+            # Read before the rows, so that changes racing the read are applied again rather than missed.
+            revision = current_revision(conn)
+            rows = conn.execute(
+                "SELECT id, latitude, longitude, name, city, access FROM courses ORDER BY id"
+            ).fetchall()
+        interned: dict[str, int] = {}
+
+        def intern(text: str | None) -> int:
+            return NO_STRING if text is None else interned.setdefault(text, len(interned))
+
+        base = _columns((row[0], row[1], row[2], intern(row[3]), intern(row[4]), intern(row[5])) for row in rows)
+        return cls(db.DATABASE_FILE, base, Strings(*Strings.encode(interned)), revision)
+
+    @classmethod
+    def from_snapshot(cls, path: Path) -> CourseStore:
+        """Map a snapshot written by :meth:`save`.
+
+        Args:
+            path: The snapshot file.
+
+        Returns:
+            The store, whose arrays are read-only views of the shared mapping.
+
+        Raises:
+            ValueError: If the file is not a snapshot.
+        """
+        with path.open("rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        if mapped[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            msg = f"{path} is not a course snapshot"
+            raise ValueError(msg)
+        (length,) = struct.unpack_from("<Q", mapped, len(SNAPSHOT_MAGIC))
+        try:
+            header = msgspec.json.decode(mapped[header_start : header_start + length], type=_SnapshotHeader)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+        start = _aligned(header_start + length)
+        arrays = {
+            name: np.frombuffer(mapped, np.dtype(dtype), count, start + offset)
+            for name, (dtype, offset, count) in header.arrays.items()
+        }
+        base = Columns(*(arrays[name] for name in Columns._fields))
+        return cls(db.DATABASE_FILE, base, Strings(arrays["strings"], arrays["offsets"]), header.revision)
+
+    def save(self, path: Path) -> None:
+        """Write the snapshot courses and strings of a store built by :meth:`from_database` to a file.
+
+        The file is replaced atomically, so that processes mapping the previous one keep a consistent view.
+
+        Args:
+            path: The snapshot file.
+        """
+        blob, offsets = self.strings.table()
+        arrays = {**self._view.base._asdict(), "strings": blob, "offsets": offsets}
+        layout, position = {}, 0
+        for name, array in arrays.items():
+            layout[name] = (array.dtype.str, position, len(array))
+            position = _aligned(position + array.nbytes)
+        header = msgspec.json.encode(_SnapshotHeader(self.snapshot_revision, layout))
+        header_end = len(SNAPSHOT_MAGIC) + 8 + len(header)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with temporary.open("wb") as file:
+            file.write(SNAPSHOT_MAGIC + struct.pack("<Q", len(header)) + header)
+            file.write(bytes(_aligned(header_end) - header_end))
+            for array in arrays.values():
+                file.write(array.tobytes())
+                file.write(bytes(_aligned(array.nbytes) - array.nbytes))
+        temporary.replace(path)
+
+    def refresh(self) -> None:
+        """Apply the changes to ``courses`` made since the store was last refreshed, by any process."""
+        with get_db_connection() as conn:
+            if current_revision(conn) == self._view.revision:
+                return
+            with self._lock:
+                view = self._view
+                revision = current_revision(conn)
+                oldest = conn.execute(
+                    "SELECT min(revision) FROM course_changes WHERE revision > ?", (view.revision,)
+                ).fetchone()[0]
+                if oldest != view.revision + 1:
+                    # A newer snapshot pruned the log past this store.
+                    self._behind = True
+                    return
+                rows = conn.execute(
+                    """
+                    SELECT change.id, c.latitude, c.longitude, c.name, c.city, c.access
+                    FROM (SELECT DISTINCT id FROM course_changes WHERE revision > ? AND revision <= ?) AS change
+                    LEFT JOIN courses AS c ON c.id = change.id
+                    """,
+                    (view.revision, revision),
+                ).fetchall()
+                self._apply(rows, revision)
+
+    def _apply(self, rows: list[tuple], revision: int) -> None:
+        """Build the view of a revision from its changed rows.
+
+        Args:
+            rows: ``(id, lat, lon, name, city, access)`` of every changed course, with ``None`` values
+                for deleted ones.
+            revision: The revision of the last change.
+        """
+        view, add = self._view, self.strings.add
+        for course_id, lat, lon, name, city, access in rows:
+            self._changed[course_id] = None if name is None else (lat, lon, add(name), add(city), add(access))
+
+        ids = np.array([row[0] for row in rows], np.int64)
+        positions = np.searchsorted(view.base.ids, ids)
+        inside = positions < len(view.base.ids)
+        positions = positions[inside][view.base.ids[positions[inside]] == ids[inside]]
+        live = view.live
+        if positions.size:
+            live = np.ones(len(view.base.ids), np.bool_) if live is None else live.copy()
+            live[positions] = False
+        delta = _columns((course_id, *row) for course_id, row in sorted(self._changed.items()) if row is not None)
+        self._view = _View(view.base, live, delta, revision)
+
+    def _parts(self) -> Iterator[tuple[Columns, NDArray[np.bool_] | None]]:
+        """Get the columns of the current view with the mask of their current rows."""
+        view = self._view
+        yield view.base, view.live
+        yield view.delta, None
+
+    def within(self, center_coord: tuple[float, float], radius: float) -> list[Course]:
+        """Get the courses within a radius of a point.
+
+        Args:
+            center_coord: A tuple containing the latitude and longitude of the center coordinate.
+            radius: The radius in meters around the center coordinate.
+
+        Returns:
+            New course objects, ordered by id.
+        """
+        courses = []
+        for columns, live in self._parts():
+            index = _in_radius(
+                columns, _matching(columns, live, bounding_boxes(center_coord, radius)), center_coord, radius
+            )
+            courses += self._courses(columns, index)
+        courses.sort(key=lambda course: course.id)
+        return courses
+
+    def page(
+        self,
+        after: int = 0,
+        limit: int = 100,
+        *,
+        name: str | None = None,
+        bbox: tuple[float, float, float, float] | None = None,
+        center_coord: tuple[float, float] | None = None,
+        radius: float | None = None,
+    ) -> Page[StoredCourse]:
+        """List courses by id, one page at a time.
+
+        Takes the arguments of :func:`list_courses`.
+
+        Returns:
+            The page of courses.
+        """
+        names = self.strings.containing(name) if name else None
+        found: list[tuple[int, Columns, int]] = []
+        for columns, live in self._parts():
+            mask = _matching(columns, live, [bbox] if bbox else None) & (columns.ids > after)
+            if names is not None:
+                mask &= np.isin(columns.name, names)
+            if center_coord is not None and radius is not None:
+                mask &= _matching(columns, None, bounding_boxes(center_coord, radius))
+                index = _in_radius(columns, mask, center_coord, radius)
+            else:
+                index = np.flatnonzero(mask)
+            # One course beyond the page tells whether there is a next one.
+            index = index[: limit + 1]
+            found += zip(columns.ids[index].tolist(), [columns] * len(index), index.tolist(), strict=True)
+        found.sort(key=lambda entry: entry[0])
+        strings = self.strings
+        items = [
+            StoredCourse(
+                id=course_id,
+                name=strings[int(columns.name[row])],
+                lat=float(columns.lat[row]),
+                lon=float(columns.lon[row]),
+                city=strings[int(columns.city[row])],
+                access=strings[int(columns.access[row])],
+            )
+            for course_id, columns, row in found[:limit]
+        ]
+        return Page(items=items, next_cursor=items[-1].id if len(found) > limit else None)
+
+    def _courses(self, columns: Columns, index: NDArray[np.intp]) -> list[Course]:
+        """Build course objects from rows of the columns."""
+        strings = self.strings
+        return [
+            Course(name=strings[name], lat=lat, lon=lon, city=strings[city], access=strings[access], id=course_id)
+            for course_id, lat, lon, name, city, access in zip(
+                *(column[index].tolist() for column in columns), strict=True
+            )
+        ]
+
+
+def _aligned(size: int) -> int:
+    """Round a size up to :data:`SNAPSHOT_ALIGNMENT`."""
+    return -(-size // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def _matching(
+    columns: Columns, live: NDArray[np.bool_] | None, boxes: list[tuple[float, float, float, float]] | None
+) -> NDArray[np.bool_]:
+    """Mask the current rows inside any of the ``(min_lat, min_lon, max_lat, max_lon)`` boxes, if any are given."""
+    mask = np.ones(len(columns.ids), np.bool_) if live is None else live.copy()
+    if boxes:
+        inside = np.zeros(len(columns.ids), np.bool_)
+        for min_lat, min_lon, max_lat, max_lon in boxes:
+            inside |= (
+                (columns.lat >= min_lat)
+                & (columns.lat <= max_lat)
+                & (columns.lon >= min_lon)
+                & (columns.lon <= max_lon)
+            )
+        mask &= inside
+    return mask
+
+
+def _in_radius(
+    columns: Columns, mask: NDArray[np.bool_], center_coord: tuple[float, float], radius: float
+) -> NDArray[np.intp]:
+    """Get the rows of a mask that lie within a radius of a point."""
+    index = np.flatnonzero(mask)
+    if not index.size:
+        return index
+    miles = distance_matrix([center_coord], np.column_stack((columns.lat[index], columns.lon[index])))[0]
+    return index[miles * METERS_PER_MILE <= radius]
+
+
+def snapshot_path() -> Path:
+    """Get the path of the snapshot file of the current database.
+
+    Returns:
+        The path, next to the database file.
+    """
+    return Path(f"{db.DATABASE_FILE}-courses")
+
+
+def _load() -> CourseStore:
+    """Map the snapshot of the current database, rebuilding it first when it is missing or too far behind."""
+    if not settings.db.COURSE_SNAPSHOT:
+        store = CourseStore.from_database()
+    else:
+        path = snapshot_path()
+        try:
+            store = CourseStore.from_snapshot(path)
+        except (OSError, ValueError):
+            store = None
+        with get_db_connection() as conn:
+            revision = current_revision(conn)
+        if store is None or not 0 <= revision - store.revision <= REBUILD_AFTER_CHANGES:
+            CourseStore.from_database().save(path)
+            store = CourseStore.from_snapshot(path)
+            with get_db_connection() as conn:
+                # Stores older than the snapshot rebuild from it instead of replaying the log.
+                conn.execute("DELETE FROM course_changes WHERE revision <= ?", (store.revision,))
+            logger.info("wrote a snapshot of %d courses to %s", len(store), path)
+    store.refresh()
+    return store
+
+
+_store: CourseStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_course_store() -> CourseStore:
+    """Get this worker's course store, loading it on first use and after it went stale.
+
+    Returns:
+        The course store, with the latest changes applied.
+    """
+    global _store  # noqa: PLW0603
+    with _store_lock:
+        if _store is None or _store.database != db.DATABASE_FILE:
+            _store = _load()
+        store = _store
+    store.refresh()
+    if store.stale:
+        with _store_lock:
+            if _store is store:
+                _store = _load()
+            store = _store
+    return store
+
+
+def _reset_store_after_fork() -> None:
+    """Give a forked worker its own lock; the mapped snapshot itself is shared as is."""
+    global _store_lock  # noqa: PLW0603
+    _store_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_store_after_fork)
+
+
+def load_course_store(app_config: AppConfig) -> AppConfig:
+    """Load the course store of this worker.
+
+    Called on app init by the Litestar constructor, after the database is initialized.
+
+    Args:
+        app_config: The app configuration.
+
+    Returns:
+        The app configuration.
+    """
+    get_course_store()
+    return app_config
+
+
+def courses_within(center_coord: tuple[float, float], radius: float) -> list[Course]:
+    """Get the known courses within a radius of a point.
+
+    Args:
+        center_coord: A tuple containing the latitude and longitude of the center coordinate.
+        radius: The radius in meters around the center coordinate.
+
+    Returns:
+        New course objects, which the caller may update.
+    """
+    return get_course_store().within(center_coord, radius)
+
+
+def list_courses(
+    after: int = 0,
+    limit: int = 100,
+    *,
+    name: str | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+    center_coord: tuple[float, float] | None = None,
+    radius: float | None = None,
+) -> Page[StoredCourse]:
+    """List known courses by id, one page at a time.
+
+    Args:
+        after: Only list courses with a greater id, i.e. the ``next_cursor`` of the previous page.
+        limit: Maximum number of courses on the page.
+        name: Only list courses whose name contains this text, ignoring ASCII case.
+        bbox: Only list courses inside this ``(min_lat, min_lon, max_lat, max_lon)`` box.
+        center_coord: Together with ``radius``, only list courses within ``radius`` meters of this point.
+        radius: The radius in meters around ``center_coord``.
+
+    Returns:
+        The page of courses.
+    """
+    return get_course_store().page(after, limit, name=name, bbox=bbox, center_coord=center_coord, radius=radius)
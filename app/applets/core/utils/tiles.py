@@ -0,0 +1,374 @@
+"""Slippy-map tile coverage cache for golf course searches.
+
+Overpass results are cached per tile of a fixed zoom level, so overlapping searches share work: only
+the missing tiles covering a search circle are fetched from Overpass before the circle is answered
+from the course store, while expired tiles are served and fetched again in the background.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+import pickle
+import time
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING, Final
+
+import msgspec
+from msgspec.structs import replace
+from structlog import get_logger
+
+from app.applets.core.db import get_db_connection
+from app.applets.core.schemas import Course
+from app.applets.core.utils.cache import MISSING, tile_memory
+from app.applets.core.utils.distance import METERS_PER_MILE, bounding_boxes, distance_matrix
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+__all__ = (
+    "StaleTiles",
+    "Tile",
+    "covering_tiles",
+    "decode_courses",
+    "decode_pickled_courses",
+    "encode_courses",
+    "merge_tile_bounds",
+    "stale_tiles",
+    "store_tiles",
+    "stored_courses",
+    "tile_bounds",
+    "tile_counters",
+    "tile_for",
+    "tile_key",
+)
+
+logger = get_logger(__name__)
+settings = get_settings()
+
+MAX_LATITUDE: Final[float] = 85.0511287798
+"""Latitude limit of the Web Mercator projection."""
+COVERAGE_MARGIN: Final[float] = 1.01
+"""Slack applied to the radius when discarding tiles, to absorb the lat/lon clamping approximation."""
+
+type Tile = tuple[int, int, int]
+"""A ``(zoom, x, y)`` slippy-map tile."""
+
+tile_counters: Counter[str] = Counter()
+"""Running totals of tile lookups in this worker; ``miss`` includes the ``expired`` tiles."""
+
+FORMAT_MSGPACK: Final[int] = 3
+"""Blob format: a format byte followed by a msgpack array of :class:`CourseRecord`."""
+FORMAT_MSGPACK_ZLIB: Final[int] = 4
+"""Blob format: a format byte followed by a zlib-compressed ``FORMAT_MSGPACK`` payload."""
+FORMAT_DECIMAL_MSGPACK: Final[int] = 1
+"""Legacy blob format: ``FORMAT_MSGPACK`` with coordinates stored as decimal strings. Still read."""
+FORMAT_DECIMAL_MSGPACK_ZLIB: Final[int] = 2
+"""Legacy blob format: a zlib-compressed ``FORMAT_DECIMAL_MSGPACK`` payload. Still read."""
+COMPRESSION_LEVEL: Final[int] = 1
+"""zlib level of compressed blobs; higher levels barely shrink msgpack further but cost more time."""
+
+
+class CourseRecord(msgspec.Struct, array_like=True, gc=False):
+    """The stored form of a cached course.
+
+    Encoded as a positional array, and without the per-search ``distances`` and
+    ``total_distance`` fields of :class:`Course`.
+    """
+
+    name: str
+    lat: float
+    lon: float
+    city: str | None = None
+    access: str | None = None
+    id: int | None = None
+
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(list[CourseRecord])
+_decimal_decoder = msgspec.msgpack.Decoder(list[CourseRecord], strict=False)
+"""Decodes the legacy formats, whose decimal string coordinates non-strict mode converts to floats."""
+
+
+def encode_courses(courses: Iterable[Course]) -> bytes:
+    """Encode the courses of a tile for the ``course_tiles`` table.
+
+    Payloads of at least ``CACHE_COMPRESS_MIN_SIZE`` bytes are compressed.
+
+    Args:
+        courses: The courses to encode.
+
+    Returns:
+        The versioned blob.
+    """
+    payload = _encoder.encode(
+        [CourseRecord(course.name, course.lat, course.lon, course.city, course.access, course.id) for course in courses]
+    )
+    if 0 < settings.cache.COMPRESS_MIN_SIZE <= len(payload):
+        return bytes((FORMAT_MSGPACK_ZLIB,)) + zlib.compress(payload, COMPRESSION_LEVEL)
+    return bytes((FORMAT_MSGPACK,)) + payload
+
+
+def decode_courses(blob: bytes) -> list[Course]:
+    """Decode a blob written by :func:`encode_courses`.
+
+    Args:
+        blob: The versioned blob.
+
+    Returns:
+        The courses.
+
+    Raises:
+        ValueError: If the blob is not in a known format or is corrupt.
+    """
+    view = memoryview(blob)
+    if not view:
+        msg = "empty course blob"
+        raise ValueError(msg)
+    decoder = _decimal_decoder if view[0] in {FORMAT_DECIMAL_MSGPACK, FORMAT_DECIMAL_MSGPACK_ZLIB} else _decoder
+    if view[0] in {FORMAT_MSGPACK_ZLIB, FORMAT_DECIMAL_MSGPACK_ZLIB}:
+        try:
+            payload = zlib.decompress(view[1:])
+        except zlib.error as e:
+            raise ValueError(str(e)) from e
+    elif view[0] in {FORMAT_MSGPACK, FORMAT_DECIMAL_MSGPACK}:
+        payload = view[1:]
+    else:
+        msg = f"unknown course blob format {view[0]}"
+        raise ValueError(msg)
+    try:
+        records = decoder.decode(payload)
+    except msgspec.DecodeError as e:
+        raise ValueError(str(e)) from e
+    return [
+        Course(record.name, record.lat, record.lon, city=record.city, access=record.access, id=record.id)
+        for record in records
+    ]
+
+
+class _CourseUnpickler(pickle.Unpickler):
+    """Unpickler that only resolves the classes legacy course blobs were made of."""
+
+    allowed: Final = {("app.applets.core.schemas", "Course"), ("decimal", "Decimal")}
+
+    def find_class(self, module: str, name: str) -> type:
+        if (module, name) not in self.allowed:
+            msg = f"{module}.{name} is not allowed in a course blob"
+            raise pickle.UnpicklingError(msg)
+        return super().find_class(module, name)
+
+
+def decode_pickled_courses(blob: bytes) -> list[Course]:
+    """Decode a course list cached in the legacy pickle format, refusing anything but courses.
+
+    Only used to migrate existing rows to :func:`encode_courses`.
+
+    Args:
+        blob: The pickled list of courses.
+
+    Returns:
+        The courses, with their ``Decimal`` coordinates converted to floats.
+
+    Raises:
+        pickle.UnpicklingError: If the blob references anything but courses and decimals.
+    """
+    courses = _CourseUnpickler(io.BytesIO(blob)).load()
+    if not isinstance(courses, list) or not all(isinstance(course, Course) for course in courses):
+        msg = "not a list of courses"
+        raise pickle.UnpicklingError(msg)
+    return [replace(course, lat=float(course.lat), lon=float(course.lon)) for course in courses]
+
+
+def tile_key(tile: Tile) -> str:
+    """Format a tile as its ``zoom/x/y`` cache key."""
+    return "{}/{}/{}".format(*tile)
+
+
+def tile_for(lat: float, lon: float, zoom: int | None = None) -> Tile:
+    """Get the tile containing a coordinate.
+
+    Args:
+        lat: The latitude of the coordinate.
+        lon: The longitude of the coordinate.
+        zoom: The tile zoom level. Defaults to ``GEO_TILE_ZOOM``.
+
+    Returns:
+        The tile containing the coordinate.
+    """
+    zoom = settings.geo.TILE_ZOOM if zoom is None else zoom
+    n = 2**zoom
+    lat = max(min(float(lat), MAX_LATITUDE), -MAX_LATITUDE)
+    x = int((float(lon) + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return zoom, min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(tile: Tile) -> tuple[float, float, float, float]:
+    """Get the bounding box of a tile.
+
+    Args:
+        tile: The tile.
+
+    Returns:
+        The ``(min_lat, min_lon, max_lat, max_lon)`` bounding box of the tile.
+    """
+    zoom, x, y = tile
+    n = 2**zoom
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+
+def covering_tiles(center_coord: tuple[float, float], radius: float, zoom: int | None = None) -> list[Tile]:
+    """Get the tiles intersecting a search circle.
+
+    Args:
+        center_coord: A tuple containing the latitude and longitude of the center coordinate.
+        radius: The radius in meters around the center coordinate.
+        zoom: The tile zoom level. Defaults to ``GEO_TILE_ZOOM``.
+
+    Returns:
+        The tiles intersecting the circle.
+    """
+    zoom = settings.geo.TILE_ZOOM if zoom is None else zoom
+    candidates: list[Tile] = []
+    for min_lat, min_lon, max_lat, max_lon in bounding_boxes(center_coord, radius):
+        _, west, north = tile_for(max_lat, min_lon, zoom)
+        _, east, south = tile_for(min_lat, max_lon, zoom)
+        candidates.extend((zoom, x, y) for x in range(west, east + 1) for y in range(north, south + 1))
+
+    lat, lon = float(center_coord[0]), float(center_coord[1])
+    nearest = []
+    for tile in candidates:
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(tile)
+        if min_lon <= lon <= max_lon:
+            nearest_lon = lon
+        else:
+            # Pick the closer edge, measuring across the antimeridian where that is shorter.
+            nearest_lon = min((min_lon, max_lon), key=lambda edge: abs((edge - lon + 180.0) % 360.0 - 180.0))
+        nearest.append((min(max(lat, min_lat), max_lat), nearest_lon))
+    if not nearest:
+        return []
+    distances = distance_matrix([center_coord], nearest, "haversine")[0] * METERS_PER_MILE
+    return [
+        tile for tile, meters in zip(candidates, distances.tolist(), strict=True) if meters <= radius * COVERAGE_MARGIN
+    ]
+
+
+def merge_tile_bounds(tiles: Iterable[Tile]) -> list[tuple[float, float, float, float]]:
+    """Merge horizontally adjacent tiles into as few bounding boxes as possible.
+
+    Args:
+        tiles: The tiles to merge. They must share a zoom level.
+
+    Returns:
+        A list of ``(min_lat, min_lon, max_lat, max_lon)`` bounding boxes covering exactly the tiles.
+    """
+    boxes = []
+    run: list[Tile] = []
+    for tile in sorted(tiles, key=lambda tile: (tile[2], tile[1])):
+        if run and (tile[2] != run[-1][2] or tile[1] != run[-1][1] + 1):
+            boxes.append((*tile_bounds(run[0])[:2], *tile_bounds(run[-1])[2:]))
+            run = []
+        run.append(tile)
+    if run:
+        boxes.append((*tile_bounds(run[0])[:2], *tile_bounds(run[-1])[2:]))
+    return boxes
+
+
+class StaleTiles(msgspec.Struct, gc=False):
+    """The tiles of a search that have to be fetched from Overpass."""
+
+    missing: list[Tile]
+    """Tiles never fetched, which the search waits for."""
+    expired: list[Tile]
+    """Tiles older than ``GEO_TILE_TTL``, whose stored courses are served while they are fetched again."""
+
+
+def stale_tiles(tiles: Iterable[Tile]) -> StaleTiles:
+    """Find the tiles that have to be fetched from Overpass.
+
+    The courses of the other tiles are served by the course store. Fetch times held by the memory
+    tier skip the database.
+
+    Args:
+        tiles: The tiles a search covers.
+
+    Returns:
+        The tiles that are missing and the ones older than ``GEO_TILE_TTL``.
+    """
+    tiles = list(tiles)
+    oldest = time.time() - settings.geo.TILE_TTL
+    fetched_at: dict[Tile, float] = {}
+    unknown = []
+    for tile in tiles:
+        if (entry := tile_memory.get(tile_key(tile))) is not MISSING:
+            fetched_at[tile] = entry
+        else:
+            unknown.append(tile)
+    if unknown:
+        by_key = {tile_key(tile): tile for tile in unknown}
+        with get_db_connection() as conn:
+            rows = conn.execute(
+                f"SELECT tile, fetched_at FROM course_tiles WHERE tile IN ({', '.join('?' * len(by_key))})",  # noqa: S608
+                list(by_key),
+            ).fetchall()
+        for key, stored_at in rows:
+            fetched_at[by_key[key]] = stored_at
+            tile_memory.set(key, stored_at)
+
+    missing = [tile for tile in tiles if tile not in fetched_at]
+    expired = [tile for tile in tiles if tile in fetched_at and fetched_at[tile] < oldest]
+    stale = len(missing) + len(expired)
+    tile_counters["hit"] += len(tiles) - stale
+    tile_counters["miss"] += stale
+    tile_counters["expired"] += len(expired)
+    logger.info("tiles: %d hit, %d missing, %d expired", len(tiles) - stale, len(missing), len(expired))
+    return StaleTiles(missing, expired)
+
+
+def stored_courses(tiles: Iterable[Tile]) -> dict[Tile, list[Course]]:
+    """Load the courses stored for tiles, however old.
+
+    Args:
+        tiles: The tiles to load.
+
+    Returns:
+        A mapping of each stored tile that can be decoded to its courses.
+    """
+    by_key = {tile_key(tile): tile for tile in tiles}
+    if not by_key:
+        return {}
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            f"SELECT tile, courses FROM course_tiles WHERE tile IN ({', '.join('?' * len(by_key))})",  # noqa: S608
+            list(by_key),
+        ).fetchall()
+    loaded = {}
+    for key, blob in rows:
+        try:
+            loaded[by_key[key]] = decode_courses(blob)
+        except ValueError:
+            logger.warning("discarding undecodable tile %s", key)
+    return loaded
+
+
+def store_tiles(courses_by_tile: dict[Tile, list[Course]]) -> None:
+    """Cache the courses of freshly fetched tiles, replacing any expired entries.
+
+    Args:
+        courses_by_tile: A mapping of each fetched tile to its courses, including empty tiles.
+    """
+    fetched_at = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO course_tiles (tile, fetched_at, courses) VALUES (?, ?, ?)",
+            [(tile_key(tile), fetched_at, encode_courses(courses)) for tile, courses in courses_by_tile.items()],
+        )
+    for tile in courses_by_tile:
+        tile_memory.set(tile_key(tile), fetched_at)
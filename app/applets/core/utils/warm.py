@@ -0,0 +1,164 @@
+"""Off-peak warming of the caches searches read, so that daytime searches of a region are cache hits.
+
+The course tiles covering an area are fetched from Overpass a batch at a time, and the name and city
+lookups of its courses are queued as enrichment jobs behind those of live searches and run within the
+upstream rate limits. Tiles and lookups cached within their TTL are skipped and every fetched batch
+and finished lookup is stored right away, so an interrupted run resumes where it stopped when it is
+started again; queued jobs are also picked up by any enrichment worker meanwhile.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Final
+
+import msgspec
+from structlog import get_logger
+
+from app.applets.core.db import get_db_connection, run_in_db
+from app.applets.core.utils.geo import SEARCH_RADIUS, fetch_and_store_tiles
+from app.applets.core.utils.jobs import EnrichmentWorker, prepare_enrichment
+from app.applets.core.utils.tiles import covering_tiles, stale_tiles, stored_courses, tile_for
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from app.applets.core.utils.tiles import Tile
+
+__all__ = (
+    "WarmSummary",
+    "area_tiles",
+    "player_coordinates",
+    "warm_caches",
+    "warm_enrichment",
+    "warm_tiles",
+)
+
+logger = get_logger(__name__)
+settings = get_settings()
+
+ENRICHMENT_BATCH: Final[int] = 500
+"""Courses whose lookups are queued per transaction, so that searches can write in between."""
+
+
+class WarmSummary(msgspec.Struct):
+    """What a warming run did."""
+
+    tiles: int
+    """Tiles covering the area."""
+    fetched: int
+    """Tiles fetched from Overpass, the others being cached already."""
+    courses: int
+    """Courses of the area checked for missing names and cities; none without enrichment."""
+    lookups: int
+    """Name and city lookups run, the others being cached already."""
+
+
+def area_tiles(
+    bbox: tuple[float, float, float, float] | None = None,
+    centers: Iterable[tuple[float, float]] = (),
+    radius: float = SEARCH_RADIUS,
+) -> list[Tile]:
+    """Get the tiles covering a bounding box and the search circles around some centers.
+
+    Args:
+        bbox: A ``(min_lat, min_lon, max_lat, max_lon)`` bounding box.
+        centers: Coordinates searched around.
+        radius: The radius in meters of the search circles.
+
+    Returns:
+        The tiles, without duplicates.
+    """
+    tiles: dict[Tile, None] = {}
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        zoom, west, north = tile_for(max_lat, min_lon)
+        _, east, south = tile_for(min_lat, max_lon)
+        tiles.update(dict.fromkeys((zoom, x, y) for y in range(north, south + 1) for x in range(west, east + 1)))
+    for center in centers:
+        tiles.update(dict.fromkeys(covering_tiles(center, radius)))
+    return list(tiles)
+
+
+def player_coordinates() -> list[tuple[float, float]]:
+    """Get the distinct coordinates of the stored players.
+
+    Returns:
+        The coordinates of every geocoded player.
+    """
+    with get_db_connection() as conn:
+        return [
+            (latitude, longitude)
+            for latitude, longitude in conn.execute(
+                "SELECT DISTINCT latitude, longitude FROM players WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+            )
+        ]
+
+
+async def warm_tiles(tiles: list[Tile], batch_size: int) -> int:
+    """Fetch the tiles that are missing or past ``GEO_TILE_TTL`` from Overpass, a batch per query.
+
+    Args:
+        tiles: The tiles to warm.
+        batch_size: Tiles fetched per Overpass query.
+
+    Returns:
+        The number of tiles fetched.
+    """
+    stale = await run_in_db(stale_tiles, tiles)
+    # Adjacent tiles of a row share a bounding box in the query.
+    todo = sorted([*stale.missing, *stale.expired], key=lambda tile: (tile[2], tile[1]))
+    for start in range(0, len(todo), batch_size):
+        await fetch_and_store_tiles(todo[start : start + batch_size])
+        logger.info("warmed %d of %d tiles", min(start + batch_size, len(todo)), len(todo))
+    return len(todo)
+
+
+async def warm_enrichment(tiles: list[Tile], concurrency: int) -> tuple[int, int]:
+    """Resolve the names and cities that the tags of the courses of some tiles do not provide.
+
+    The lookups are queued behind the ones of live searches, which keep their priority, and run
+    until the queue is empty.
+
+    Args:
+        tiles: The tiles whose courses to enrich.
+        concurrency: Number of lookups run at once.
+
+    Returns:
+        The number of courses and the number of lookups queued.
+    """
+    courses = [course for stored in (await run_in_db(stored_courses, tiles)).values() for course in stored]
+    queued = 0
+    for start in range(0, len(courses), ENRICHMENT_BATCH):
+        queued += len(
+            await run_in_db(
+                prepare_enrichment,
+                courses[start : start + ENRICHMENT_BATCH],
+                first_rank=settings.geo.ENRICHMENT_TOP_K + start,
+            )
+        )
+    if queued:
+        logger.info("resolving %d names and cities", queued)
+        await EnrichmentWorker(concurrency, settings.geo.ENRICHMENT_POLL_INTERVAL).run(until_empty=True)
+    return len(courses), queued
+
+
+async def warm_caches(
+    tiles: list[Tile], *, batch_size: int = 16, enrich: bool = True, concurrency: int | None = None
+) -> WarmSummary:
+    """Warm the course tiles of an area and, optionally, the names and cities of its courses.
+
+    Args:
+        tiles: The tiles covering the area, see :func:`area_tiles`.
+        batch_size: Tiles fetched per Overpass query.
+        enrich: Whether to resolve the names and cities of the courses.
+        concurrency: Number of lookups run at once. Defaults to ``GEO_ENRICHMENT_CONCURRENCY``.
+
+    Returns:
+        What was warmed.
+    """
+    fetched = await warm_tiles(tiles, batch_size)
+    courses = lookups = 0
+    if enrich:
+        courses, lookups = await warm_enrichment(tiles, concurrency or settings.geo.ENRICHMENT_CONCURRENCY)
+    return WarmSummary(tiles=len(tiles), fetched=fetched, courses=courses, lookups=lookups)
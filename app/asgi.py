@@ -9,19 +9,27 @@ def app_factory() -> Litestar:
     """Construct app with some defaults."""
     from litestar import Litestar
 
-    from app.applets.core.db import initialize_database
-    from app.config.app import granian_plugin, openapi_config, structlog_plugin, template_config
+    from app.config.app import (
+        cli_plugin,
+        granian_plugin,
+        lifespan,
+        on_app_init,
+        openapi_config,
+        structlog_plugin,
+        template_config,
+    )
     from app.config.routes import route_handlers
 
     return Litestar(
         # - Config
-        plugins=[structlog_plugin, granian_plugin],
+        plugins=[structlog_plugin, granian_plugin, cli_plugin],
         openapi_config=openapi_config,
         template_config=template_config,
         # - Core
         route_handlers=route_handlers,
         # - Hooks
-        on_app_init=[initialize_database],
+        on_app_init=on_app_init,
+        lifespan=lifespan,
     )
 
 
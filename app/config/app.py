@@ -11,6 +11,11 @@ from litestar.template.config import TemplateConfig
 from litestar_granian import GranianPlugin
 
 from app.__metadata__ import __version__
+from app.applets.core.cli import CoreCLIPlugin
+from app.applets.core.db import initialize_database
+from app.applets.core.utils.batch import batch_lifespan
+from app.applets.core.utils.jobs import enrichment_lifespan
+from app.applets.core.utils.store import load_course_store
 from app.config.settings import get_settings
 from app.utils import get_template_directories
 
@@ -72,3 +77,10 @@ template_config = TemplateConfig(
 structlog_plugin = StructlogPlugin(config=log_config)
 # vite_plugin = VitePlugin(config=vite_config)
 granian_plugin = GranianPlugin()
+cli_plugin = CoreCLIPlugin()
+
+# --- App init hooks
+on_app_init = [initialize_database, load_course_store]
+
+# --- Lifespan hooks
+lifespan = [enrichment_lifespan, batch_lifespan]
@@ -2,8 +2,8 @@
 
 from litestar.types import ControllerRouterHandler
 
-from app.applets.core.controller import CoreController
+from app.applets.core.controller import CoreController, MetricsController
 
 __all__ = ("route_handlers",)
 
-route_handlers: list[ControllerRouterHandler] = [CoreController]
+route_handlers: list[ControllerRouterHandler] = [CoreController, MetricsController]
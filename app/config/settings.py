@@ -157,6 +157,107 @@ class AppSettings:
     """Application name."""
 
 
+@dataclass
+class DatabaseSettings:
+    """SQLite access configuration."""
+
+    POOL_SIZE: int = field(default_factory=lambda: int(os.getenv("DB_POOL_SIZE", "8")))
+    """Maximum number of SQLite connections held open per worker process."""
+    BUSY_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("DB_BUSY_TIMEOUT", "5.0")))
+    """Seconds to wait for another connection's write lock before failing."""
+    SYNCHRONOUS: str = field(default_factory=lambda: os.getenv("DB_SYNCHRONOUS", "NORMAL"))
+    """``PRAGMA synchronous`` level. ``NORMAL`` is durable across application crashes in WAL mode."""
+    CACHE_SIZE_KIB: int = field(default_factory=lambda: int(os.getenv("DB_CACHE_SIZE_KIB", "16384")))
+    """Page cache size per connection, in KiB."""
+    MMAP_SIZE: int = field(default_factory=lambda: int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))))
+    """Bytes of the database file to memory-map."""
+    STATEMENT_CACHE_SIZE: int = field(default_factory=lambda: int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256")))
+    """Number of prepared statements cached per connection."""
+    COURSE_SNAPSHOT: bool = field(
+        default_factory=lambda: os.getenv("DB_COURSE_SNAPSHOT", "True") in TRUE_VALUES,
+    )
+    """Share the in-memory course store between worker processes through a memory-mapped snapshot file
+    next to the database. When disabled, every worker builds its own copy."""
+
+
+@dataclass
+class GeoSettings:
+    """Geocoding and golf course lookup configuration."""
+
+    RESULTS_LIMIT: int = field(default_factory=lambda: int(os.getenv("GEO_RESULTS_LIMIT", "0")))
+    """Number of courses a search shows unless the request asks for a ``limit``; ``0`` shows all of them."""
+    ENRICHMENT_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("GEO_ENRICHMENT_CONCURRENCY", "8")))
+    """Maximum number of name and city lookups in flight across all searches; waiting lookups are served by rank."""
+    ENRICHMENT_TOP_K: int = field(default_factory=lambda: int(os.getenv("GEO_ENRICHMENT_TOP_K", "10")))
+    """Number of best-ranked courses of a search whose names and cities are looked up upstream."""
+    ENRICHMENT_MODE: str = field(default_factory=lambda: os.getenv("GEO_ENRICHMENT_MODE", "background"))
+    """Where name and city lookups run: ``inline`` (searches wait for them), ``background`` (an in-process
+    worker, searches return right away) or ``external`` (searches only queue them for ``app enrichment worker``)."""
+    ENRICHMENT_POLL_INTERVAL: float = field(
+        default_factory=lambda: float(os.getenv("GEO_ENRICHMENT_POLL_INTERVAL", "1.0")),
+    )
+    """Seconds an idle enrichment worker waits before checking the job queue again."""
+    ENRICHMENT_JOB_TIMEOUT: int = field(default_factory=lambda: int(os.getenv("GEO_ENRICHMENT_JOB_TIMEOUT", "300")))
+    """Seconds after which a running enrichment job is considered abandoned and handed to another worker."""
+    OVERPASS_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("GEO_OVERPASS_CONCURRENCY", "2")))
+    """Maximum number of in-flight Overpass API queries per worker."""
+    OVERPASS_MIN_INTERVAL: float = field(default_factory=lambda: float(os.getenv("GEO_OVERPASS_MIN_INTERVAL", "0")))
+    """Minimum number of seconds between the start of two Overpass API queries."""
+    NOMINATIM_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("GEO_NOMINATIM_CONCURRENCY", "1")))
+    """Maximum number of in-flight Nominatim requests per worker."""
+    NOMINATIM_MIN_INTERVAL: float = field(
+        default_factory=lambda: float(os.getenv("GEO_NOMINATIM_MIN_INTERVAL", "1.0")),
+    )
+    """Minimum number of seconds between the start of two Nominatim requests (usage policy is 1/s)."""
+    DISTANCE_MODE: str = field(default_factory=lambda: os.getenv("GEO_DISTANCE_MODE", "ellipsoidal"))
+    """Accuracy mode of the distance engine, ``ellipsoidal`` (WGS-84) or ``haversine``."""
+    TILE_ZOOM: int = field(default_factory=lambda: int(os.getenv("GEO_TILE_ZOOM", "9")))
+    """Slippy-map zoom level of the golf course tile cache (zoom 9 tiles are ~60km wide at 40N)."""
+    TILE_TTL: int = field(default_factory=lambda: int(os.getenv("GEO_TILE_TTL", str(30 * 24 * 60 * 60))))
+    """Seconds a cached tile is served before it is fetched from Overpass again."""
+    SEARCH_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("GEO_SEARCH_CONCURRENCY", "4")))
+    """Maximum number of searches (``/process``) running at once per worker. ``0`` disables admission control."""
+    SEARCH_QUEUE_SIZE: int = field(default_factory=lambda: int(os.getenv("GEO_SEARCH_QUEUE_SIZE", "32")))
+    """Maximum number of searches waiting for a slot per worker; further searches are answered with a 503."""
+    SEARCH_CLIENT_QUEUE_SIZE: int = field(default_factory=lambda: int(os.getenv("GEO_SEARCH_CLIENT_QUEUE_SIZE", "4")))
+    """Maximum number of searches of a single client waiting for a slot; waiting clients are served in turn."""
+    SEARCH_QUEUE_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("GEO_SEARCH_QUEUE_TIMEOUT", "20")))
+    """Seconds a search waits for a slot before it is answered with a 503."""
+    SEARCH_RETRY_AFTER: int = field(default_factory=lambda: int(os.getenv("GEO_SEARCH_RETRY_AFTER", "5")))
+    """Seconds a shed search is told to wait before retrying, in its ``Retry-After`` header."""
+    SEARCH_CLIENT_HEADER: str = field(default_factory=lambda: os.getenv("GEO_SEARCH_CLIENT_HEADER", ""))
+    """Header identifying the client of a search behind a proxy, e.g. ``X-Forwarded-For``; the peer address
+    is used when unset or missing."""
+    BATCH_MAX_GROUPS: int = field(default_factory=lambda: int(os.getenv("GEO_BATCH_MAX_GROUPS", "100")))
+    """Maximum number of player groups in one batch search."""
+    BATCH_PROCESSES: int = field(default_factory=lambda: int(os.getenv("GEO_BATCH_PROCESSES", "0")))
+    """Processes scoring the groups of batch searches per worker; ``0`` starts one per core and ``1`` scores
+    them in the worker itself."""
+
+
+@dataclass
+class CacheSettings:
+    """The SQLite caches of upstream lookups and their in-process memory tier."""
+
+    MEMORY_SIZE: int = field(default_factory=lambda: int(os.getenv("CACHE_MEMORY_SIZE", "10000")))
+    """Maximum number of entries held in memory per lookup cache (geocode, reverse geocode, nearby). ``0`` disables it."""
+    MEMORY_TTL: int = field(default_factory=lambda: int(os.getenv("CACHE_MEMORY_TTL", "3600")))
+    """Seconds an entry is served from memory before the database is consulted again."""
+    TTL: int = field(default_factory=lambda: int(os.getenv("CACHE_TTL", str(30 * 24 * 60 * 60))))
+    """Seconds a geocode, city or nearby name is current. Older entries are still served while they are
+    refreshed in the background."""
+    NEGATIVE_TTL: int = field(default_factory=lambda: int(os.getenv("CACHE_NEGATIVE_TTL", str(24 * 60 * 60))))
+    """Seconds a lookup that found nothing is cached before it is tried again."""
+    TILE_MEMORY_SIZE: int = field(default_factory=lambda: int(os.getenv("CACHE_TILE_MEMORY_SIZE", "512")))
+    """Maximum number of course tile fetch times held in memory. ``0`` disables it."""
+    COMPRESS_MIN_SIZE: int = field(default_factory=lambda: int(os.getenv("CACHE_COMPRESS_MIN_SIZE", "1024")))
+    """Cached course blobs of at least this many bytes are zlib-compressed. ``0`` disables compression."""
+    RESULT_SIZE: int = field(default_factory=lambda: int(os.getenv("CACHE_RESULT_SIZE", "1000")))
+    """Maximum number of search results held in memory, by player set. ``0`` disables it."""
+    RESULT_TTL: int = field(default_factory=lambda: int(os.getenv("CACHE_RESULT_TTL", "600")))
+    """Seconds a search result is served from memory while the courses around it are unchanged."""
+
+
 @dataclass
 class TemplateSettings:
     """Configures Templating for the project."""
@@ -174,6 +275,9 @@ class Settings:
     vite: ViteSettings = field(default_factory=ViteSettings)
     server: ServerSettings = field(default_factory=ServerSettings)
     log: LogSettings = field(default_factory=LogSettings)
+    geo: GeoSettings = field(default_factory=GeoSettings)
+    db: DatabaseSettings = field(default_factory=DatabaseSettings)
+    cache: CacheSettings = field(default_factory=CacheSettings)
 
     @classmethod
     def from_env(cls, dotenv_filename: str = ".env") -> Settings:
@@ -0,0 +1,16 @@
+import pytest
+
+from app.applets.core import db
+from app.applets.core.utils import cache
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point the app at an empty database, with empty memory caches."""
+    monkeypatch.setattr(db, "DATABASE_FILE", str(tmp_path / "test.db"))
+    for memory in cache.memory_caches.values():
+        memory.clear()
+    db.initialize_database(None)
+    yield
+    for memory in cache.memory_caches.values():
+        memory.clear()
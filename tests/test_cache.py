@@ -0,0 +1,47 @@
+import time
+
+from app.applets.core.utils.cache import MISSING, TTLCache, expired, settings
+
+
+def test_none_is_cached_and_distinct_from_a_miss():
+    cache = TTLCache(maxsize=2, ttl=60)
+    assert cache.get("a") is MISSING
+    cache.set("a", None)
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_entries_expire(monkeypatch):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is MISSING
+    assert cache.expirations == 1
+    assert len(cache) == 0
+
+
+def test_zero_size_disables_the_cache():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") is MISSING
+
+
+def test_entries_that_found_nothing_expire_sooner(monkeypatch):
+    monkeypatch.setattr(settings.cache, "TTL", 100)
+    monkeypatch.setattr(settings.cache, "NEGATIVE_TTL", 10)
+    assert not expired(50, now=100)
+    assert expired(50, negative=True, now=100)
+    assert expired(-1, now=100)
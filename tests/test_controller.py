@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from litestar import Litestar
+from litestar.testing import TestClient
+
+from app.applets.core import controller
+from app.applets.core.schemas import Course
+from app.applets.core.utils import geo
+from app.applets.core.utils.db import upsert_courses
+from app.applets.core.utils.jobs import EnrichmentMode
+from app.applets.core.utils.limits import AdmissionLimiter
+from app.config.app import on_app_init, template_config
+from app.config.routes import route_handlers
+
+ADDRESSES = {"1 Main St": (40.01, -75.0), "2 Main St": (39.99, -75.0)}
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    monkeypatch.setattr(controller.settings.geo, "ENRICHMENT_MODE", EnrichmentMode.EXTERNAL)
+    app = Litestar(route_handlers=route_handlers, template_config=template_config, on_app_init=on_app_init)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    def geocode(address):
+        if (coord := ADDRESSES.get(address)) is None:
+            return None
+        return SimpleNamespace(latitude=coord[0], longitude=coord[1])
+
+    def query_overpass_api(bounds):
+        return [SimpleNamespace(lat=40.0, lon=-75.01, tags={"leisure": "golf_course", "name": "Pine Hills"})]
+
+    monkeypatch.setattr(geo, "geolocator", SimpleNamespace(geocode=geocode))
+    monkeypatch.setattr(geo, "query_overpass_api", query_overpass_api)
+
+
+def test_searches_redirect_to_a_results_page_that_is_revalidated(client, upstream, monkeypatch):
+    asyncio.run(geo.find_golf_courses((40.0, -75.0)))
+    searches = []
+
+    async def find_golf_courses(center_coord):
+        searches.append(center_coord)
+        return await geo.find_golf_courses(center_coord)
+
+    monkeypatch.setattr(controller, "find_golf_courses", find_golf_courses)
+    form = {"name1": "Ann", "address1": "1 Main St", "name2": "Bob", "address2": "2 Main St"}
+
+    posted = client.post("/process", data=form, follow_redirects=False)
+    assert posted.status_code == 303
+    page = client.get(posted.headers["location"])
+    assert page.status_code == 200
+    assert "Pine Hills" in page.text
+    etag = page.headers["etag"]
+
+    # The same players searching again get the same page, served from the remembered result.
+    again = client.post("/process", data=form, follow_redirects=False)
+    assert again.headers["location"] == posted.headers["location"]
+    revalidated = client.get(again.headers["location"], headers={"If-None-Match": etag})
+    assert (revalidated.status_code, revalidated.content) == (304, b"")
+    assert revalidated.headers["etag"] == etag
+    assert len(searches) == 1
+
+    # Once a shown course changes, the page does too.
+    upsert_courses([Course("Pine Hills GC", 40.0, -75.01)])
+    changed = client.get(posted.headers["location"], headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert "Pine Hills GC" in changed.text
+    assert changed.headers["etag"] != etag
+
+    assert client.get("/results/not-a-token").status_code == 404
+    assert client.post("/process", data={"name1": "Cat", "address1": "Nowhere"}).status_code == 200
+
+
+def test_searches_are_shed_with_a_retry_after_when_the_queue_is_full(client, upstream, monkeypatch):
+    limiter = AdmissionLimiter("test", concurrency=1, queue_size=0, client_queue_size=0, timeout=1)
+    monkeypatch.setattr(controller, "searches", limiter)
+    monkeypatch.setattr(controller.settings.geo, "SEARCH_RETRY_AFTER", 7)
+    form = {"name1": "Ann", "address1": "1 Main St"}
+
+    # Another search holds the only slot.
+    client.blocking_portal.call(limiter.acquire, "other")
+    response = client.post("/process", data=form, follow_redirects=False)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+
+    # The stream has sent its status line already, so it reports being shed in the page.
+    streamed = client.post("/process/stream", data=form)
+    assert streamed.status_code == 200
+    assert "Too many searches" in streamed.text
+
+    # A finished stream gives its slot back.
+    client.blocking_portal.call(limiter.release)
+    assert "Pine Hills" in client.post("/process/stream", data=form).text
+    client.blocking_portal.call(limiter.acquire, "other")
+    client.blocking_portal.call(limiter.release)
+
+
+def test_batch_searches_answer_each_group_in_order(client, upstream):
+    asyncio.run(geo.find_golf_courses((40.0, -75.0)))
+    groups = [
+        {"players": [{"name": "Ann", "address": "1 Main St"}, {"name": "Bob", "address": "2 Main St"}]},
+        {"players": [{"name": "Cat", "address": "Nowhere"}]},
+    ]
+
+    response = client.post("/process/batch", json={"groups": groups}, params={"limit": 1})
+    assert response.status_code == 200
+    located, lost = response.json()["groups"]
+    assert [player["name"] for player in located["players"]] == ["Ann", "Bob"]
+    assert [course["name"] for course in located["courses"]] == ["Pine Hills"]
+    assert located["error"] is None
+    assert located["player_distances"]
+    assert (lost["courses"], lost["error"]) == ([], "Unable to geocode any of the provided addresses.")
+
+    # A stored player is used as stored, whatever name and address come with its id.
+    ann = located["players"][0]
+    moved = {"players": [{"id": ann["id"], "name": "Anne", "address": "2 Main St"}]}
+    [group] = client.post("/process/batch", json={"groups": [moved]}).json()["groups"]
+    assert group["players"] == [ann]
+
+
+def test_batch_searches_are_validated(client, monkeypatch):
+    monkeypatch.setattr(controller.settings.geo, "BATCH_MAX_GROUPS", 1)
+    group = {"players": [{"name": "Ann", "address": "1 Main St"}]}
+
+    response = client.post("/process/batch", json={"groups": [group, group]})
+    assert response.status_code == 400
+    assert "at most 1 groups" in response.json()["detail"]
+
+    for body in (
+        {"groups": []},
+        {"groups": [{"players": []}]},
+        {"groups": [{"players": [{"name": "", "address": "1 Main St"}]}]},
+    ):
+        assert client.post("/process/batch", json=body).status_code == 400
@@ -0,0 +1,91 @@
+from app.applets.core import db
+from app.applets.core.schemas import UNKNOWN_CITY, UNNAMED_COURSE, Course
+from app.applets.core.utils.db import upsert_courses
+from app.applets.core.utils.geo import save_tiles
+from app.applets.core.utils.store import courses_within, list_courses
+from app.applets.core.utils.tiles import tile_for
+
+
+def known_courses():
+    return courses_within((40.5, -75.0), 200_000)
+
+
+def test_upserts_do_not_replace_resolved_names_with_placeholders(database):
+    upsert_courses([Course("Pine Hills", 40.1, -75.1, city="Springfield", access="yes")])
+    upsert_courses([Course(UNNAMED_COURSE, 40.1, -75.1, city=UNKNOWN_CITY)])
+    [course] = known_courses()
+    assert (course.name, course.city, course.access) == ("Pine Hills", "Springfield", "yes")
+
+    upsert_courses([Course("Pine Hills GC", 40.1, -75.1, city=UNKNOWN_CITY, access="private")])
+    [course] = known_courses()
+    assert (course.name, course.city, course.access) == ("Pine Hills GC", "Springfield", "private")
+
+
+def test_migration_merges_duplicate_courses(database):
+    with db.get_db_connection() as conn:
+        conn.execute("DROP INDEX courses_position")
+        conn.executemany(
+            "INSERT INTO courses (name, latitude, longitude, city, access) VALUES (?, ?, ?, ?, ?)",
+            [
+                (UNNAMED_COURSE, 40.1, -75.1, UNKNOWN_CITY, None),
+                ("Pine Hills", 40.1, -75.1, UNKNOWN_CITY, "yes"),
+                (UNNAMED_COURSE, 40.1, -75.1, "Springfield", None),
+                ("Elsewhere", 41.0, -75.0, None, None),
+            ],
+        )
+        conn.execute("PRAGMA user_version = 1")
+    db.migrate_database()
+
+    courses = sorted(known_courses(), key=lambda course: course.id)
+    assert [(course.id, course.name, course.city, course.access) for course in courses] == [
+        (1, "Pine Hills", "Springfield", "yes"),
+        (4, "Elsewhere", None, None),
+    ]
+    upsert_courses([Course("Pine Hills", 40.1, -75.1)])
+    assert len(known_courses()) == 2
+
+
+def test_migration_drops_the_spatial_index(database):
+    with db.get_db_connection() as conn:
+        conn.execute("CREATE VIRTUAL TABLE courses_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+        conn.execute("""
+            CREATE TRIGGER courses_rtree_insert AFTER INSERT ON courses BEGIN
+                INSERT INTO courses_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+            END
+        """)
+        conn.execute(f"PRAGMA user_version = {db.MIGRATIONS.index(db.drop_spatial_index):d}")
+    db.migrate_database()
+
+    assert db.fetch_one("SELECT count(*) FROM sqlite_master WHERE name LIKE 'courses_rtree%'") == (0,)
+    upsert_courses([Course("Pine Hills", 40.1, -75.1)])
+    assert [course.name for course in courses_within((40.1, -75.1), 5000)] == ["Pine Hills"]
+
+
+def test_listing_pages_through_filtered_courses(database):
+    def label(i):
+        return f"Course {i}" if i % 2 else f"Links_{i}"
+
+    upsert_courses(Course(label(i), round(40 + i / 100, 2), -75.0) for i in range(40))
+
+    def collect(**filters):
+        names, after = [], 0
+        while after is not None:
+            page = list_courses(after, 3, **filters)
+            names += [course.name for course in page.items]
+            after = page.next_cursor
+        return names
+
+    assert collect() == [label(i) for i in range(40)]
+    assert collect(name="links_1") == ["Links_10", "Links_12", "Links_14", "Links_16", "Links_18"]
+    assert collect(name="%") == []
+    assert collect(bbox=(40.05, -76, 40.1, -74)) == [label(i) for i in range(5, 11)]
+    # A hundredth of a degree of latitude is about 1.1 km.
+    assert collect(center_coord=(40.2, -75), radius=2500) == [label(i) for i in range(18, 23)]
+
+
+def test_refetched_tiles_drop_courses_that_are_gone(database):
+    tile = tile_for(40.1, -75.1)
+    save_tiles({tile: [Course("Pine Hills", 40.1, -75.1), Course("Closed", 40.11, -75.11)]})
+    save_tiles({tile: [Course("Pine Hills", 40.1, -75.1)]})
+
+    assert [course.name for course in courses_within((40.1, -75.1), 5000)] == ["Pine Hills"]
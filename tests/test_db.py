@@ -0,0 +1,45 @@
+import pytest
+
+from app.applets.core import db
+
+
+def count():
+    return db.fetch_one("SELECT count(*) FROM items")[0]
+
+
+def test_pooled_connections_are_reused_and_rolled_back(database):
+    with db.get_db_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        conn.execute("CREATE TABLE items (value TEXT)")
+        with db.get_db_connection() as other:
+            assert other is not conn
+    with db.get_db_connection() as again:
+        assert again is conn
+
+    with pytest.raises(RuntimeError), db.get_db_connection() as conn:
+        conn.execute("INSERT INTO items VALUES ('lost')")
+        raise RuntimeError
+    assert count() == 0
+
+
+def test_transactions_nest_and_commit_once(database):
+    db.execute("CREATE TABLE items (value TEXT)")
+    pool = db.get_pool()
+
+    with db.transaction() as conn:
+        db.execute("INSERT INTO items VALUES ('a')")
+        with db.transaction() as inner, db.get_db_connection() as borrowed:
+            assert inner is borrowed is conn
+            inner.execute("INSERT INTO items VALUES ('b')")
+        # Nothing is committed before the outermost transaction ends.
+        outside = pool.acquire()
+        assert outside.execute("SELECT count(*) FROM items").fetchone() == (0,)
+        pool.release(outside)
+    assert count() == 2
+
+    with pytest.raises(RuntimeError), db.transaction():
+        db.execute("INSERT INTO items VALUES ('c')")
+        with db.transaction():
+            db.execute("INSERT INTO items VALUES ('d')")
+        raise RuntimeError
+    assert count() == 2
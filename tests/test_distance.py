@@ -0,0 +1,96 @@
+import multiprocessing
+import random
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import msgspec
+import pytest
+from geopy.distance import geodesic
+
+import app
+from app.applets.core.schemas import Course
+from app.applets.core.utils.distance import (
+    distance_matrix,
+    player_distance_pairs,
+    rank_courses,
+    score_courses,
+    score_group,
+    score_packed_group,
+)
+
+PLAYERS = [(40.7128, -74.0060), (39.9526, -75.1652), (42.3601, -71.0589)]
+COURSES = [(41.0, -74.5), (40.0, -75.0), (-33.9, 151.2)]
+
+
+def test_ellipsoidal_matches_geodesic():
+    matrix = distance_matrix(PLAYERS, COURSES, "ellipsoidal")
+    for i, player in enumerate(PLAYERS):
+        for j, course in enumerate(COURSES):
+            assert abs(matrix[i, j] - geodesic(player, course).miles) < 1e-6
+
+
+def test_antipodal_points_fall_back_to_geodesic():
+    origin, antipode = (10.0, 20.0), (-10.0, -160.0)
+    assert abs(distance_matrix([origin], [antipode])[0, 0] - geodesic(origin, antipode).miles) < 1e-6
+
+
+def test_haversine_is_close_to_geodesic():
+    matrix = distance_matrix(PLAYERS, COURSES, "haversine")
+    for i, player in enumerate(PLAYERS):
+        for j, course in enumerate(COURSES):
+            assert abs(matrix[i, j] / geodesic(player, course).miles - 1) < 0.006
+
+
+def test_score_courses_fills_distances():
+    courses = [Course(name=f"Course {i}", lat=lat, lon=lon) for i, (lat, lon) in enumerate(COURSES)]
+    score_courses(courses, PLAYERS, ["a", "b", "c"])
+
+    course = courses[0]
+    assert set(course.distances) == {"a", "b", "c"}
+    assert course.distances["a"]["travel_time"] == int(course.distances["a"]["distance"] / 50 * 60)
+    assert abs(course.total_distance - sum(d["distance"] for d in course.distances.values())) < 1e-9
+
+
+@pytest.mark.parametrize("mode", ["ellipsoidal", "haversine"])
+def test_top_k_ranking_matches_full_ranking(mode):
+    rng = random.Random(0)
+    courses = [Course(name=f"Course {i}", lat=rng.uniform(38, 43), lon=rng.uniform(-76, -70)) for i in range(500)]
+    courses.append(Course(name="Twin", lat=courses[7].lat, lon=courses[7].lon))
+    names = ["a", "b", "c"]
+    full = [course.name for course in rank_courses(list(courses), PLAYERS, names, mode=mode)]
+    for limit in (1, 5, 25):
+        top = rank_courses(list(courses), PLAYERS, names, limit, mode)
+        assert [course.name for course in top] == full[:limit]
+        assert all(course.distances for course in top)
+
+
+def test_player_distance_pairs():
+    pairs = player_distance_pairs(PLAYERS, ["a", "b", "c"])
+
+    assert [pair["players"] for pair in pairs] == ["a and b", "a and c", "b and c"]
+    assert abs(pairs[0]["distance"] - geodesic(PLAYERS[0], PLAYERS[1]).miles) < 1e-6
+
+
+def test_packed_groups_score_like_in_process():
+    courses = [Course(name=f"Course {i}", lat=40 + i / 10, lon=-75 + i / 20, city="Town", id=i) for i in range(20)]
+    names = ["a", "b", "c"]
+    payload = msgspec.msgpack.encode((courses, PLAYERS, names, 5, "ellipsoidal"))
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        packed = pool.submit(score_packed_group, payload).result()
+    ranked, pairs = msgspec.msgpack.decode(packed, type=tuple[list[Course], list[dict]])
+
+    expected_ranked, expected_pairs = score_group(courses, PLAYERS, names, 5, "ellipsoidal")
+    assert ranked == expected_ranked
+    assert pairs == expected_pairs
+
+
+def test_scoring_processes_do_not_build_the_app():
+    # The scoring processes are forked from a server that preloads this module.
+    check = (
+        f"import sys, {score_packed_group.__module__}; from app.applets.core.utils import store; "
+        "assert 'app.asgi' not in sys.modules and store._store is None"
+    )
+    subprocess.run([sys.executable, "-c", check], cwd=Path(app.__file__).parent.parent, check=True)
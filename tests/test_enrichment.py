@@ -0,0 +1,27 @@
+import asyncio
+
+from app.applets.core.schemas import Course
+from app.applets.core.utils import geo
+
+
+def test_enriched_courses_are_yielded_as_their_lookups_finish(monkeypatch):
+    async def get_course_name(lat, lon, rank):
+        await asyncio.sleep(0.02 if rank == 0 else 0)
+        return f"Course {rank}"
+
+    async def get_city_name(lat, lon, rank):
+        return "Town"
+
+    monkeypatch.setattr(geo, "get_course_name", get_course_name)
+    monkeypatch.setattr(geo, "get_city_name", get_city_name)
+    ranked = [
+        Course(name=geo.UNNAMED_COURSE, lat=1.0, lon=1.0, city=geo.UNKNOWN_CITY),
+        Course(name="Tagged", lat=2.0, lon=2.0, city="Tagged City"),
+        Course(name=geo.UNNAMED_COURSE, lat=3.0, lon=3.0, city="Tagged City"),
+    ]
+
+    async def collect():
+        return [(course.name, course.city) async for course in geo.iter_enriched_courses(ranked)]
+
+    assert asyncio.run(collect()) == [("Course 2", "Tagged City"), ("Course 0", "Town")]
+    assert ranked[1].name == "Tagged"
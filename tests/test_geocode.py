@@ -0,0 +1,119 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.applets.core import db
+from app.applets.core.utils import cache, geo
+from app.applets.core.utils.players import fetch_or_add_players
+
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    answers = {}
+    calls = []
+
+    def geocode(address):
+        calls.append(address)
+        if (coord := answers.get(address)) is None:
+            return None
+        return SimpleNamespace(latitude=coord[0], longitude=coord[1])
+
+    monkeypatch.setattr(geo, "geolocator", SimpleNamespace(geocode=geocode))
+    return answers, calls
+
+
+def test_addresses_not_found_are_cached_until_the_negative_ttl(database, nominatim, monkeypatch):
+    answers, calls = nominatim
+
+    def search():
+        [player] = asyncio.run(fetch_or_add_players([(None, "a", "Nowhere")]))
+        return player.coord
+
+    assert search() is None
+    cache.geocode_memory.clear()
+    assert search() is None
+    assert calls == ["Nowhere"]
+
+    answers["Nowhere"] = (1.0, 2.0)
+    monkeypatch.setattr(cache.settings.cache, "NEGATIVE_TTL", -1)
+    cache.geocode_memory.clear()
+    assert search() == (1.0, 2.0)
+    assert len(calls) == 2
+
+
+def test_players_are_resolved_in_one_batch(database, nominatim):
+    answers, calls = nominatim
+    answers |= {"1 Main St": (1.0, 2.0), "3 Main St": (5.0, 6.0)}
+    [ann] = asyncio.run(fetch_or_add_players([(None, "Ann", "1 Main St")]))
+    geo.store_geocodes({"2 Main St": (3.0, 4.0)})
+    calls.clear()
+
+    entries = [
+        (str(ann.id), "Ann", "1 Main St"),
+        (None, "Bob", "2 Main St"),
+        (None, "Cat", "3 Main St"),
+        (None, "Dan", "Nowhere"),
+        (None, "Eve", "3 Main St"),
+    ]
+    players = asyncio.run(fetch_or_add_players(entries))
+    assert [(player.address, player.coord) for player in players] == [
+        ("1 Main St", (1.0, 2.0)),
+        ("2 Main St", (3.0, 4.0)),
+        ("3 Main St", (5.0, 6.0)),
+        ("Nowhere", None),
+        ("3 Main St", (5.0, 6.0)),
+    ]
+    assert players[0].id == ann.id
+    assert players[2].id == players[4].id
+    assert sorted(calls) == ["3 Main St", "Nowhere"]
+
+    # Every player is stored, and the address not found is not geocoded again.
+    assert asyncio.run(fetch_or_add_players(entries)) == players
+    assert len(calls) == 2
+
+
+def test_stale_coordinates_are_served_while_they_are_refreshed(database, nominatim):
+    answers, calls = nominatim
+    answers["1 Main St"] = (1.0, 2.0)
+
+    async def search():
+        [player] = await fetch_or_add_players([(None, "a", "1 Main St")])
+        return player.coord
+
+    assert asyncio.run(search()) == (1.0, 2.0)
+    db.execute("UPDATE geocode_cache SET cached_at = 0")
+    cache.geocode_memory.clear()
+    answers["1 Main St"] = (3.0, 4.0)
+
+    async def search_and_wait_for_refresh():
+        coord = await search()
+        # Joins the refresh in flight rather than geocoding again.
+        await geo.geocode_uncached("1 Main St")
+        return coord
+
+    assert asyncio.run(search_and_wait_for_refresh()) == (1.0, 2.0)
+    assert len(calls) == 2
+    assert asyncio.run(search()) == (3.0, 4.0)
+
+
+def test_addresses_no_longer_found_keep_their_coordinates(database):
+    geo.store_geocodes({"1 Main St": (1.0, 2.0)})
+    db.execute("UPDATE geocode_cache SET cached_at = 0")
+
+    assert geo.store_geocodes({"1 Main St": None}) == {"1 Main St": (1.0, 2.0)}
+    assert db.fetch_one("SELECT cached_at > 0 FROM geocode_cache") == (1,)
+
+
+def test_migration_stamps_existing_cache_entries(database):
+    with db.get_db_connection() as conn:
+        conn.execute("DROP TABLE reverse_geocode_cache")
+        conn.execute("CREATE TABLE reverse_geocode_cache (lat_lon TEXT PRIMARY KEY, city TEXT)")
+        conn.execute("INSERT INTO reverse_geocode_cache VALUES ('40.10000, -75.10000', 'Town')")
+        conn.execute(f"PRAGMA user_version = {db.MIGRATIONS.index(db.add_cache_timestamps):d}")
+    before = time.time()
+    db.migrate_database()
+
+    (cached_at,) = db.fetch_one("SELECT cached_at FROM reverse_geocode_cache")
+    assert cached_at >= before
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from app.applets.core import db
+from app.applets.core.schemas import Course
+from app.applets.core.utils import jobs
+from app.applets.core.utils.geo import UNKNOWN_CITY, UNNAMED_COURSE
+from app.applets.core.utils.jobs import EnrichmentWorker, JobKind, claim_job, finish_job, get_jobs, prepare_enrichment
+
+
+def test_jobs_are_claimed_by_rank(database):
+    ranked = [
+        Course(UNNAMED_COURSE, 40.1, -75.1, city="Springfield"),
+        Course("Named", 40.2, -75.2, city=UNKNOWN_CITY),
+    ]
+    job_ids = prepare_enrichment(ranked)
+
+    assert len(job_ids) == 2
+    assert (claim_job().kind, claim_job().kind, claim_job()) == (JobKind.NAME, JobKind.CITY, None)
+
+
+def test_cached_results_are_applied_without_a_job(database):
+    db.execute(
+        "INSERT INTO reverse_geocode_cache (lat_lon, city, cached_at) VALUES (?, ?, ?)",
+        ("40.10000, -75.10000", "Town", time.time()),
+    )
+    course = Course("Named", 40.1, -75.1, city=UNKNOWN_CITY)
+
+    assert prepare_enrichment([course]) == []
+    assert course.city == "Town"
+
+
+def test_finished_jobs_report_their_result(database):
+    [job_id] = prepare_enrichment([Course("Named", 40.1, -75.1, city=UNKNOWN_CITY)])
+    db.execute(
+        "INSERT INTO reverse_geocode_cache (lat_lon, city, cached_at) VALUES (?, ?, ?)",
+        ("40.10000, -75.10000", "Town", time.time()),
+    )
+
+    assert get_jobs([job_id])[0].result is None
+    finish_job(claim_job().id, "done")
+    assert get_jobs([job_id])[0].result == "Town"
+
+
+def test_stale_results_are_applied_and_queued_again(database):
+    db.execute(
+        "INSERT INTO reverse_geocode_cache (lat_lon, city, cached_at) VALUES (?, ?, ?)",
+        ("40.10000, -75.10000", "Town", 0.0),
+    )
+    db.execute(
+        "INSERT INTO nearby_features_cache (lat_lon, name, cached_at) VALUES (?, ?, ?)",
+        ("40.10000, -75.10000", None, 0.0),
+    )
+    course = Course(UNNAMED_COURSE, 40.1, -75.1, city=UNKNOWN_CITY)
+
+    assert len(prepare_enrichment([course])) == 2
+    assert (course.name, course.city) == (UNNAMED_COURSE, "Town")
+
+
+def test_migration_stores_job_coordinates_as_reals(database):
+    with db.get_db_connection() as conn:
+        conn.execute("DROP TABLE enrichment_jobs")
+        conn.execute("""
+            CREATE TABLE enrichment_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, lat_lon TEXT NOT NULL,
+                latitude TEXT NOT NULL, longitude TEXT NOT NULL, priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL, UNIQUE (kind, lat_lon)
+            )
+        """)
+        conn.execute(
+            "INSERT INTO enrichment_jobs (kind, lat_lon, latitude, longitude, priority, updated_at) "
+            "VALUES ('city', '40.10000, -75.10000', '40.1', '-75.1', 0, 0)"
+        )
+        conn.execute(f"PRAGMA user_version = {db.MIGRATIONS.index(db.store_job_coordinates_as_reals):d}")
+    db.migrate_database()
+
+    job = claim_job()
+    assert (job.latitude, job.longitude) == (40.1, -75.1)
+    assert db.fetch_one("SELECT typeof(latitude) FROM enrichment_jobs") == ("real",)
+    assert prepare_enrichment([Course("Named", 40.2, -75.2, city=UNKNOWN_CITY)]) == [job.id + 1]
+
+
+def test_jobs_queued_while_the_queue_is_checked_wake_the_worker(monkeypatch):
+    worker = EnrichmentWorker(concurrency=1, poll_interval=60)
+    claims = 0
+
+    async def run_in_db(func, *args):
+        return func(*args)
+
+    def claim_job():
+        nonlocal claims
+        claims += 1
+        if claims == 1:
+            # A search queues a job after the claim found none.
+            worker.wake()
+
+    monkeypatch.setattr(jobs, "run_in_db", run_in_db)
+    monkeypatch.setattr(jobs, "claim_job", claim_job)
+
+    async def main():
+        task = asyncio.ensure_future(worker.run())
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(main())
+    assert claims == 2
@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from app.applets.core.utils.limits import AdmissionLimiter, Overloaded, PriorityLimiter, ProviderLimiter
+
+
+def test_provider_calls_are_bounded_per_provider():
+    nominatim = ProviderLimiter("nominatim", concurrency=2)
+    overpass = ProviderLimiter("overpass", concurrency=1)
+    lock = threading.Lock()
+    running, peak = Counter(), Counter()
+
+    def call(provider):
+        with lock:
+            running[provider] += 1
+            peak[provider] = max(peak[provider], running[provider])
+            peak["all"] = max(peak["all"], running.total())
+        time.sleep(0.02)
+        with lock:
+            running[provider] -= 1
+
+    async def main():
+        await asyncio.gather(
+            *(nominatim.run(call, "nominatim") for _ in range(6)),
+            *(overpass.run(call, "overpass") for _ in range(3)),
+        )
+
+    asyncio.run(main())
+    assert peak == {"nominatim": 2, "overpass": 1, "all": 3}
+
+
+def test_provider_calls_are_spaced_by_the_minimum_interval():
+    limiter = ProviderLimiter("test", concurrency=3, min_interval=0.05)
+    starts = []
+
+    async def main():
+        await asyncio.gather(*(limiter.run(lambda: starts.append(time.monotonic())) for _ in range(3)))
+
+    asyncio.run(main())
+    starts.sort()
+    assert all(later - earlier >= 0.045 for earlier, later in itertools.pairwise(starts))
+
+
+def test_waiting_calls_are_served_by_priority():
+    limiter = PriorityLimiter("test", concurrency=1)
+    order = []
+
+    async def call(priority):
+        order.append(priority)
+        await asyncio.sleep(0.01)
+
+    async def main():
+        first = asyncio.ensure_future(limiter.run(0, call, "first"))
+        await asyncio.sleep(0)
+        await asyncio.gather(first, *(limiter.run(priority, call, priority) for priority in (5, 2, 9, 1)))
+
+    asyncio.run(main())
+    assert order == ["first", 1, 2, 5, 9]
+
+
+def test_cancelled_waiters_do_not_leak_slots():
+    limiter = PriorityLimiter("test", concurrency=1)
+
+    async def main():
+        blocker = asyncio.ensure_future(limiter.run(0, asyncio.sleep, 0.02))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(limiter.run(1, asyncio.sleep, 0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await blocker
+        return await asyncio.wait_for(limiter.run(2, asyncio.sleep, 0, "done"), 1)
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_waiting_clients_are_admitted_in_turn():
+    limiter = AdmissionLimiter("test", concurrency=1, queue_size=10, client_queue_size=10, timeout=1)
+    order = []
+
+    async def search(client, name):
+        await limiter.acquire(client)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release()
+
+    async def main():
+        searches = []
+        for client, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+            searches.append(asyncio.ensure_future(search(client, name)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*searches)
+
+    asyncio.run(main())
+    assert order == ["a1", "a2", "b1", "a3"]
+
+
+def test_requests_are_shed_when_the_queue_is_full_or_too_slow():
+    limiter = AdmissionLimiter("test", concurrency=1, queue_size=3, client_queue_size=1, timeout=0.05)
+
+    async def main():
+        await limiter.acquire("a")
+        waiting = []
+        for client in ("b", "c", "d"):
+            waiting.append(asyncio.ensure_future(limiter.acquire(client)))
+            await asyncio.sleep(0)
+            if client == "c":
+                with pytest.raises(Overloaded, match="client_queue_full"):
+                    await limiter.acquire("c")
+        with pytest.raises(Overloaded, match="test: queue_full"):
+            await limiter.acquire("e")
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire("e"), 1)
+        return [result.reason for result in results]
+
+    assert asyncio.run(main()) == ["timeout"] * 3
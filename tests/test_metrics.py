@@ -0,0 +1,35 @@
+import pytest
+
+from app.applets.core.utils.metrics import Counter, Histogram, upstream, upstream_calls, upstream_seconds
+
+
+def test_histograms_render_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "geocode")
+
+    assert histogram.render().splitlines() == [
+        "# HELP test_seconds Test.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="geocode",le="0.1"} 1',
+        'test_seconds_bucket{stage="geocode",le="1"} 3',
+        'test_seconds_bucket{stage="geocode",le="+Inf"} 4',
+        'test_seconds_sum{stage="geocode"} 4.05',
+        'test_seconds_count{stage="geocode"} 4',
+    ]
+
+
+def test_counters_escape_label_values():
+    counter = Counter("test_total", "Test.", ("cache", "result"))
+    counter.inc('a "b"\\', "hit", amount=2)
+
+    assert counter.render().splitlines()[-1] == 'test_total{cache="a \\"b\\"\\\\",result="hit"} 2'
+
+
+def test_failed_upstream_calls_are_counted_and_timed():
+    errors = upstream_calls.value("overpass", "test", "error")
+    with pytest.raises(TimeoutError), upstream("overpass", "test"):
+        raise TimeoutError
+
+    assert upstream_calls.value("overpass", "test", "error") == errors + 1
+    assert upstream_seconds.count("overpass", "test") >= 1
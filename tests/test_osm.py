@@ -0,0 +1,64 @@
+import json
+
+from app.applets.core.utils.osm import read_extract, resolve_courses, tiles_within
+from app.applets.core.utils.tiles import tile_bounds
+
+EXTRACT = """<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6">
+  <bounds minlat="39.0" minlon="-76.0" maxlat="41.0" maxlon="-73.0"/>
+  <node id="1" lat="40.0" lon="-75.0"/>
+  <node id="2" lat="40.01" lon="-75.0"/>
+  <node id="3" lat="40.01" lon="-74.99"/>
+  <node id="4" lat="40.5" lon="-74.5"/>
+  <node id="5" lat="40.51" lon="-74.49"/>
+  <node id="6" lat="40.03" lon="-74.99"><tag k="place" v="town"/><tag k="name" v="Springfield"/></node>
+  <node id="7" lat="40.503" lon="-74.495"><tag k="place" v="hamlet"/><tag k="name" v="Pine Hollow"/></node>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="1"/>
+    <tag k="leisure" v="golf_course"/><tag k="name" v="Way Golf Club"/>
+  </way>
+  <way id="11"><nd ref="4"/><nd ref="5"/></way>
+  <relation id="20"><member type="way" ref="11" role="outer"/><tag k="leisure" v="golf_course"/></relation>
+</osm>
+"""
+
+
+def test_xml_courses_are_located_and_resolved_offline(tmp_path):
+    path = tmp_path / "extract.osm"
+    path.write_text(EXTRACT)
+    extract = read_extract(path)
+
+    assert extract.bounds == (39.0, -76.0, 41.0, -73.0)
+    courses = {(course.name, float(course.lat), float(course.lon), course.city) for course in resolve_courses(extract)}
+    assert courses == {
+        ("Way Golf Club", 40.005, -74.995, "Springfield"),
+        ("Pine Hollow", 40.505, -74.495, "Unknown City"),
+    }
+
+
+def test_overpass_json_uses_reported_centers(tmp_path):
+    path = tmp_path / "export.json"
+    path.write_text(
+        json.dumps(
+            {
+                "elements": [
+                    {"type": "way", "id": 1, "center": {"lat": 40.5, "lon": -74.5}, "tags": {"leisure": "golf_course"}},
+                    {"type": "node", "id": 2, "lat": 40.51, "lon": -74.5, "tags": {"place": "village", "name": "Oaks"}},
+                ]
+            }
+        )
+    )
+
+    [course] = resolve_courses(read_extract(path))
+    assert (course.name, float(course.lat), course.city) == ("Golf_course", 40.5, "Oaks")
+
+
+def test_tiles_within_lie_inside_the_bounds():
+    bounds = (39.0, -76.0, 41.0, -73.0)
+    tiles = tiles_within(bounds, 9)
+
+    assert tiles
+    for tile in tiles:
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(tile)
+        assert bounds[0] <= min_lat <= max_lat <= bounds[2]
+        assert bounds[1] <= min_lon <= max_lon <= bounds[3]
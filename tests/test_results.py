@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.applets.core.schemas import Course, Player
+from app.applets.core.utils.db import upsert_courses
+from app.applets.core.utils.results import (
+    etag_matches,
+    page_etag,
+    read_results_token,
+    remembered,
+    result_key,
+    results_token,
+)
+from app.applets.core.utils.store import courses_within
+
+CENTER = (40.0, -75.0)
+RADIUS = 50_000
+
+
+def test_results_are_remembered_until_courses_around_them_change(database):
+    upsert_courses([Course("Near", 40.1, -75.0), Course("Nearer", 40.05, -75.0)])
+    players = [Player("a", "1 Main St", coord=(40.2, -75.0)), Player("b", "2 Main St", coord=(39.8, -75.0))]
+    searches = 0
+
+    async def search():
+        nonlocal searches
+        searches += 1
+        return courses_within(CENTER, RADIUS), []
+
+    def run(players):
+        return asyncio.run(remembered(result_key(players, RADIUS, 5), CENTER, RADIUS, search))
+
+    first = run(players)
+    assert run(players[::-1]) is first
+    assert searches == 1
+
+    # Courses far away do not touch the result; one moving into the radius does.
+    upsert_courses([Course("Far", 10.0, 10.0)])
+    assert run(players) is first
+    upsert_courses([Course("Closer", 40.0, -75.01)])
+    assert "Closer" in {course.name for course in run(players).courses}
+    assert searches == 2
+
+    # Nor does a search with other players share the result.
+    run([players[0]])
+    assert searches == 3
+
+
+def test_page_etags_follow_the_result_and_the_players(database):
+    courses = [Course("Near", 40.1, -75.0, id=1)]
+    players = [Player("a", "1 Main St", coord=(40.2, -75.0)), Player("b", "2 Main St", coord=(39.8, -75.0))]
+    result = asyncio.run(remembered(("test",), CENTER, RADIUS, lambda: asyncio.sleep(0, (courses, [7]))))
+    etag = page_etag(result, players)
+
+    assert etag == page_etag(result, list(players))
+    assert etag != page_etag(result, players[::-1])
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_results_tokens_carry_the_geocoded_players():
+    players = [Player("Ann", "1 Main St", coord=(40.2, -75.0)), Player("Bob", "Nowhere")]
+    read, limit = read_results_token(results_token(players, 5))
+
+    assert [(player.name, player.coord) for player in read] == [("Ann", (40.2, -75.0))]
+    assert limit == 5
+    for token in ("", "not a token", results_token([], None)):
+        with pytest.raises(ValueError, match="malformed"):
+            read_results_token(token)
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.applets.core.utils.singleflight import SingleFlight, normalize_address
+
+
+def test_concurrent_calls_share_one_lookup():
+    flights = SingleFlight()
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flights.do(("geocode", "x"), lookup) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flights.counters["geocode", "shared"] == 4
+
+
+def test_failures_are_shared_and_not_remembered():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    async def main():
+        results = await asyncio.gather(*(flights.do(("city", 1), fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        return await flights.do(("city", 1), lambda: asyncio.sleep(0, "ok"))
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_do_many_only_runs_keys_not_in_flight():
+    flights = SingleFlight()
+    batches = []
+
+    async def fetch(keys):
+        batches.append(sorted(keys))
+        await asyncio.sleep(0.01)
+        return {key: key * 10 for key in keys}
+
+    async def main():
+        return await asyncio.gather(flights.do_many("tiles", [1, 2], fetch), flights.do_many("tiles", [2, 3], fetch))
+
+    assert asyncio.run(main()) == [{1: 10, 2: 20}, {2: 20, 3: 30}]
+    assert batches == [[1, 2], [3]]
+
+
+def test_cancelled_caller_does_not_cancel_shared_lookup():
+    flights = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flights.do(("nearby", "k"), lookup))
+        second = asyncio.ensure_future(flights.do(("nearby", "k"), lookup))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_normalize_address():
+    assert normalize_address("  1 Main  St\n") == normalize_address("1 main st")
+
+
+def test_refresh_runs_in_the_background_and_is_joined():
+    flights = SingleFlight()
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "fresh"
+
+    async def main():
+        flights.refresh(("city", 1), lookup)
+        flights.refresh(("city", 1), lookup)
+        return await flights.do(("city", 1), lookup)
+
+    assert asyncio.run(main()) == "fresh"
+    assert len(calls) == 1
+    assert (flights.counters["city", "refresh"], flights.counters["city", "shared"]) == (1, 1)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.applets.core import db
+from app.applets.core.schemas import Course
+from app.applets.core.utils import store
+from app.applets.core.utils.db import delete_courses_at, upsert_courses
+from app.applets.core.utils.distance import METERS_PER_MILE, distance_matrix
+from app.applets.core.utils.store import CourseStore, Strings
+
+
+def rows(courses):
+    return sorted((course.id, course.name, course.lat, course.lon, course.city, course.access) for course in courses)
+
+
+def stored_within(center, radius):
+    with db.get_db_connection() as conn:
+        courses = [
+            Course(name, lat, lon, city=city, access=access, id=course_id)
+            for course_id, name, lat, lon, city, access in conn.execute(
+                "SELECT id, name, latitude, longitude, city, access FROM courses"
+            )
+        ]
+    distances = distance_matrix([center], [(course.lat, course.lon) for course in courses])[0]
+    return [course for course, miles in zip(courses, distances, strict=True) if miles * METERS_PER_MILE <= radius]
+
+
+def test_store_maps_its_snapshot_and_catches_up_on_changes(database):
+    upsert_courses(Course(f"Course {i}", 40 + i / 100, -75.0, city="Town" if i % 2 else None) for i in range(30))
+    course_store = store.get_course_store()
+    assert store.snapshot_path().exists()
+    assert not course_store._view.base.lat.flags.writeable
+
+    upsert_courses([Course("Renamed", 40.05, -75.0), Course("Added", 40.5, -75.5)])
+    delete_courses_at([(40.1, -75.0)])
+    center, radius = (40.1, -75.1), 30_000
+    assert store.get_course_store() is course_store
+    assert rows(store.courses_within(center, radius)) == rows(stored_within(center, radius))
+    assert "Renamed" in {course.name for course in store.courses_within(center, radius)}
+
+    # A fresh worker maps the same snapshot and replays the log.
+    other = CourseStore.from_snapshot(store.snapshot_path())
+    other.refresh()
+    assert rows(other.within(center, radius)) == rows(course_store.within(center, radius))
+    assert len(other) == len(course_store) == 30
+
+
+def test_strings_match_like_sqlite():
+    strings = Strings(*Strings.encode(["Pine Hills", "Ålesund GK", "hill"]))
+    strings.add("Hillside")
+
+    assert strings.containing("HILL").tolist() == [0, 2, 3]
+    assert strings.containing("s g").tolist() == []
+    assert strings.containing("lsh").tolist() == []
+    assert strings.containing("ålesund").tolist() == []
+    assert strings.containing("Ålesund").tolist() == [1]
+    assert [strings[i] for i in (np.int32(2), 3, store.NO_STRING)] == ["hill", "Hillside", None]
@@ -0,0 +1,88 @@
+import pickle
+import zlib
+from collections import OrderedDict
+from decimal import Decimal
+
+import msgspec
+import pytest
+
+from app.applets.core.schemas import Course
+from app.applets.core.utils.distance import METERS_PER_MILE, distance_matrix
+from app.applets.core.utils.tiles import (
+    FORMAT_DECIMAL_MSGPACK,
+    FORMAT_DECIMAL_MSGPACK_ZLIB,
+    FORMAT_MSGPACK,
+    FORMAT_MSGPACK_ZLIB,
+    covering_tiles,
+    decode_courses,
+    decode_pickled_courses,
+    encode_courses,
+    merge_tile_bounds,
+    settings,
+    tile_bounds,
+    tile_for,
+)
+
+
+def test_tile_bounds_contain_coordinate():
+    lat, lon = 40.7128, -74.0060
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(tile_for(lat, lon, 9))
+
+    assert min_lat <= lat <= max_lat
+    assert min_lon <= lon <= max_lon
+
+
+def test_covering_tiles_include_every_point_in_circle():
+    center, radius = (40.0, -75.0), 50_000
+    tiles = set(covering_tiles(center, radius, 10))
+    points = [(40.0 + i / 50, -75.0 + j / 40) for i in range(-30, 31) for j in range(-30, 31)]
+    distances = distance_matrix([center], points)[0] * METERS_PER_MILE
+
+    inside = [point for point, meters in zip(points, distances, strict=True) if meters <= radius]
+    assert inside
+    assert all(tile_for(*point, 10) in tiles for point in inside)
+
+
+def test_covering_tiles_across_antimeridian():
+    tiles = covering_tiles((-17.7, 179.9), 30_000, 9)
+
+    assert {x for _, x, _ in tiles} >= {0, 2**9 - 1}
+
+
+def test_merge_tile_bounds_merges_rows():
+    tiles = [(9, 10, 20), (9, 11, 20), (9, 12, 20), (9, 10, 21)]
+    boxes = merge_tile_bounds(tiles)
+
+    assert len(boxes) == 2
+    assert boxes[0] == (*tile_bounds((9, 10, 20))[:2], *tile_bounds((9, 12, 20))[2:])
+
+
+def test_course_blobs_round_trip_with_and_without_compression(monkeypatch):
+    courses = [Course(f"Course {i}", 40.1234567, -74.0, city="Springfield", id=i) for i in range(50)]
+    for min_size in (0, 1):
+        monkeypatch.setattr(settings.cache, "COMPRESS_MIN_SIZE", min_size)
+        blob = encode_courses(courses)
+        assert blob[0] == (FORMAT_MSGPACK_ZLIB if min_size else FORMAT_MSGPACK)
+        assert decode_courses(blob) == courses
+
+
+def test_unknown_or_corrupt_blobs_are_rejected():
+    for blob in (b"", b"\x80\x04", bytes((FORMAT_MSGPACK_ZLIB,)) + b"junk"):
+        with pytest.raises(ValueError, match=r"\w"):
+            decode_courses(blob)
+
+
+def test_legacy_decimal_blobs_decode_to_floats():
+    records = [["A", Decimal("40.1234567"), Decimal(-74), "X", None, 7]]
+    for blob in (
+        bytes((FORMAT_DECIMAL_MSGPACK,)) + msgspec.msgpack.encode(records),
+        bytes((FORMAT_DECIMAL_MSGPACK_ZLIB,)) + zlib.compress(msgspec.msgpack.encode(records)),
+    ):
+        assert decode_courses(blob) == [Course("A", 40.1234567, -74.0, city="X", id=7)]
+
+
+def test_legacy_pickles_only_decode_courses():
+    courses = [Course("A", Decimal("40.5"), Decimal("-74.5"), city="X")]
+    assert decode_pickled_courses(pickle.dumps(courses)) == [Course("A", 40.5, -74.5, city="X")]
+    with pytest.raises(pickle.UnpicklingError):
+        decode_pickled_courses(pickle.dumps([OrderedDict()]))
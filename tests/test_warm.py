@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.applets.core import db
+from app.applets.core.utils import geo, jobs
+from app.applets.core.utils.tiles import covering_tiles, tile_for
+from app.applets.core.utils.warm import area_tiles, warm_caches
+
+CENTER = (40.0, -75.0)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    queries, lookups = [], []
+    courses = [
+        SimpleNamespace(lat=40.01, lon=-75.01, tags={"leisure": "golf_course", "addr:city": "Springfield"}),
+        SimpleNamespace(lat=40.02, lon=-75.02, tags={"leisure": "golf_course", "name": "Pine Hills"}),
+    ]
+
+    def query_overpass_api(bounds):
+        queries.append(bounds)
+        return courses
+
+    async def resolve_city(lat, lon, coord_key):
+        lookups.append("city")
+        return await asyncio.to_thread(geo.store_city, lat, lon, coord_key, "Shelbyville")
+
+    def get_name_from_nearby_features(lat, lon):
+        lookups.append("name")
+        db.execute(
+            "INSERT INTO nearby_features_cache (lat_lon, name, cached_at) VALUES (?, ?, unixepoch())",
+            (geo.coordinate_key(lat, lon), "Near Springfield"),
+        )
+        return "Near Springfield"
+
+    monkeypatch.setattr(geo, "query_overpass_api", query_overpass_api)
+    monkeypatch.setattr(jobs, "resolve_city", resolve_city)
+    monkeypatch.setattr(jobs, "get_name_from_nearby_features", get_name_from_nearby_features)
+    return queries, lookups
+
+
+def test_area_tiles_cover_the_box_and_the_circles():
+    bbox = (39.5, -75.5, 40.5, -74.5)
+    tiles = area_tiles(bbox, [(45.0, -70.0)], 10_000)
+
+    assert len(tiles) == len(set(tiles))
+    assert {tile_for(lat, lon) for lat in (39.5, 40.5) for lon in (-75.5, -74.5)} <= set(tiles)
+    assert set(covering_tiles((45.0, -70.0), 10_000)) <= set(tiles)
+
+
+def test_warming_skips_what_is_cached(database, upstream):
+    queries, lookups = upstream
+    tiles = covering_tiles(CENTER, 20_000)
+
+    summary = asyncio.run(warm_caches(tiles, batch_size=2, concurrency=1))
+    assert (summary.fetched, summary.lookups) == (len(tiles), 2)
+    assert len(queries) == -(-len(tiles) // 2)
+    assert sorted(lookups) == ["city", "name"]
+
+    # A second run, as after an interruption, only does what is left.
+    summary = asyncio.run(warm_caches(tiles, batch_size=2, concurrency=1))
+    assert (summary.fetched, summary.lookups) == (0, 0)
+    assert len(lookups) == 2
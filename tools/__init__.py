@@ -0,0 +1 @@
+"""Development tools that are not part of the app."""
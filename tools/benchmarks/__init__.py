@@ -0,0 +1,4 @@
+"""Benchmarks of the search pipeline.
+
+Run the suite as ``python -m tools.benchmarks`` and a single benchmark as ``python -m tools.benchmarks.<name>``.
+"""
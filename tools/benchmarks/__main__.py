@@ -0,0 +1,22 @@
+"""Run the benchmark suite, see :mod:`tools.benchmarks.suite`.
+
+The stand-ins answer as fast as they are told to, so the politeness intervals kept with the real
+services are left out, and enrichment is left to an external worker so that ``/process`` measures
+the search alone. Set the variables to measure otherwise, e.g. ``GEO_ENRICHMENT_MODE=inline``.
+"""
+
+import os
+
+BENCHMARK_ENV = {
+    "GEO_ENRICHMENT_MODE": "external",
+    "GEO_NOMINATIM_MIN_INTERVAL": "0",
+    "GEO_OVERPASS_MIN_INTERVAL": "0",
+}
+"""Settings the suite runs with unless they are set in the environment."""
+
+for name, value in BENCHMARK_ENV.items():
+    os.environ.setdefault(name, value)
+
+from tools.benchmarks.suite import main  # noqa: E402
+
+main()
@@ -0,0 +1,214 @@
+"""Compare the coordinate work of a ``/process`` search with float and with Decimal coordinates.
+
+Runs the coordinate-heavy steps of a search on synthetic Overpass elements, once with the
+float coordinates the app uses and once with the Decimal coordinates it used before, and prints
+the time and peak allocations of each step::
+
+    python -m tools.benchmarks.coordinates --courses 2000 --players 4
+
+No network or database is involved; the Decimal variants are reproduced here.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+import zlib
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+import msgspec
+
+from app.applets.core.schemas import UNKNOWN_CITY, Course
+from app.applets.core.utils.distance import METERS_PER_MILE, distance_matrix, rank_courses
+from app.applets.core.utils.geo import (
+    coordinate_key,
+    course_from_element,
+    get_city_from_tags,
+    get_course_coordinates,
+    get_name_from_tags,
+)
+from app.applets.core.utils.tiles import COMPRESSION_LEVEL, decode_courses, encode_courses
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+settings = get_settings()
+
+CENTER = (40.0, -75.0)
+RADIUS = 160934
+
+
+class DecimalCourseRecord(msgspec.Struct, array_like=True, gc=False):
+    """The tile record of the Decimal era, which encoded coordinates as strings."""
+
+    name: str
+    lat: Decimal
+    lon: Decimal
+    city: str | None = None
+    access: str | None = None
+    id: int | None = None
+
+
+_encoder = msgspec.msgpack.Encoder()
+_decimal_decoder = msgspec.msgpack.Decoder(list[DecimalCourseRecord])
+
+
+def fake_elements(count: int, seed: int = 0) -> list[SimpleNamespace]:
+    """Build Overpass-like nodes around :data:`CENTER`; overpy parses their coordinates as Decimals."""
+    rng = random.Random(seed)  # noqa: S311
+    return [
+        SimpleNamespace(
+            lat=Decimal(f"{CENTER[0] + rng.uniform(-2, 2):.7f}"),
+            lon=Decimal(f"{CENTER[1] + rng.uniform(-2, 2):.7f}"),
+            tags={"leisure": "golf_course", "name": f"Course {i}", "addr:city": "Springfield"},
+        )
+        for i in range(count)
+    ]
+
+
+class Variant(NamedTuple):
+    """The coordinate-dependent steps of a search."""
+
+    build: Callable[[list[SimpleNamespace]], list[Course]]
+    """Build the courses of Overpass elements."""
+    round_trip: Callable[[list[Course]], list[Course]]
+    """Store courses in a tile blob and load them back."""
+    key: Callable[[Course], str]
+    """Get the enrichment cache key of a course."""
+
+
+FLOATS = Variant(
+    build=lambda elements: [course_from_element(e, *get_course_coordinates(e)) for e in elements],
+    round_trip=lambda courses: decode_courses(encode_courses(courses)),
+    key=lambda course: coordinate_key(course.lat, course.lon),
+)
+"""The steps as the app runs them."""
+
+
+def _decimal_course(element: SimpleNamespace, lat: Decimal, lon: Decimal) -> Course:
+    return Course(
+        name=get_name_from_tags(element.tags) or element.tags.get("leisure", "Unknown").capitalize(),
+        lat=Decimal(str(lat)),
+        lon=Decimal(str(lon)),
+        city=get_city_from_tags(element.tags) or UNKNOWN_CITY,
+        access=element.tags.get("access", "unknown"),
+    )
+
+
+def _decimal_coordinates(element: SimpleNamespace) -> tuple[Decimal, Decimal] | None:
+    if hasattr(element, "lat") and hasattr(element, "lon"):
+        return element.lat, element.lon
+    return None
+
+
+def _round_trip_decimal(courses: list[Course]) -> list[Course]:
+    payload = _encoder.encode([DecimalCourseRecord(c.name, c.lat, c.lon, c.city, c.access, c.id) for c in courses])
+    if 0 < settings.cache.COMPRESS_MIN_SIZE <= len(payload):
+        payload = zlib.decompress(zlib.compress(payload, COMPRESSION_LEVEL))
+    return [
+        Course(r.name, r.lat, r.lon, city=r.city, access=r.access, id=r.id) for r in _decimal_decoder.decode(payload)
+    ]
+
+
+DECIMALS = Variant(
+    build=lambda elements: [_decimal_course(e, *_decimal_coordinates(e)) for e in elements],
+    round_trip=_round_trip_decimal,
+    key=lambda course: f"{round(course.lat, 5)}, {round(course.lon, 5)}",
+)
+"""The steps with the Decimal coordinates and string-encoded tile records of the old schema."""
+
+
+def _radius_filter(courses: list[Course]) -> list[Course]:
+    distances = distance_matrix([CENTER], [(course.lat, course.lon) for course in courses])[0]
+    return [
+        course for course, miles in zip(courses, distances.tolist(), strict=True) if miles * METERS_PER_MILE <= RADIUS
+    ]
+
+
+def run(variant: Variant, elements: list[SimpleNamespace], players: int, *, trace: bool) -> dict[str, float]:
+    """Run the steps of a search in order and measure each of them.
+
+    Returns:
+        The seconds of every step, or with ``trace`` the peak bytes it allocated and the bytes retained
+        by the built courses.
+    """
+    user_coords = [(CENTER[0] + i / 10, CENTER[1] - i / 10) for i in range(players)]
+    names = [f"Player {i}" for i in range(players)]
+    top_k = settings.geo.ENRICHMENT_TOP_K
+    steps: dict[str, Callable[[Any], Any]] = {
+        "build": variant.build,
+        "tile round trip": variant.round_trip,
+        "radius filter": _radius_filter,
+        "rank": lambda courses: rank_courses(courses, user_coords, names),
+        "cache keys": lambda ranked: [variant.key(course) for course in ranked[:top_k]],
+    }
+    results: dict[str, float] = {}
+    # Outputs are kept until the end so that freeing one is not timed as part of the next step.
+    outputs: list[Any] = [elements]
+    gc.collect()
+    gc.disable()
+    if trace:
+        tracemalloc.start()
+    try:
+        for name, step in steps.items():
+            if trace:
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                outputs.append(step(outputs[-1]))
+                current, peak = tracemalloc.get_traced_memory()
+                results[name] = peak - before
+                if name == "build":
+                    results["retained"] = current - before
+            else:
+                start = time.perf_counter()
+                outputs.append(step(outputs[-1]))
+                results[name] = time.perf_counter() - start
+    finally:
+        if trace:
+            tracemalloc.stop()
+        gc.enable()
+    return results
+
+
+def measure(variant: Variant, elements: list[SimpleNamespace], players: int, repeat: int) -> dict[str, tuple]:
+    """Take the fastest of ``repeat`` timed runs and the allocations of one traced run.
+
+    Returns:
+        The ``(seconds, bytes)`` of every step.
+    """
+    runs = [run(variant, elements, players, trace=False) for _ in range(repeat)]
+    allocations = run(variant, elements, players, trace=True)
+    return {name: (min(r.get(name, 0.0) for r in runs), allocated) for name, allocated in allocations.items()}
+
+
+def main() -> None:
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=2000, help="Candidate courses per search.")
+    parser.add_argument("--players", type=int, default=4, help="Players per search.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per variant; the fastest is reported.")
+    args = parser.parse_args()
+
+    elements = fake_elements(args.courses)
+    decimal = measure(DECIMALS, elements, args.players, args.repeat)
+    floats = measure(FLOATS, elements, args.players, args.repeat)
+
+    print(f"{args.courses} courses, {args.players} players, best of {args.repeat}")  # noqa: T201
+    print(f"{'step':<16}{'decimal ms':>12}{'float ms':>10}{'decimal KiB':>13}{'float KiB':>11}")  # noqa: T201
+    for name in decimal:
+        (old_time, old_bytes), (new_time, new_bytes) = decimal[name], floats[name]
+        times = f"{'':>22}" if name == "retained" else f"{old_time * 1000:>12.2f}{new_time * 1000:>10.2f}"
+        print(f"{name:<16}{times}{old_bytes / 1024:>13.1f}{new_bytes / 1024:>11.1f}")  # noqa: T201
+    old_total = sum(seconds for seconds, _ in decimal.values())
+    new_total = sum(seconds for seconds, _ in floats.values())
+    print(f"{'total':<16}{old_total * 1000:>12.2f}{new_total * 1000:>10.2f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Deterministic local stand-ins for Nominatim and Overpass.
+
+Both answer from a :class:`World`: golf courses, towns and addresses that are either generated
+from a seed or loaded from a recorded Overpass response. They can sleep before answering, to
+model the latency of the real services, and count the calls they answer::
+
+    world = World.generate(courses=3000, seed=0)
+    with installed(world, nominatim_latency=0.05, overpass_latency=0.5):
+        ...
+
+The stand-ins are patched in where the app looks them up, :data:`geo.geolocator` and
+:class:`overpy.Overpass`, so the app code runs unchanged around them.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import math
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+import overpy
+
+from app.applets.core.utils import geo
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+__all__ = [
+    "FakeNominatim",
+    "FakeOverpass",
+    "World",
+    "installed",
+    "save_fixture",
+]
+
+CENTER = (40.0, -75.0)
+"""Center of the generated worlds."""
+SPREAD = 2.0
+"""Degrees of latitude and longitude that generated courses and addresses lie within, around :data:`CENTER`."""
+TOWN_GRID = 0.1
+"""Degrees of the square each generated town covers."""
+
+_BOX = re.compile(r'nwr\["leisure"="golf_course"\]\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\);')
+_AROUND = re.compile(r"around:\s*([\d.]+),\s*([-\d.]+),\s*([-\d.]+)")
+
+
+@dataclass
+class World:
+    """The places the stand-ins know about."""
+
+    nodes: list[SimpleNamespace]
+    """Golf courses mapped as nodes, with ``lat``/``lon`` like overpy nodes."""
+    ways: list[SimpleNamespace]
+    """Golf courses mapped as ways, with ``center_lat``/``center_lon`` like overpy ways."""
+    seed: int = 0
+    calls: Counter[str] = field(default_factory=Counter)
+    """Calls answered, by service."""
+
+    @classmethod
+    def generate(cls, courses: int, seed: int = 0) -> World:
+        """Generate courses around :data:`CENTER`.
+
+        A third of them have no name tag and a half no city tag, so that searches have courses to enrich.
+
+        Args:
+            courses: The number of courses.
+            seed: The seed of the generator.
+
+        Returns:
+            The world.
+        """
+        rng = random.Random(seed)  # noqa: S311
+        nodes, ways = [], []
+        for i in range(courses):
+            lat = Decimal(f"{CENTER[0] + rng.uniform(-SPREAD, SPREAD):.7f}")
+            lon = Decimal(f"{CENTER[1] + rng.uniform(-SPREAD, SPREAD):.7f}")
+            tags = {"leisure": "golf_course"}
+            if i % 3:
+                tags["name"] = f"Course {i}"
+            if i % 2:
+                tags["addr:city"] = _town(float(lat), float(lon))
+            if i % 4 == 0:
+                ways.append(SimpleNamespace(id=i, center_lat=lat, center_lon=lon, tags=tags))
+            else:
+                nodes.append(SimpleNamespace(id=i, lat=lat, lon=lon, tags=tags))
+        return cls(nodes, ways, seed)
+
+    @classmethod
+    def load(cls, path: Path, seed: int = 0) -> World:
+        """Load the courses of a recorded Overpass JSON response, as saved by ``[out:json]`` queries.
+
+        Args:
+            path: The recorded response.
+            seed: The seed of the generated addresses.
+
+        Returns:
+            The world.
+        """
+        result = overpy.Overpass().parse_json(path.read_bytes())
+        return cls(list(result.nodes), list(result.ways) + list(result.relations), seed)
+
+    @property
+    def courses(self) -> list[SimpleNamespace]:
+        """Every course element."""
+        return self.nodes + self.ways
+
+    def address(self, index: int) -> str:
+        """Get an address that :class:`FakeNominatim` places among the courses.
+
+        Args:
+            index: Any number; different numbers give different addresses.
+
+        Returns:
+            The address.
+        """
+        return f"{index} Main Street, seed {self.seed}"
+
+    def locate(self, address: str) -> tuple[float, float]:
+        """Get the coordinate of an address, which is a stable function of its text.
+
+        Args:
+            address: The address.
+
+        Returns:
+            A coordinate around :data:`CENTER`.
+        """
+        rng = random.Random(zlib.crc32(address.encode()))  # noqa: S311
+        spread = SPREAD / 2
+        return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+
+
+def _town(lat: float, lon: float) -> str:
+    return f"Town {math.floor(lat / TOWN_GRID)}:{math.floor(lon / TOWN_GRID)}"
+
+
+def _result(nodes: list | None = None, ways: list | None = None, relations: list | None = None) -> SimpleNamespace:
+    return SimpleNamespace(nodes=nodes or [], ways=ways or [], relations=relations or [])
+
+
+def _position(element: SimpleNamespace) -> tuple[float, float]:
+    if hasattr(element, "lat"):
+        return float(element.lat), float(element.lon)
+    return float(element.center_lat), float(element.center_lon)
+
+
+class FakeNominatim:
+    """Stand-in for :class:`geopy.geocoders.Nominatim`."""
+
+    def __init__(self, world: World, latency: float = 0.0) -> None:
+        """Answer from a world.
+
+        Args:
+            world: The world to answer from.
+            latency: Seconds to sleep before every answer.
+        """
+        self.world = world
+        self.latency = latency
+
+    def geocode(self, query: str) -> SimpleNamespace:
+        """Geocode an address; every address is found.
+
+        Returns:
+            A location with ``latitude`` and ``longitude``.
+        """
+        self._answer()
+        lat, lon = self.world.locate(query)
+        return SimpleNamespace(latitude=lat, longitude=lon, raw={})
+
+    def reverse(self, query: tuple[float, float], *, exactly_one: bool = True) -> SimpleNamespace:
+        """Reverse geocode a coordinate to the town it lies in.
+
+        Returns:
+            A location whose ``raw`` address has a ``town``.
+        """
+        self._answer()
+        return SimpleNamespace(raw={"address": {"town": _town(*query)}})
+
+    def _answer(self) -> None:
+        self.world.calls["nominatim"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeOverpass:
+    """Stand-in for :class:`overpy.Overpass`, which understands the queries the app sends."""
+
+    def __init__(self, world: World, latency: float = 0.0) -> None:
+        """Answer from a world.
+
+        Args:
+            world: The world to answer from.
+            latency: Seconds to sleep before every answer.
+        """
+        self.world = world
+        self.latency = latency
+
+    def query(self, query: str) -> SimpleNamespace:
+        """Answer a golf course, enclosing boundary or nearby place query.
+
+        Returns:
+            A result with ``nodes``, ``ways`` and ``relations``.
+
+        Raises:
+            ValueError: If the query is not one the app sends.
+        """
+        self.world.calls["overpass"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if boxes := [tuple(map(float, match)) for match in _BOX.findall(query)]:
+            found = [
+                element
+                for element in self.world.courses
+                if any(
+                    min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+                    for lat, lon in [_position(element)]
+                    for min_lat, min_lon, max_lat, max_lon in boxes
+                )
+            ]
+            return _result(
+                nodes=[e for e in found if hasattr(e, "lat")], ways=[e for e in found if not hasattr(e, "lat")]
+            )
+        if match := _AROUND.search(query):
+            _, lat, lon = map(float, match.groups())
+            if '"boundary"="administrative"' in query:
+                return _result(relations=[SimpleNamespace(tags={"admin_level": "8", "name": _town(lat, lon)})])
+            if "place~" in query:
+                return _result(nodes=[SimpleNamespace(tags={"place": "locality", "name": f"Near {_town(lat, lon)}"})])
+        msg = f"Unexpected Overpass query: {query}"
+        raise ValueError(msg)
+
+
+@contextlib.contextmanager
+def installed(world: World, *, nominatim_latency: float = 0.0, overpass_latency: float = 0.0) -> Iterator[World]:
+    """Answer the app's Nominatim and Overpass calls from a world while in the block.
+
+    Args:
+        world: The world to answer from.
+        nominatim_latency: Seconds every Nominatim call takes.
+        overpass_latency: Seconds every Overpass query takes.
+
+    Yields:
+        The world, whose ``calls`` count the calls answered.
+    """
+    saved = geo.geolocator, overpy.Overpass
+    overpass = FakeOverpass(world, overpass_latency)
+    geo.geolocator = FakeNominatim(world, nominatim_latency)
+    overpy.Overpass = lambda *_args, **_kwargs: overpass
+    try:
+        yield world
+    finally:
+        geo.geolocator, overpy.Overpass = saved
+
+
+def save_fixture(world: World, path: Path) -> None:
+    """Record the courses of a world as an Overpass JSON response that :meth:`World.load` reads.
+
+    Args:
+        world: The world.
+        path: Where to write the response.
+    """
+    elements = [
+        {"type": "node", "id": node.id, "lat": float(node.lat), "lon": float(node.lon), "tags": node.tags}
+        for node in world.nodes
+    ] + [
+        {
+            "type": "way",
+            "id": way.id,
+            "center": {"lat": float(way.center_lat), "lon": float(way.center_lon)},
+            "nodes": [],
+            "tags": way.tags,
+        }
+        for way in world.ways
+    ]
+    path.write_text(json.dumps({"version": 0.6, "elements": elements}))
@@ -0,0 +1,322 @@
+"""Benchmark suite of the search pipeline, with Nominatim and Overpass stood in for locally.
+
+Measures ``/process`` end to end with cold, database-only and warm caches, :func:`find_best_courses`
+over a grid of players and courses, and the database lookups of a search, and writes the results as
+JSON. A run can be compared to an earlier one to catch regressions::
+
+    python -m tools.benchmarks --output baseline.json
+    python -m tools.benchmarks --compare baseline.json --tolerance 0.2
+
+Use ``python -m tools.benchmarks`` rather than this module, so that the app is configured for
+benchmarking before it is imported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import msgspec
+from litestar.testing import TestClient
+from tools.benchmarks.fakes import CENTER, SPREAD, World, installed
+
+from app.applets.core import db
+from app.applets.core.schemas import Course
+from app.applets.core.utils import cache
+from app.applets.core.utils.geo import SEARCH_RADIUS, find_best_courses
+from app.applets.core.utils.players import calculate_center_coordinates, probe_players
+from app.applets.core.utils.store import courses_within, list_courses
+from app.applets.core.utils.tiles import covering_tiles, stale_tiles
+from app.asgi import app
+from app.config.settings import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+settings = get_settings()
+
+
+class Result(msgspec.Struct, kw_only=True):
+    """The timings of one benchmark, in milliseconds."""
+
+    name: str
+    params: dict[str, Any] = {}
+    runs: int
+    min: float
+    median: float
+    p95: float
+    mean: float
+    max: float
+    calls: dict[str, float] = {}
+    """Upstream calls per run, by service."""
+
+    @property
+    def key(self) -> str:
+        """Identify the benchmark across reports."""
+        return f"{self.name}{msgspec.json.encode(self.params, order='sorted').decode()}"
+
+
+class Report(msgspec.Struct):
+    """A run of the suite."""
+
+    meta: dict[str, Any]
+    results: list[Result]
+
+
+def _summarize(name: str, params: dict[str, Any], samples: list[float], calls: Counter[str]) -> Result:
+    ordered = sorted(seconds * 1000 for seconds in samples)
+    return Result(
+        name=name,
+        params=params,
+        runs=len(ordered),
+        min=round(ordered[0], 4),
+        median=round(statistics.median(ordered), 4),
+        p95=round(ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)], 4),
+        mean=round(statistics.fmean(ordered), 4),
+        max=round(ordered[-1], 4),
+        calls={service: count / len(ordered) for service, count in sorted(calls.items())},
+    )
+
+
+class Suite:
+    """Runs benchmarks against a world and collects their results."""
+
+    def __init__(self, world: World, directory: Path, players: int) -> None:
+        """Benchmark searches of players among the courses of a world.
+
+        Args:
+            world: The world the stand-ins answer from.
+            directory: Where to create databases.
+            players: Players per ``/process`` request.
+        """
+        self.world = world
+        self.directory = directory
+        self.addresses = [world.address(i) for i in range(players)]
+        self.form = {}
+        for i, address in enumerate(self.addresses, start=1):
+            self.form[f"name{i}"] = f"Player {i}"
+            self.form[f"address{i}"] = address
+        self.results: list[Result] = []
+        self._databases = 0
+
+    def measure(
+        self,
+        name: str,
+        func: Callable[[], object],
+        *,
+        runs: int,
+        params: dict[str, Any] | None = None,
+        setup: Callable[[], object] | None = None,
+    ) -> Result:
+        """Time ``runs`` calls of a function; ``setup`` runs before each of them, untimed.
+
+        Returns:
+            The result, which is also collected.
+        """
+        samples: list[float] = []
+        calls: Counter[str] = Counter()
+        for _ in range(runs):
+            if setup is not None:
+                setup()
+            before = self.world.calls.copy()
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+            calls += self.world.calls - before
+        result = _summarize(name, params or {}, samples, calls)
+        self.results.append(result)
+        return result
+
+    def new_database(self) -> None:
+        """Switch the app to an empty database, with empty memory caches."""
+        self._databases += 1
+        db.DATABASE_FILE = str(self.directory / f"bench-{self._databases}.db")
+        db.initialize_database(None)
+        clear_memory_caches()
+
+    def process(self, client: TestClient, runs: int) -> None:
+        """Benchmark ``/process`` with cold, database-only and warm caches."""
+
+        def post() -> None:
+            response = client.post("/process", data=self.form)
+            response.raise_for_status()
+
+        params = {"players": len(self.addresses)}
+        self.measure("process", post, runs=runs, params={**params, "cache": "cold"}, setup=self.new_database)
+        self.measure("process", post, runs=runs, params={**params, "cache": "db"}, setup=clear_memory_caches)
+        self.measure("process", post, runs=runs, params={**params, "cache": "warm"})
+
+    def ranking(self, players: list[int], courses: list[int], runs: int, seed: int) -> None:
+        """Benchmark :func:`find_best_courses` over every number of players and of courses."""
+        rng = random.Random(seed)  # noqa: S311
+        pool = [
+            Course(
+                f"Course {i}",
+                CENTER[0] + rng.uniform(-SPREAD, SPREAD),
+                CENTER[1] + rng.uniform(-SPREAD, SPREAD),
+                city="Springfield",
+            )
+            for i in range(max(courses))
+        ]
+        for player_count in players:
+            user_coords = [self.world.locate(self.world.address(i)) for i in range(player_count)]
+            names = [f"Player {i}" for i in range(player_count)]
+            for course_count in courses:
+                for limit in (None, settings.geo.ENRICHMENT_TOP_K):
+                    self.measure(
+                        "find_best_courses",
+                        lambda c=pool[:course_count], u=user_coords, n=names, k=limit: find_best_courses(c, u, n, k),
+                        runs=runs,
+                        params={"players": player_count, "courses": course_count, "limit": limit},
+                    )
+
+    def lookups(self, runs: int) -> None:
+        """Benchmark the database lookups of a search, in the database ``/process`` left behind."""
+        address = self.addresses[0]
+        center = calculate_center_coordinates([self.world.locate(other) for other in self.addresses])
+        tiles = covering_tiles(center, SEARCH_RADIUS)
+        for tier, setup in (("db", clear_memory_caches), ("memory", None)):
+            self.measure(
+                "probe_players",
+                lambda: probe_players([(None, "Player", address)]),
+                runs=runs,
+                params={"tier": tier},
+                setup=setup,
+            )
+            self.measure(
+                "stale_tiles",
+                lambda: stale_tiles(tiles),
+                runs=runs,
+                params={"tier": tier, "tiles": len(tiles)},
+                setup=setup,
+            )
+        self.measure("courses_within", lambda: courses_within(center, SEARCH_RADIUS), runs=runs)
+        self.measure("list_courses", lambda: list_courses(limit=100), runs=runs, params={"limit": 100})
+        self.measure(
+            "list_courses",
+            lambda: list_courses(limit=100, name="course 1"),
+            runs=runs,
+            params={"limit": 100, "name": "course 1"},
+        )
+
+
+def clear_memory_caches() -> None:
+    """Empty every memory tier, leaving the database caches."""
+    for memory in cache.memory_caches.values():
+        memory.clear()
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Report, baseline: Report, tolerance: float) -> list[str]:
+    """Find the benchmarks whose median got slower than in a baseline by more than a tolerance.
+
+    Args:
+        report: The current run.
+        baseline: The run to compare to.
+        tolerance: The allowed slowdown, as a fraction of the baseline median.
+
+    Returns:
+        A line describing every regression.
+    """
+    before = {result.key: result for result in baseline.results}
+    return [
+        f"{result.key}: median {old.median:.3f} ms -> {result.median:.3f} ms"
+        for result in report.results
+        if (old := before.get(result.key)) is not None and result.median > old.median * (1 + tolerance)
+    ]
+
+
+def _numbers(text: str) -> list[int]:
+    return [int(number) for number in text.split(",")]
+
+
+def main() -> None:
+    """Run the suite, write its report and compare it to a baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=3000, help="Courses in the generated world.")
+    parser.add_argument("--fixture", type=Path, help="Recorded Overpass JSON response to use as the world instead.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated world.")
+    parser.add_argument("--players", type=int, default=4, help="Players per /process request.")
+    parser.add_argument("--nominatim-latency", type=float, default=0.0, help="Seconds every Nominatim call takes.")
+    parser.add_argument("--overpass-latency", type=float, default=0.0, help="Seconds every Overpass query takes.")
+    parser.add_argument("--runs", type=int, default=5, help="Timed /process requests per cache state.")
+    parser.add_argument("--micro-runs", type=int, default=200, help="Timed calls per lookup and ranking benchmark.")
+    parser.add_argument("--rank-players", type=_numbers, default=[2, 4, 8], help="Comma-separated player counts.")
+    parser.add_argument(
+        "--rank-courses", type=_numbers, default=[100, 1000, 10000], help="Comma-separated course counts."
+    )
+    parser.add_argument("--output", type=Path, help="Where to write the JSON report; stdout by default.")
+    parser.add_argument("--compare", type=Path, help="JSON report of an earlier run to compare to.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown of a median, as a fraction.")
+    args = parser.parse_args()
+
+    world = World.load(args.fixture, args.seed) if args.fixture else World.generate(args.courses, args.seed)
+    database = db.DATABASE_FILE
+    # The app logs to stdout, which is kept for the report.
+    with (
+        contextlib.redirect_stdout(sys.stderr),
+        tempfile.TemporaryDirectory() as directory,
+        installed(world, nominatim_latency=args.nominatim_latency, overpass_latency=args.overpass_latency),
+    ):
+        suite = Suite(world, Path(directory), args.players)
+        suite.new_database()
+        try:
+            with TestClient(app) as client:
+                suite.process(client, args.runs)
+            suite.lookups(args.micro_runs)
+            suite.ranking(args.rank_players, args.rank_courses, max(1, args.micro_runs // 20), args.seed)
+        finally:
+            db.DATABASE_FILE = database
+
+    report = Report(
+        meta={
+            "created": datetime.now(UTC).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "world": {"fixture": str(args.fixture) if args.fixture else None, "courses": len(world.courses)},
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+            "settings": {
+                "ENRICHMENT_MODE": settings.geo.ENRICHMENT_MODE,
+                "DISTANCE_MODE": settings.geo.DISTANCE_MODE,
+                "NOMINATIM_MIN_INTERVAL": settings.geo.NOMINATIM_MIN_INTERVAL,
+                "OVERPASS_MIN_INTERVAL": settings.geo.OVERPASS_MIN_INTERVAL,
+            },
+        },
+        results=suite.results,
+    )
+    encoded = msgspec.json.format(msgspec.json.encode(report)) + b"\n"
+    if args.output:
+        args.output.write_bytes(encoded)
+    else:
+        sys.stdout.buffer.write(encoded)
+
+    if args.compare:
+        regressions = compare(report, msgspec.json.decode(args.compare.read_bytes(), type=Report), args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)  # noqa: T201
+        if regressions:
+            sys.exit(1)